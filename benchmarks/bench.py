@@ -0,0 +1,349 @@
+"""
+Throughput benchmarks of ingest and enrichment steps run on synthetic data.
+Results are appended to a JSON lines file and each run is compared with
+the previous result of the same benchmark at the same scale.
+
+Usage:
+    python -m benchmarks.bench --rows 10000
+    python -m benchmarks.bench --rows 1000000 --only read_report norm_ocns
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+import pandas as pd
+
+from benchmarks import generators
+
+RESULTS_FH = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+# benchmark name -> setup function returning the callable to time;
+# the callable returns number of processed rows
+BENCHMARKS: dict[str, Callable[[str, int, int], Callable[[], int]]] = {}
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised by setup of a benchmark that cannot run in this environment
+    """
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _input(work_dir: str, rows: int, name: str, write: Callable[[str], str]) -> str:
+    # generated inputs are reused by repeats and later runs of the same scale
+    out_dir = os.path.join(work_dir, f"{name}-{rows}")
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        return os.path.join(out_dir, os.listdir(out_dir)[0])
+    os.makedirs(out_dir, exist_ok=True)
+    return write(out_dir)
+
+
+def _nyp_db(work_dir: str) -> str:
+    from src.nyp_datastore import Base, get_engine
+
+    fd, db = tempfile.mkstemp(suffix=".db", dir=work_dir)
+    os.close(fd)
+    engine = get_engine(db)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return db
+
+
+@benchmark("read_report")
+def setup_read_report(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import read_report
+
+    fh = _input(
+        work_dir, rows, "report", lambda d: generators.write_report(d, rows, seed)
+    )
+    db = _nyp_db(work_dir)
+    return lambda: read_report(fh, db=db)
+
+
+@benchmark("read_sierra_export")
+def setup_read_sierra_export(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import read_sierra_export
+
+    fh = _input(
+        work_dir,
+        rows,
+        "sierra-export",
+        lambda d: generators.write_sierra_export(d, rows, seed),
+    )
+    db = _nyp_db(work_dir)
+    return lambda: read_sierra_export(fh, db=db)
+
+
+@benchmark("read_deletions")
+def setup_read_deletions(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import read_deletions
+
+    fh = _input(
+        work_dir, rows, "deletions", lambda d: generators.write_deletions(d, rows, seed)
+    )
+    db = _nyp_db(work_dir)
+
+    def run():
+        read_deletions(fh, db=db)
+        return rows
+
+    return run
+
+
+@benchmark("parse_sierra_bib")
+def setup_parse_sierra_bib(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    try:
+        from src.bpl_ingest import parse_sierra_bib
+    except ImportError as exc:
+        raise SkipBenchmark(str(exc))
+    from src.bpl_datastore import Base, EnhancedBib
+    from src.db_access import bulk_upsert, create_sqlite_engine, session_scope
+
+    rnd = generators.random.Random(seed)
+    bibNos = [
+        int(record["907"]["a"][2:-1])
+        for record in generators.marc_records(rows, seed, sierra=True)
+    ]
+    fh = _input(
+        work_dir, rows, "bpl-marc", lambda d: generators.write_marc(d, rows, seed)
+    )
+    fd, db = tempfile.mkstemp(suffix=".db", dir=work_dir)
+    os.close(fd)
+    engine = create_sqlite_engine(db)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    with session_scope(db, profile="bulk-load") as session:
+        bulk_upsert(
+            session,
+            EnhancedBib,
+            (dict(bibNo=bibNo, oclcNo=generators.random_ocn(rnd)) for bibNo in bibNos),
+        )
+    not_found_fh = os.path.join(work_dir, "not-found.csv")
+    return lambda: parse_sierra_bib(fh, not_found_fh, db=db)
+
+
+def _column(work_dir: str, rows: int, seed: int, column: int) -> pd.Series:
+    fh = _input(
+        work_dir,
+        rows,
+        "sierra-export",
+        lambda d: generators.write_sierra_export(d, rows, seed),
+    )
+    frame = pd.read_csv(
+        fh, sep="^", header=0, dtype=str, keep_default_na=False, quoting=0
+    )
+    return frame.iloc[:, column]
+
+
+@benchmark("norm_ocn")
+def setup_norm_ocn(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import norm_ocn
+
+    values = _column(work_dir, rows, seed, 2).tolist()
+    return lambda: len([norm_ocn(value) for value in values])
+
+
+@benchmark("norm_ocns")
+def setup_norm_ocns(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import norm_ocns
+
+    values = _column(work_dir, rows, seed, 2)
+    return lambda: len(norm_ocns(values))
+
+
+@benchmark("norm_title")
+def setup_norm_title(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import norm_title
+
+    values = _column(work_dir, rows, seed, 1).tolist()
+    return lambda: len([norm_title(value) for value in values])
+
+
+@benchmark("norm_titles")
+def setup_norm_titles(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    from src.nyp_ingest import norm_titles
+
+    values = _column(work_dir, rows, seed, 1)
+    return lambda: len(norm_titles(values))
+
+
+@benchmark("manipulate_bib")
+def setup_manipulate_bib(work_dir: str, rows: int, seed: int) -> Callable[[], int]:
+    try:
+        from bookops_marc.bib import pymarc_record_to_local_bib
+        from src.enhance import manipulate_bib
+    except ImportError as exc:
+        raise SkipBenchmark(str(exc))
+    from src.utils import fields2str
+
+    local = generators.marc_records(rows, seed, sierra=True)
+    worldcat = generators.marc_records(rows, seed + 1, sierra=False)
+    jobs = [
+        (
+            pymarc_record_to_local_bib(record, "BPL"),
+            local_record["907"]["a"][2:-1],
+            fields2str(local_record.get_fields("020")),
+        )
+        for local_record, record in zip(local, worldcat)
+    ]
+
+    def run():
+        for bib, bibNo, isbns in jobs:
+            manipulate_bib(bib, bibNo, "BPL", "a", "-", isbns)
+        return len(jobs)
+
+    return run
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def previous_results(results_fh: str) -> dict[tuple[str, int], dict]:
+    """
+    Returns the last recorded result of each benchmark and scale
+
+    Args:
+        results_fh:         path to JSON lines file with results
+    """
+    previous = {}
+    if not os.path.isfile(results_fh):
+        return previous
+    with open(results_fh, "r") as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                previous[(result["benchmark"], result["rows"])] = result
+    return previous
+
+
+def run_benchmark(
+    name: str, work_dir: str, rows: int, seed: int = 0, repeat: int = 3
+) -> Optional[dict]:
+    """
+    Runs benchmark and returns its result; the best of repeated runs
+    is reported. Setup, including generation of input files, is not timed.
+
+    Args:
+        name:               name of benchmark, see `BENCHMARKS`
+        work_dir:           directory for generated files and databases
+        rows:               number of generated rows
+        seed:               random seed of generated data
+        repeat:             number of timed runs
+
+    Returns:
+        result dictionary or None if benchmark was skipped
+    """
+    timings = []
+    for _ in range(repeat):
+        try:
+            run = BENCHMARKS[name](work_dir, rows, seed)
+        except SkipBenchmark as exc:
+            print(f"{name}: skipped ({exc})")
+            return None
+        start = time.perf_counter()
+        n = run()
+        timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    return dict(
+        benchmark=name,
+        rows=n,
+        seconds=round(seconds, 4),
+        rate=round(n / seconds, 1) if seconds else None,
+        seed=seed,
+        commit=git_commit(),
+        python=platform.python_version(),
+        timestamp=f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+    )
+
+
+def main(args: list) -> int:
+    parser = argparse.ArgumentParser(
+        prog="benchmarks.bench",
+        description="Measures throughput of ingest steps on synthetic data.",
+    )
+    parser.add_argument(
+        "--rows", help="number of generated rows", type=int, default=10000
+    )
+    parser.add_argument("--seed", help="random seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat", help="number of timed runs of each benchmark", type=int, default=3
+    )
+    parser.add_argument(
+        "--only", help="benchmarks to run", nargs="+", choices=list(BENCHMARKS)
+    )
+    parser.add_argument(
+        "--results", help="JSON lines file of recorded results", default=RESULTS_FH
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="directory for generated inputs, reused between runs",
+        default=None,
+    )
+    parser.add_argument(
+        "--tolerance",
+        help="fraction of throughput drop reported as regression",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--no-record", help="does not append results", action="store_true"
+    )
+    pargs = parser.parse_args(args)
+
+    previous = previous_results(pargs.results)
+    regressions = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = pargs.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        for name in pargs.only or BENCHMARKS:
+            result = run_benchmark(name, work_dir, pargs.rows, pargs.seed, pargs.repeat)
+            if result is None:
+                continue
+            line = (
+                f"{name}: {result['rows']} rows in {result['seconds']} sec "
+                f"({result['rate']:.0f} rows/sec)"
+            )
+            before = previous.get((name, result["rows"]))
+            if before is not None and before["rate"]:
+                change = result["rate"] / before["rate"] - 1
+                line += f", {change:+.1%} vs {before['commit']}"
+                if change < -pargs.tolerance:
+                    line += " REGRESSION"
+                    regressions.append(name)
+            print(line)
+            if not pargs.no_record:
+                with open(pargs.results, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+    if regressions:
+        print(f"Throughput regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
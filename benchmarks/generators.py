@@ -0,0 +1,321 @@
+"""
+Seeded generators of synthetic input files shaped like OCLC reports and
+Sierra exports. The same seed and size always produce the same files.
+"""
+import csv
+from datetime import date
+import os
+import random
+from typing import Iterator
+
+from pymarc import Field, MARCWriter, Record
+
+STATUSES = [
+    ("match", 0.94),
+    ("create", 0.025),
+    ("unresolved", 0.03),
+    ("data error", 0.0001),
+    ("processing error", 0.0049),
+]
+
+WORDS = (
+    "the of and a to in history new york city art music life world war "
+    "american library public research collection guide story journal "
+    "introduction poems letters selected works papers annual report study "
+    "theory practice science society culture early modern century volume "
+    "edition handbook essays children family press university state law"
+).split()
+
+
+def sierra_check_digit(bibNo: int) -> str:
+    """
+    Calculates Sierra check digit of a record number
+    """
+    total = sum(
+        int(digit) * weight for weight, digit in enumerate(reversed(str(bibNo)), 2)
+    )
+    remainder = total % 11
+    return "x" if remainder == 10 else str(remainder)
+
+
+def bib_numbers(n: int, rnd: random.Random) -> Iterator[int]:
+    """
+    Generator. Unique ascending 8 digit Sierra bib numbers with random gaps,
+    as in a Sierra list
+    """
+    bibNo = 10000000
+    for _ in range(n):
+        bibNo += rnd.randint(1, 8)
+        yield bibNo
+
+
+def random_ocn(rnd: random.Random) -> int:
+    # most OCNs are older and shorter ones
+    return int(rnd.paretovariate(0.6) * 1000) % 1500000000 + 1
+
+
+def format_ocn(ocn: int, rnd: random.Random) -> str:
+    """
+    Formats OCN the way it appears in MARC records and OCLC reports
+    """
+    style = rnd.random()
+    if style < 0.5:
+        if ocn < 100000000:
+            return f"ocm{ocn:08d}"
+        elif ocn < 1000000000:
+            return f"ocn{ocn:09d}"
+        return f"on{ocn}"
+    elif style < 0.8:
+        return f"(OCoLC){ocn}"
+    return str(ocn)
+
+
+def random_title(rnd: random.Random) -> str:
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(1, 8))]
+    title = " ".join(words).capitalize()
+    if rnd.random() < 0.4:
+        title += rnd.choice([" :", " /", ".", ",", ";"])
+    if rnd.random() < 0.1:
+        title = f'"{title}"'
+    return title
+
+
+def report_name(procDate: date, ocn_process: bool = False, seq: int = 1) -> str:
+    """
+    Returns BibProcessingReport file name following OCLC's convention,
+    so `get_file_date` and `is_ocn_process` work on it
+    """
+    process = "OCNs." if ocn_process else ""
+    stamp = f"{procDate:%Y%m%d}"
+    return (
+        f"NYP-NYP.1042671.IN.BIB.D{stamp}.T101322131.1042671.NYP.{stamp}."
+        f"StreamlinedHoldings.{process}file{seq}.mrc.BibProcessingReport.txt"
+    )
+
+
+def report_rows(n: int, seed: int = 0) -> Iterator[list[str]]:
+    """
+    Generator. Rows of BibProcessingReport
+
+    Args:
+        n:                  number of rows
+        seed:               random seed
+    """
+    rnd = random.Random(seed)
+    statuses, weights = zip(*STATUSES)
+    for bibNo in bib_numbers(n, rnd):
+        status = rnd.choices(statuses, weights)[0]
+        control_no = random_ocn(rnd)
+        ocn = control_no if rnd.random() < 0.8 else random_ocn(rnd)
+        if status == "data error":
+            yield ["", "", "", "", status]
+        else:
+            yield [
+                "",
+                f".b{bibNo}{sierra_check_digit(bibNo)}",
+                format_ocn(control_no, rnd) if rnd.random() < 0.9 else "",
+                str(ocn),
+                status,
+            ]
+
+
+def write_report(
+    out_dir: str,
+    n: int,
+    seed: int = 0,
+    procDate: date = date(2022, 8, 3),
+    ocn_process: bool = False,
+) -> str:
+    """
+    Writes pipe delimited BibProcessingReport
+
+    Args:
+        out_dir:            directory of the report
+        n:                  number of rows
+        seed:               random seed
+        procDate:           date of the report
+        ocn_process:        creates report of OCN matching process
+
+    Returns:
+        path to the report
+    """
+    fh = os.path.join(out_dir, report_name(procDate, ocn_process, seed))
+    with open(fh, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="|", lineterminator="\n")
+        writer.writerows(report_rows(n, seed))
+    return fh
+
+
+def sierra_export_rows(n: int, seed: int = 0) -> Iterator[list[str]]:
+    """
+    Generator. Rows of Sierra export of bibs, see `read_sierra_export`
+    for export configuration
+
+    Args:
+        n:                  number of rows
+        seed:               random seed
+    """
+    rnd = random.Random(seed)
+    for bibNo in bib_numbers(n, rnd):
+        ocn = random_ocn(rnd)
+        control_no = format_ocn(ocn, rnd) if rnd.random() < 0.7 else ""
+        other_nos = [f"(OCoLC){ocn}"] if rnd.random() < 0.6 else []
+        if rnd.random() < 0.2:
+            other_nos.append(f"(WaOLN)nyp{rnd.randint(1, 9999999):07d}")
+        uncertain_nos = [str(random_ocn(rnd))] if rnd.random() < 0.05 else []
+        yield [
+            f"b{bibNo}{sierra_check_digit(bibNo)}",
+            random_title(rnd),
+            control_no,
+            "@".join(other_nos),
+            rnd.choice(["RL", "BL", "RL@BL"]),
+            "@".join(uncertain_nos),
+        ]
+
+
+def write_sierra_export(out_dir: str, n: int, seed: int = 0) -> str:
+    """
+    Writes caret delimited Sierra export with a header
+
+    Args:
+        out_dir:            directory of the export
+        n:                  number of rows
+        seed:               random seed
+
+    Returns:
+        path to the export
+    """
+    fh = os.path.join(out_dir, f"sierra-export-{seed}.txt")
+    with open(fh, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="^", lineterminator="\n")
+        writer.writerow(
+            ["RECORD #(BIBLIO)", "245|a", "BIB UTIL #", "035|a", "910|a", "991|y"]
+        )
+        writer.writerows(sierra_export_rows(n, seed))
+    return fh
+
+
+def deletion_rows(n: int, seed: int = 0) -> Iterator[list[str]]:
+    """
+    Generator. Rows of OCLC holdings deletion report
+
+    Args:
+        n:                  number of rows
+        seed:               random seed
+    """
+    rnd = random.Random(seed)
+    ocn = 0
+    for _ in range(n):
+        ocn += rnd.randint(1, 120)
+        yield [format_ocn(ocn, rnd), random_title(rnd)]
+
+
+def write_deletions(out_dir: str, n: int, seed: int = 0) -> str:
+    """
+    Writes pipe delimited holdings deletion report
+
+    Args:
+        out_dir:            directory of the report
+        n:                  number of rows
+        seed:               random seed
+
+    Returns:
+        path to the report
+    """
+    fh = os.path.join(out_dir, f"metacoll.NYP.NYP-1419-report-{seed}.txt")
+    with open(fh, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="|", lineterminator="\n")
+        writer.writerows(deletion_rows(n, seed))
+    return fh
+
+
+def random_isbn(rnd: random.Random) -> str:
+    return "978" + "".join(rnd.choice("0123456789") for _ in range(10))
+
+
+def marc_records(n: int, seed: int = 0, sierra: bool = True) -> Iterator[Record]:
+    """
+    Generator. MARC records resembling BPL Sierra exports or, if `sierra`
+    is False, Worldcat records
+
+    Args:
+        n:                  number of records
+        seed:               random seed
+        sierra:             adds Sierra bib number and fixed fields
+    """
+    rnd = random.Random(seed)
+    for bibNo in bib_numbers(n, rnd):
+        record = Record()
+        record.leader = "00000cam a2200000 a 4500"
+        record.add_field(Field(tag="001", data=f"ocm{random_ocn(rnd):08d}"))
+        record.add_field(
+            Field(tag="008", data="220803s2022    nyu           000 0 eng d")
+        )
+        for _ in range(rnd.choice([0, 1, 1, 2, 4])):
+            record.add_field(
+                Field(
+                    tag="020",
+                    indicators=[" ", " "],
+                    subfields=["a", f"{random_isbn(rnd)} (paperback)"],
+                )
+            )
+        if not sierra:
+            record.add_field(
+                Field(tag="019", indicators=[" ", " "], subfields=["a", "12345"])
+            )
+            record.add_field(
+                Field(tag="029", indicators=["1", " "], subfields=["a", "AU@"])
+            )
+        record.add_field(
+            Field(
+                tag="245",
+                indicators=["0", "0"],
+                subfields=["a", random_title(rnd)],
+            )
+        )
+        for _ in range(rnd.randint(0, 4)):
+            record.add_field(
+                Field(
+                    tag="650",
+                    indicators=[" ", rnd.choice(["0", "7"])],
+                    subfields=["a", rnd.choice(WORDS).capitalize(), "2", "fast"],
+                )
+            )
+        if sierra:
+            record.add_field(
+                Field(
+                    tag="907",
+                    indicators=[" ", " "],
+                    subfields=["a", f".b{bibNo}{sierra_check_digit(bibNo)}"],
+                )
+            )
+            record.add_field(
+                Field(
+                    tag="998",
+                    indicators=[" ", " "],
+                    subfields=["d", rnd.choice("aacgj"), "e", rnd.choice("-bg")],
+                )
+            )
+        yield record
+
+
+def write_marc(out_dir: str, n: int, seed: int = 0, sierra: bool = True) -> str:
+    """
+    Writes MARC21 file of generated records
+
+    Args:
+        out_dir:            directory of the file
+        n:                  number of records
+        seed:               random seed
+        sierra:             writes Sierra export instead of Worldcat records
+
+    Returns:
+        path to the file
+    """
+    name = "bpl-batch2enrich" if sierra else "worldcat"
+    fh = os.path.join(out_dir, f"{name}-{seed}.out")
+    with open(fh, "wb") as f:
+        writer = MARCWriter(f)
+        for record in marc_records(n, seed, sierra):
+            writer.write(record)
+    return fh
@@ -3,8 +3,25 @@ import argparse
 
 
 from src.bpl_ingest import select_for_sierra_list_creation, parse_sierra_bib
-from src.bpl_delete import delete_bib, delete_ocn
+from src.bpl_datastore import add_indexes as add_bpl_indexes, migrate_isbns
+from src.bpl_delete import (
+    delete_bib,
+    delete_bibs,
+    delete_ocn,
+    delete_ocns,
+    read_identifiers,
+)
 from src.enhance import launch_bpl_enhancement
+from src.metrics import Metrics, report
+from src.nyp_analytics import export_parquet, print_stats
+from src.nyp_datastore import (
+    add_indexes as add_nyp_indexes,
+    build_latest_outcomes,
+    get_engine as get_nyp_engine,
+)
+from src.nyp_ingest import ingest_reports
+from src.nyp_reconcile import reconcile_deletions
+from src.title_index import build_title_index
 
 
 def main(args: list) -> None:
@@ -27,18 +44,46 @@ def main(args: list) -> None:
             "results in a list of Sierra bib number to be used to create a "
             "list of records in Sierra, 'enrich' uses exported from "
             "Sierra MARC records and runs enrichment process.; "
-            "'enrich-resume' resumes interrupted process"
+            "'enrich-resume' resumes interrupted process; "
+            "'migrate-isbns' (BPL) converts ISBNs stored in old pickled "
+            "format; "
+            "'ingest-reports' (NYPL) loads OCLC BibProcessingReports "
+            "into the database; "
+            "'add-indexes' adds missing indexes to existing database; "
+            "'export-parquet' (NYPL) exports matching data to Parquet files; "
+            "'stats' (NYPL) prints outcome counts computed on exported data; "
+            "'build-latest' (NYPL) rebuilds table of last outcome of each bib; "
+            "'reconcile-deletions' (NYPL) flags OCNs of research bibs on "
+            "the holdings deletion list to keep; "
+            "'build-title-index' (NYPL) indexes Sierra bib titles for "
+            "similar title matching"
         ),
         type=str,
-        choices=["select2enrich", "enrich", "enrich-resume", "delete"],
+        choices=[
+            "select2enrich",
+            "enrich",
+            "enrich-resume",
+            "delete",
+            "migrate-isbns",
+            "ingest-reports",
+            "add-indexes",
+            "export-parquet",
+            "stats",
+            "build-latest",
+            "reconcile-deletions",
+            "build-title-index",
+        ],
     )
 
     parser.add_argument(
         "--volume",
-        help="size of batch for processing",
+        help=(
+            "size of batch for processing; select2enrich defaults to 5000, "
+            "enrich processes all selected records if not given"
+        ),
         type=int,
         nargs="?",
-        default=5000,
+        default=None,
     )
     parser.add_argument(
         "--bibno",
@@ -54,22 +99,131 @@ def main(args: list) -> None:
         nargs="?",
         default=0,
     )
+    parser.add_argument(
+        "--bibno-file",
+        help="file with bib numbers to be deleted, one per line; use '-' for stdin",
+        type=str,
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--ocn-file",
+        help="file with OCN numbers to be deleted, one per line; use '-' for stdin",
+        type=str,
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--dir",
+        help="directory with OCLC BibProcessingReports to be ingested",
+        type=str,
+        nargs="?",
+        default="./src/files/NYPL/orig_reports",
+    )
+    parser.add_argument(
+        "--data-dir",
+        help="directory with NYPL matching data exported to Parquet files",
+        type=str,
+        nargs="?",
+        default="./src/files/NYPL/parquet",
+    )
+    parser.add_argument(
+        "--all-outcomes",
+        help="stats count every submission of a bib, not only the last one",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--min-score",
+        help=(
+            "reconcile-deletions finds similar titles scoring at least this "
+            "much (0-1) using the title index instead of identical titles"
+        ),
+        type=float,
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        help=(
+            "number of parallel workers: concurrent Worldcat requests when "
+            "enriching (default 4) or processes parsing NYPL reports "
+            "(defaults to number of CPUs)"
+        ),
+        type=int,
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--commit-every",
+        help="number of enriched records committed to the database at once",
+        type=int,
+        nargs="?",
+        default=100,
+    )
+    parser.add_argument(
+        "--commit-interval",
+        help="max number of seconds between database commits when enriching",
+        type=float,
+        nargs="?",
+        default=30.0,
+    )
+    parser.add_argument(
+        "--rotate-every",
+        help="split enriched MARC output into files of given number of records",
+        type=int,
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--rate",
+        help="max number of Worldcat requests per second",
+        type=float,
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics",
+        help=(
+            "JSON file to save timing of each processing stage to when "
+            "enriching or ingesting NYPL reports"
+        ),
+        type=str,
+        nargs="?",
+        default=None,
+    )
 
     pargs = parser.parse_args(args)
 
     if pargs.library == "BPL":
         if pargs.action == "select2enrich":
-            print(f"Selecting {pargs.volume} BPL bibs for processing...")
-            out_fh = select_for_sierra_list_creation(pargs.volume)
+            volume = pargs.volume or 5000
+            print(f"Selecting {volume} BPL bibs for processing...")
+            out_fh = select_for_sierra_list_creation(volume)
             print(f"Created a file with Sierra bib numbers to use: {out_fh}")
         elif pargs.action == "enrich":
             print("Parsing prepared MARC file...")
             parse_sierra_bib()
             print("Obtaining Worldcat records...")
-            launch_bpl_enhancement()
+            launch_bpl_enhancement(
+                workers=pargs.workers or 4,
+                rate=pargs.rate,
+                commit_every=pargs.commit_every,
+                commit_interval=pargs.commit_interval,
+                rotate_every=pargs.rotate_every,
+                volume=pargs.volume,
+                metrics_fh=pargs.metrics,
+            )
         elif pargs.action == "enrich-resume":
             print("Resuming enrichment...")
-            launch_bpl_enhancement()
+            launch_bpl_enhancement(
+                workers=pargs.workers or 4,
+                rate=pargs.rate,
+                commit_every=pargs.commit_every,
+                commit_interval=pargs.commit_interval,
+                rotate_every=pargs.rotate_every,
+                volume=pargs.volume,
+                metrics_fh=pargs.metrics,
+            )
         elif pargs.action == "delete":
             if pargs.bibno:
                 print(f"Deleting b{pargs.bibno}a from the database.")
@@ -79,9 +233,59 @@ def main(args: list) -> None:
                 print(f"Deleting OCN {pargs.ocn} from the database.")
                 result = delete_ocn(pargs.ocn)
                 print(result)
+            elif pargs.bibno_file:
+                print(f"Deleting bibs listed in {pargs.bibno_file} from the database.")
+                result = delete_bibs(read_identifiers(pargs.bibno_file))
+                print(result)
+            elif pargs.ocn_file:
+                print(f"Deleting OCNs listed in {pargs.ocn_file} from the database.")
+                result = delete_ocns(read_identifiers(pargs.ocn_file))
+                print(result)
+
+        elif pargs.action == "migrate-isbns":
+            print("Converting stored ISBNs to compact format...")
+            n = migrate_isbns("./src/bpl_db.db")
+            print(f"Converted {n} rows.")
+        elif pargs.action == "add-indexes":
+            created = add_bpl_indexes("./src/bpl_db.db")
+            print(f"Created indexes: {', '.join(created) or 'none'}")
 
     elif pargs.library == "NYPL":
-        print("Workflow not implemented yet. Exiting...")
+        if pargs.action == "ingest-reports":
+            print(f"Ingesting BibProcessingReports from {pargs.dir}...")
+            metrics = Metrics("ingest_reports")
+            ingest_reports(
+                pargs.dir,
+                workers=pargs.workers,
+                db="./src/nyp_db.db",
+                metrics=metrics,
+            )
+            report(metrics, pargs.metrics)
+        elif pargs.action == "add-indexes":
+            created = add_nyp_indexes("./src/nyp_db.db")
+            print(f"Created indexes: {', '.join(created) or 'none'}")
+        elif pargs.action == "export-parquet":
+            print(f"Exporting NYPL data to {pargs.data_dir}...")
+            export_parquet("./src/nyp_db.db", pargs.data_dir)
+        elif pargs.action == "stats":
+            print_stats(pargs.data_dir, latest_only=not pargs.all_outcomes)
+        elif pargs.action == "build-latest":
+            print("Building table of latest outcomes...")
+            with get_nyp_engine("./src/nyp_db.db").begin() as conn:
+                n = build_latest_outcomes(conn)
+            print(f"Saved latest outcome of {n} bibs.")
+        elif pargs.action == "reconcile-deletions":
+            print("Reconciling holdings deletion list with research bibs...")
+            reconcile_deletions(
+                "./src/nyp_db.db",
+                "./src/files/NYPL/hold-delete-title-matches.csv",
+                min_score=pargs.min_score,
+            )
+        elif pargs.action == "build-title-index":
+            print("Building title index of Sierra bibs...")
+            build_title_index("./src/nyp_db.db")
+        else:
+            print("Workflow not implemented yet. Exiting...")
 
 
 if __name__ == "__main__":
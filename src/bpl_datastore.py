@@ -1,14 +1,19 @@
+import pickle
+
 from sqlalchemy import (
     Boolean,
     Column,
     DateTime,
+    Index,
     Integer,
-    PickleType,
     String,
-    create_engine,
+    text,
 )
 from sqlalchemy.ext.declarative import declarative_base
 
+from src.db_access import create_indexes, create_sqlite_engine
+from src.utils import fields2str
+
 
 Base = declarative_base()
 
@@ -20,21 +25,91 @@ class EnhancedBib(Base):
     oclcNo = Column(Integer, nullable=False)
     bibFormat = Column(String(1))
     opacDisplay = Column(String(1))
-    isbns = Column(PickleType)
+    isbns = Column(String)  # 020 fields serialized with `utils.fields2str`
     enhanced = Column(Boolean, nullable=False, default=False)
     enhanced_timestamp = Column(DateTime)
 
+    __table_args__ = (
+        Index("ix_enhanced_bib_oclcNo", "oclcNo"),
+        # partial index of rows awaiting enrichment in selection order
+        Index(
+            "ix_enhanced_bib_unenhanced",
+            "bibNo",
+            "bibFormat",
+            sqlite_where=text("enhanced = 0"),
+        ),
+    )
+
 
-def get_engine(db: str = "bpl_db.db"):
-    return create_engine(f"sqlite:///{db}")
+def get_engine(db: str = "bpl_db.db", profile: str = "default"):
+    return create_sqlite_engine(db, profile)
 
 
 def init_datastore(db: str = "bpl_db.db"):
     """Initiates datastore"""
 
-    engine = create_engine(f"sqlite:///{db}")
+    engine = get_engine(db)
     Base.metadata.create_all(engine)
 
 
+def add_indexes(db: str = "bpl_db.db") -> list[str]:
+    """
+    Adds missing indexes to an existing datastore
+
+    Args:
+        db:                 path to BPL database
+
+    Returns:
+        names of created indexes
+    """
+    engine = get_engine(db)
+    created = create_indexes(engine, Base.metadata)
+    engine.dispose()
+    return created
+
+
+def migrate_isbns(db: str = "bpl_db.db", chunk_size: int = 5000) -> int:
+    """
+    Converts ISBN fields stored as pickled lists of `pymarc.Field` objects
+    into compact strings produced by `utils.fields2str` and reclaims
+    freed space.
+
+    Args:
+        db:                 path to BPL database
+        chunk_size:         number of rows converted per transaction
+
+    Returns:
+        number of converted rows
+    """
+    engine = get_engine(db)
+    select_stmt = text(
+        "SELECT bibNo, isbns FROM enhanced_bib "
+        "WHERE typeof(isbns) = 'blob' AND bibNo > :last "
+        "ORDER BY bibNo LIMIT :limit"
+    )
+    update_stmt = text("UPDATE enhanced_bib SET isbns = :isbns WHERE bibNo = :bibNo")
+    n = 0
+    last = -1
+    with engine.connect() as conn:
+        while True:
+            rows = conn.execute(
+                select_stmt, dict(last=last, limit=chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            values = [
+                dict(bibNo=bibNo, isbns=fields2str(pickle.loads(isbns)))
+                for bibNo, isbns in rows
+            ]
+            with conn.begin():
+                conn.execute(update_stmt, values)
+            n += len(values)
+            last = rows[-1][0]
+            print(f"Converted {n} rows.")
+        conn.execute(text("VACUUM"))
+    engine.dispose()
+    return n
+
+
 if __name__ == "__main__":
     init_datastore()
@@ -1,5 +1,8 @@
+import sys
+from typing import Iterable, Iterator
+
 from src.bpl_datastore import EnhancedBib
-from src.db_access import session_scope, delete_instances
+from src.db_access import session_scope, bulk_delete, delete_instances
 
 
 def delete_bib(bibNo: int) -> str:
@@ -30,3 +33,58 @@ def delete_ocn(ocn: int) -> str:
     with session_scope("./src/bpl_db.db") as session:
         result = delete_instances(session, EnhancedBib, oclcNo=ocn)
         return f"Deleted {result} rows."
+
+
+def read_identifiers(src_fh: str) -> Iterator[int]:
+    """
+    Generator. Reads bib numbers or oclc numbers, one per line, from a file
+    or from stdin. Blank lines are skipped.
+
+    Args:
+        src_fh:             path to file or '-' for stdin
+
+    Yields:
+        identifier as integer
+    """
+    if src_fh == "-":
+        yield from _parse_identifiers(sys.stdin)
+    else:
+        with open(src_fh, "r") as f:
+            yield from _parse_identifiers(f)
+
+
+def _parse_identifiers(lines: Iterable[str]) -> Iterator[int]:
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield int(line)
+
+
+def delete_bibs(bibNos: Iterable[int]) -> str:
+    """
+    Deletes rows in bpl_db for given bib numbers.
+
+    Args:
+        bibNos:             8-digit bib numbers without a prefix or last digit check
+
+    Returns:
+        operation outcome
+    """
+    with session_scope("./src/bpl_db.db") as session:
+        result = bulk_delete(session, EnhancedBib, "bibNo", bibNos)
+        return f"Deleted {result} rows."
+
+
+def delete_ocns(ocns: Iterable[int]) -> str:
+    """
+    Deletes rows in bpl_db for given oclc numbers.
+
+    Args:
+        ocns:               oclc numbers without a prefix
+
+    Returns:
+        operation outcome
+    """
+    with session_scope("./src/bpl_db.db") as session:
+        result = bulk_delete(session, EnhancedBib, "oclcNo", ocns)
+        return f"Deleted {result} rows."
@@ -1,10 +1,28 @@
+from collections import Counter
 import csv
 import json
 import os
+from typing import Callable, Optional
 
 from bookops_bpl_solr import SolrSession
+from requests import Session
 
-from utils import save2csv
+try:
+    from .db_access import chunked
+    from .fetcher import fetch_concurrently, thread_sessions
+    from .response_cache import ResponseCache
+    from .utils import CsvWriter
+except ImportError:
+    from db_access import chunked
+    from fetcher import fetch_concurrently, thread_sessions
+    from response_cache import ResponseCache
+    from utils import CsvWriter
+
+
+# both sequential and batched lookups cache derived values under these
+# endpoints, so either mode reuses entries stored by the other
+BIBNO_OCN = "solr-bibNo-ocn"
+CONTROLNO_COUNT = "solr-controlNo-count"
 
 
 def get_creds():
@@ -28,17 +46,29 @@ def get_bibNos(src_fh: str):
                 continue
 
 
-def find_ocnNo(session, bibNo):
-    response = session.search_bibNo(
-        bibNo,
-        default_response_fields=False,
-        response_fields="id,title,ss_marc_tag_001",
-    )
-    data = response.json()
+def find_ocnNo(session, bibNo, cache: Optional[ResponseCache] = None):
+    def fetch():
+        response = session.search_bibNo(
+            bibNo,
+            default_response_fields=False,
+            response_fields="id,title,ss_marc_tag_001",
+        )
+        return json.dumps(ocnNo_of(response.json())).encode("utf-8")
+
+    if cache is None:
+        return json.loads(fetch())
+    return json.loads(cache.cached(BIBNO_OCN, norm_bibNo(bibNo), fetch))
+
+
+def ocnNo_of(data: dict) -> Optional[str]:
+    """
+    Returns OCLC control number of the only document found by Solr bib
+    number search, None if not found or without OCLC control number
+    """
     if data["response"]["numFound"] == 1:
         try:
             controlNo = data["response"]["docs"][0]["ss_marc_tag_001"]
-            if controlNo.startswith("oc") or controlNo.startswith("on"):
+            if is_oclc_controlNo(controlNo):
                 return controlNo
 
             else:
@@ -50,26 +80,229 @@ def find_ocnNo(session, bibNo):
         return None
 
 
-def has_duplicate(session, ocnNo):
+def norm_bibNo(bibNo: str) -> str:
+    """
+    Normalizes Sierra bib number to 8 digits used as Solr document id,
+    for example 'b120312116' or '.b12031211a' become '12031211'
+    """
+    digits = bibNo.strip().lstrip(".").lstrip("b")
+    return digits[:8]
+
+
+def is_oclc_controlNo(controlNo: str) -> bool:
+    return controlNo.startswith("oc") or controlNo.startswith("on")
+
+
+def find_ocnNos(
+    session: Session,
+    endpoint: str,
+    bibNos: list[str],
+    cache: Optional[ResponseCache] = None,
+) -> dict:
+    """
+    Finds OCLC control numbers of many bibs with a single Solr OR query.
+    With cache given only bibs not looked up before are queried.
+
+    Args:
+        session:            `requests.Session` instance with Solr credentials
+        endpoint:           Solr select endpoint
+        bibNos:             Sierra bib numbers
+        cache:              `ResponseCache` instance
+
+    Returns:
+        dictionary of bib numbers and their OCLC control numbers;
+        bibs without OCLC control number or not found are omitted
+    """
+    found = {}
+    ids = {}
+    for bibNo in bibNos:
+        cached = None
+        if cache is not None:
+            cached = cache.get(BIBNO_OCN, norm_bibNo(bibNo))
+        if cached is None:
+            ids[norm_bibNo(bibNo)] = bibNo
+        elif json.loads(cached) is not None:
+            found[bibNo] = json.loads(cached)
+    if not ids:
+        return found
+
+    response = session.get(
+        endpoint,
+        params={
+            "q": f"id:({' OR '.join(ids)})",
+            "fl": "id,ss_marc_tag_001",
+            "rows": len(ids),
+        },
+    )
+    response.raise_for_status()
+    controlNos = dict.fromkeys(ids)
+    for doc in response.json()["response"]["docs"]:
+        controlNo = doc.get("ss_marc_tag_001")
+        if controlNo is not None and is_oclc_controlNo(controlNo):
+            controlNos[str(doc["id"])] = controlNo
+    for id, controlNo in controlNos.items():
+        if cache is not None:
+            cache.set(BIBNO_OCN, id, json.dumps(controlNo).encode("utf-8"))
+        if controlNo is not None:
+            found[ids[id]] = controlNo
+    return found
+
+
+def count_controlNos(
+    session: Session,
+    endpoint: str,
+    ocnNos: list[str],
+    cache: Optional[ResponseCache] = None,
+) -> Counter:
+    """
+    Counts Solr documents with given control numbers in a single request.
+    With cache given only control numbers not counted before are queried.
+
+    Args:
+        session:            `requests.Session` instance with Solr credentials
+        endpoint:           Solr select endpoint
+        ocnNos:             OCLC control numbers as they appear in 001 tag
+        cache:              `ResponseCache` instance
+
+    Returns:
+        number of documents for each control number
+    """
+    counts = Counter()
+    if cache is not None:
+        missing = []
+        for ocnNo in ocnNos:
+            cached = cache.get(CONTROLNO_COUNT, ocnNo)
+            if cached is None:
+                missing.append(ocnNo)
+            else:
+                counts[ocnNo] = int(cached)
+        ocnNos = missing
+    if not ocnNos:
+        return counts
+
+    terms = " OR ".join(f'"{o}"' for o in ocnNos)
+    response = session.get(
+        endpoint,
+        params={
+            "q": f"ss_marc_tag_001:({terms})",
+            "rows": 0,
+            "facet": "true",
+            "facet.field": "ss_marc_tag_001",
+            "facet.limit": -1,
+            "facet.mincount": 1,
+        },
+    )
+    response.raise_for_status()
+    facets = response.json()["facet_counts"]["facet_fields"]["ss_marc_tag_001"]
+    # Solr returns facets as a flat list of alternating values and counts
+    fetched = dict(zip(facets[::2], facets[1::2]))
+    for ocnNo in ocnNos:
+        counts[ocnNo] = fetched.get(ocnNo, 0)
+        if cache is not None:
+            cache.set(CONTROLNO_COUNT, ocnNo, str(counts[ocnNo]).encode())
+    return counts
+
+
+def lookup_batch(
+    session: Session,
+    endpoint: str,
+    bibNos: list[str],
+    cache: Optional[ResponseCache] = None,
+) -> list:
+    """
+    Finds OCLC control numbers for a batch of bibs and drops those
+    shared by more than one Solr document
+
+    Returns:
+        list of bib number and control number pairs
+    """
+    found = find_ocnNos(session, endpoint, bibNos, cache)
+    if not found:
+        return []
+    counts = count_controlNos(session, endpoint, list(set(found.values())), cache)
+    return [[bibNo, ocn] for bibNo, ocn in found.items() if counts[ocn] <= 1]
+
+
+def has_duplicate(session, ocnNo, cache: Optional[ResponseCache] = None):
     # check if existing record is suppressed or matches on bibNo?
-    response = session.search_controlNo(ocnNo)
-    if response.json()["response"]["numFound"] > 1:
+    def fetch():
+        data = session.search_controlNo(ocnNo).json()
+        return str(data["response"]["numFound"]).encode()
+
+    if cache is None:
+        count = int(fetch())
+    else:
+        count = int(cache.cached(CONTROLNO_COUNT, ocnNo, fetch))
+    if count > 1:
         return True
     else:
         return False
 
 
-def query_solr(src_fh: str, out_fh: str):
+def query_solr(
+    src_fh: str, out_fh: str, cache_db: Optional[str] = "./src/response_cache.db"
+):
     creds = get_creds()
+    cache = ResponseCache(cache_db) if cache_db else None
     with SolrSession(
         authorization=creds["client_key"], endpoint=creds["endpoint"]
-    ) as session:
+    ) as session, CsvWriter(out_fh) as out:
         for bibNo in get_bibNos(src_fh):
-            ocn = find_ocnNo(session, bibNo)
+            ocn = find_ocnNo(session, bibNo, cache)
             if ocn is not None:
-                duplicate = has_duplicate(session, ocn)
+                duplicate = has_duplicate(session, ocn, cache)
                 if not duplicate:
-                    save2csv(out_fh, [bibNo, ocn])
+                    out.writerow([bibNo, ocn])
+
+
+def query_solr_concurrently(
+    src_fh: str,
+    out_fh: str,
+    workers: int = 4,
+    batch_size: int = 50,
+    session_factory: Optional[Callable[[], Session]] = None,
+    endpoint: Optional[str] = None,
+    cache_db: Optional[str] = "./src/response_cache.db",
+) -> int:
+    """
+    Finds OCLC control numbers without duplicates in Solr for bibs listed
+    in a csv file. Bibs are looked up in batches, each batch with a single
+    OR query and a single duplicate check, with several batches in flight.
+    Each worker thread uses its own session.
+
+    Args:
+        src_fh:             csv file with Sierra bib numbers in first column
+        out_fh:             output csv file
+        workers:            max number of concurrent batches
+        batch_size:         number of bibs looked up in a single request
+        session_factory:    function creating session to use instead of
+                            `SolrSession` with stored credentials
+        endpoint:           Solr endpoint to use with given sessions
+        cache_db:           on-disk cache of Solr responses, no caching if None
+
+    Returns:
+        number of saved rows
+    """
+    if session_factory is None:
+        creds = get_creds()
+        endpoint = creds["endpoint"]
+
+        def session_factory():
+            return SolrSession(authorization=creds["client_key"], endpoint=endpoint)
+
+    cache = ResponseCache(cache_db) if cache_db else None
+    batches = chunked(get_bibNos(src_fh), batch_size)
+    with thread_sessions(session_factory) as get_session, CsvWriter(out_fh) as out:
+
+        def fetch(bibNos):
+            return lookup_batch(get_session(), endpoint, bibNos, cache)
+
+        for _, rows in fetch_concurrently(fetch, batches, workers=workers):
+            for row in rows:
+                out.writerow(row)
+    if cache is not None:
+        print(cache.summary())
+    return out.written
 
 
 def test_bibNo(bibNo: str):
@@ -102,6 +335,6 @@ if __name__ == "__main__":
     src_fh = os.path.join(
         os.getenv("USERPROFILE"), "Desktop\\Temp\\BLW-Q-220329_ERRlog.csv"
     )
-    # query_solr(src_fh, "./files/BPL/ocn-for-deletion.csv")
+    # query_solr_concurrently(src_fh, "./files/BPL/ocn-for-deletion.csv")
     test_ocn("ocm62267545")
     # test_bibNo("b120312116")
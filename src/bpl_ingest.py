@@ -1,16 +1,15 @@
 import csv
 from datetime import datetime
 import os
-import pickle
-from typing import Any
+from typing import Any, Iterator
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from bookops_marc import SierraBibReader
 
 from src.bpl_datastore import EnhancedBib
-from src.db_access import session_scope, insert_or_ignore
-from src.utils import save2csv, start_from_scratch
+from src.db_access import bulk_upsert, chunked, session_scope
+from src.utils import CsvWriter, fields2str, start_from_scratch
 
 
 def start_from_scratch(fh):
@@ -21,12 +20,26 @@ def start_from_scratch(fh):
         os.remove(fh)
 
 
-def ingest_cross_ref_data():
-    with open("./files/enhanced/BPL/ALL-enhance-cross-ref.csv", "r") as f:
+def ingest_cross_ref_data(
+    src_fh: str = "./files/enhanced/BPL/ALL-enhance-cross-ref.csv",
+) -> tuple[int, int]:
+    """
+    Loads Sierra bib number and OCLC number pairs into the datastore.
+    Bib numbers already present in the datastore are skipped.
+
+    Args:
+        src_fh:             path to cross reference csv file
+
+    Returns:
+        tuple of number of inserted and skipped rows
+    """
+    with open(src_fh, "r") as f:
         reader = csv.reader(f)
-        with session_scope("bpl_db.db") as session:
-            for row in reader:
-                insert_or_ignore(session, EnhancedBib, bibNo=row[0], oclcNo=row[1])
+        rows = (dict(bibNo=row[0], oclcNo=row[1]) for row in reader)
+        with session_scope("bpl_db.db", profile="bulk-load") as session:
+            inserted, skipped = bulk_upsert(session, EnhancedBib, rows)
+    print(f"Inserted {inserted} rows, skipped {skipped} rows.")
+    return inserted, skipped
 
 
 def select_for_sierra_list_creation(n=int) -> str:
@@ -54,41 +67,95 @@ def select_for_sierra_list_creation(n=int) -> str:
             .limit(n)
             .all()
         )
-        for row in results:
-            save2csv(out_fh, [row.bibNo])
-            save2csv(temp_fh, [f"b{row.bibNo}a"])
+        with CsvWriter(out_fh) as out, CsvWriter(temp_fh) as temp:
+            for row in results:
+                out.writerow([row.bibNo])
+                temp.writerow([f"b{row.bibNo}a"])
 
     return temp_fh
 
 
-def parse_sierra_bib(src_fh: str = None) -> None:
+def read_sierra_bibs(reader: SierraBibReader) -> Iterator[dict]:
+    """
+    Generator. Extracts local data to be preserved from Sierra MARC records
+
+    Args:
+        reader:             `bookops_marc.SierraBibReader` instance
+
+    Yields:
+        dictionary of `EnhancedBib` column values
+    """
+    for bib in reader:
+        yield dict(
+            bibNo=int(bib.sierra_bib_id_normalized()),
+            bibFormat=bib.sierra_bib_format(),
+            opacDisplay=bib["998"]["e"],
+            isbns=fields2str(bib.get_fields("020")),
+        )
+
+
+def parse_sierra_bib(
+    src_fh: str = None,
+    not_found_fh: str = None,
+    chunk_size: int = 1000,
+    db: str = "./src/bpl_db.db",
+) -> int:
+    """
+    Incorporates local data from exported Sierra MARC records into the
+    datastore. Records are applied in chunks with a single bulk UPDATE
+    keyed on bibNo. Bib numbers missing from the datastore are saved
+    to a summary file.
+
+    Args:
+        src_fh:             Sierra MARC file, defaults to
+                            `documents/bpl-batch2enrich-[yymmdd].out`
+        not_found_fh:       summary file of bibs missing from the datastore,
+                            defaults to `not-found-[yymmdd].csv` in
+                            `src/files/enhanced/BPL`
+        chunk_size:         number of records updated at once
+        db:                 path to BPL database
+
+    Returns:
+        number of updated rows
+    """
+    timestamp = datetime.now()
     if src_fh is None:
-        timestamp = datetime.now()
         src_fh = os.path.join(
             os.getenv("USERPROFILE"),
             f"documents/bpl-batch2enrich-{timestamp:%y%m%d}.out",
         )
+    if not_found_fh is None:
+        not_found_fh = f"./src/files/enhanced/BPL/not-found-{timestamp:%y%m%d}.csv"
+    start_from_scratch(not_found_fh)
+
+    updated = 0
+    missing = 0
     with open(src_fh, "rb") as marcfile:
         print(f"Reading {src_fh}.")
         reader = SierraBibReader(marcfile)
-        with session_scope("./src/bpl_db.db") as session:
-            for bib in reader:
-                bibNo = bib.sierra_bib_id_normalized()
-                isbns = bib.get_fields("020")
-                pickled_isbns = pickle.dumps(isbns)
-                kwargs = dict(
-                    bibFormat=bib.sierra_bib_format(),
-                    opacDisplay=bib["998"]["e"],
-                    isbns=pickled_isbns,
-                )
-                instance = (
-                    session.query(EnhancedBib).filter_by(bibNo=bibNo).one_or_none()
-                )
-                if instance:
-                    for key, value in kwargs.items():
-                        setattr(instance, key, value)
-                else:
-                    print(f"Unable to find {bibNo} in the datastore.")
+        with session_scope(db) as session, CsvWriter(not_found_fh) as not_found:
+            for chunk in chunked(read_sierra_bibs(reader), chunk_size):
+                bibNos = [values["bibNo"] for values in chunk]
+                found = {
+                    bibNo
+                    for (bibNo,) in session.query(EnhancedBib.bibNo).filter(
+                        EnhancedBib.bibNo.in_(bibNos)
+                    )
+                }
+                mappings = [values for values in chunk if values["bibNo"] in found]
+                session.bulk_update_mappings(EnhancedBib, mappings)
+                updated += len(mappings)
+                for bibNo in bibNos:
+                    if bibNo not in found:
+                        not_found.writerow([bibNo])
+                        missing += 1
+
+    print(f"Updated {updated} records.")
+    if missing:
+        print(f"Unable to find {missing} records in the datastore. See {not_found_fh}")
+    else:
+        os.remove(not_found_fh)
+    return updated
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""
+Checkpoint journal tying records written to an output MARC file to
+not yet committed database changes.
+"""
+import csv
+import os
+from typing import Optional
+
+
+class CheckpointJournal:
+    """
+    Journal of bib numbers whose MARC records were written to an output file
+    but whose database changes may not be committed yet. Each entry records
+    size of the output file after the record was written, so on recovery
+    any partially written or unjournaled records can be trimmed.
+    The journal file is kept open and entries are buffered until
+    `checkpoint`, which must be called before database changes are committed.
+
+    Args:
+        fh:                 path to journal file
+    """
+
+    def __init__(self, fh: str):
+        self.fh = fh
+        self._handle = None
+        self._writer = None
+
+    def _open(self) -> None:
+        if self._handle is None:
+            self._handle = open(self.fh, "a", encoding="utf-8")
+            self._writer = csv.writer(self._handle, lineterminator="\n")
+
+    def record(self, bibNo: int, marc_fh: str, offset: int) -> None:
+        """
+        Appends an entry to the journal
+
+        Args:
+            bibNo:          Sierra bib number
+            marc_fh:        path to MARC file the record was written to
+            offset:         size of the MARC file after the record was written
+        """
+        self._open()
+        self._writer.writerow([bibNo, marc_fh, offset])
+
+    def entries(self) -> list[tuple[Optional[int], str, int]]:
+        """
+        Returns journal entries as tuples of bibNo, MARC file, and offset;
+        baseline entries have bibNo set to None
+        """
+        if self._handle is not None:
+            self._handle.flush()
+        if not os.path.isfile(self.fh):
+            return []
+        entries = []
+        with open(self.fh, "r", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                try:
+                    bibNo = int(row[0]) if row[0] else None
+                    entries.append((bibNo, row[1], int(row[2])))
+                except (IndexError, ValueError):
+                    # entry interrupted mid-write
+                    break
+        return entries
+
+    def recover(self) -> list[int]:
+        """
+        Finds records present in the output MARC files whose database
+        changes were not committed. Output files are truncated to the last
+        journaled record, removing anything written afterwards.
+
+        Returns:
+            list of bib numbers already written to output files
+        """
+        written = []
+        last_offsets = {}
+        for bibNo, marc_fh, offset in self.entries():
+            if os.path.isfile(marc_fh) and os.path.getsize(marc_fh) >= offset:
+                if bibNo is not None:
+                    written.append(bibNo)
+                last_offsets[marc_fh] = offset
+        for marc_fh, offset in last_offsets.items():
+            with open(marc_fh, "r+b") as f:
+                f.truncate(offset)
+        return written
+
+    def baseline(self, marc_fh: str) -> None:
+        """
+        Records current size of an output MARC file, anything written to it
+        afterwards without a journal entry will be trimmed on recovery
+
+        Args:
+            marc_fh:        path to output MARC file
+        """
+        offset = os.path.getsize(marc_fh) if os.path.isfile(marc_fh) else 0
+        self._open()
+        self._writer.writerow(["", marc_fh, offset])
+
+    def checkpoint(self) -> None:
+        """
+        Flushes buffered entries and forces them to disk; to be called
+        before database changes of journaled records are committed
+        """
+        if self._handle is not None:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+
+    def reset(self, marc_fh: str) -> None:
+        """
+        Empties journal and records baseline of the output MARC file;
+        to be called when all records written so far have their database
+        changes committed
+
+        Args:
+            marc_fh:        path to output MARC file
+        """
+        self.clear()
+        self.baseline(marc_fh)
+        self.checkpoint()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            self._writer = None
+
+    def clear(self) -> None:
+        """
+        Closes and removes journal file
+        """
+        self.close()
+        if os.path.isfile(self.fh):
+            os.remove(self.fh)
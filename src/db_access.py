@@ -1,25 +1,219 @@
+import atexit
 from contextlib import contextmanager
+from itertools import islice
+import os
+import threading
+from typing import Iterable, Iterator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine, delete, event, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# SQLite pragmas applied to every new connection;
+# negative cache_size is in KiB, mmap_size is in bytes
+PROFILES = {
+    "safe": dict(
+        journal_mode="WAL",
+        synchronous="FULL",
+        cache_size=-2000,
+        mmap_size=0,
+        temp_store="DEFAULT",
+    ),
+    "default": dict(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size=-64000,
+        mmap_size=268435456,
+        temp_store="MEMORY",
+    ),
+    "bulk-load": dict(
+        journal_mode="WAL",
+        synchronous="OFF",
+        cache_size=-512000,
+        mmap_size=1073741824,
+        temp_store="MEMORY",
+    ),
+}
+
+
+def get_pragmas(profile: str = "default", **overrides) -> dict:
+    """
+    Returns SQLite pragmas for given performance profile
+
+    Args:
+        profile:            'safe', 'default', or 'bulk-load'
+        overrides:          individual pragmas to replace profile's values,
+                            for example `synchronous="NORMAL"`
+    """
+    try:
+        pragmas = dict(PROFILES[profile])
+    except KeyError:
+        raise ValueError(
+            f"Unknown performance profile '{profile}'. "
+            f"Use one of: {', '.join(PROFILES)}."
+        )
+    pragmas.update(overrides)
+    return pragmas
+
+
+def create_sqlite_engine(
+    db: str, profile: str = "default", pooled: bool = False, **overrides
+) -> Engine:
+    """
+    Creates SQLite engine that applies performance pragmas on connect
+
+    Args:
+        db:                 path to SQLite database
+        profile:            name of performance profile, see `PROFILES`
+        pooled:             keeps connections open in a pool between
+                            checkouts instead of opening a new one each time
+        overrides:          individual pragmas to replace profile's values
+    """
+    pragmas = get_pragmas(profile, **overrides)
+    if pooled:
+        engine = create_engine(
+            f"sqlite:///{db}",
+            poolclass=QueuePool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(f"sqlite:///{db}")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+# process-wide registry of pooled engines and their session factories
+# keyed by normalized database path and performance profile
+_engines: dict[tuple[str, str], Engine] = {}
+_session_factories: dict[tuple[str, str], sessionmaker] = {}
+# reentrant, get_session_factory registers engine while holding it
+_registry_lock = threading.RLock()
+
+
+def _registry_key(db: str, profile: str) -> tuple[str, str]:
+    if db != ":memory:":
+        db = os.path.normcase(os.path.realpath(db))
+    return db, profile
+
+
+def get_cached_engine(db: str, profile: str = "default") -> Engine:
+    """
+    Returns pooled engine for given database, creating it on first use.
+    Subsequent calls with the same database and profile reuse it.
+
+    Args:
+        db:                 path to SQLite database
+        profile:            name of performance profile, see `PROFILES`
+    """
+    key = _registry_key(db, profile)
+    with _registry_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_sqlite_engine(db, profile, pooled=True)
+            _engines[key] = engine
+    return engine
+
+
+def get_session_factory(db: str, profile: str = "default") -> sessionmaker:
+    """
+    Returns cached session factory bound to engine of given database
+
+    Args:
+        db:                 path to SQLite database
+        profile:            name of performance profile, see `PROFILES`
+    """
+    key = _registry_key(db, profile)
+    with _registry_lock:
+        factory = _session_factories.get(key)
+        if factory is None:
+            factory = sessionmaker(bind=get_cached_engine(db, profile))
+            _session_factories[key] = factory
+    return factory
+
+
+def dispose_engines() -> None:
+    """
+    Closes pooled connections of all registered engines and empties
+    the registry. Runs automatically at interpreter exit.
+    """
+    with _registry_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_factories.clear()
+
+
+def _forget_engines() -> None:
+    # forked child must not reuse parent's pooled connections, nor
+    # inherit the lock held by another thread of the parent
+    global _registry_lock
+    _registry_lock = threading.RLock()
+    _engines.clear()
+    _session_factories.clear()
+
+
+atexit.register(dispose_engines)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_engines)
+
+
+def create_indexes(engine: Engine, metadata: MetaData) -> list[str]:
+    """
+    Creates indexes declared on models that are missing in an existing
+    database and refreshes query planner statistics.
+
+    Args:
+        engine:             engine of the database
+        metadata:           `MetaData` of datastore models
+
+    Returns:
+        names of created indexes
+    """
+    created = []
+    existing_tables = inspect(engine).get_table_names()
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix["name"] for ix in inspect(engine).get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+    return created
 
 
 class DataAccessLayer:
-    def __init__(self, db: str):
-        self.conn = f"sqlite:///{db}"
+    def __init__(self, db: str, profile: str = "default"):
+        self.db = db
+        self.profile = profile
         self.engine = None
 
     def connect(self):
-        self.engine = create_engine(self.conn)
-        self.Session = sessionmaker(bind=self.engine)
+        self.engine = get_cached_engine(self.db, self.profile)
+        self.Session = get_session_factory(self.db, self.profile)
 
 
 @contextmanager
-def session_scope(db: str):
+def session_scope(db: str, profile: str = "default"):
     """
     Provides a transactional scope around series of operations.
+
+    Args:
+        db:                 path to SQLite database
+        profile:            name of performance profile, see `PROFILES`
     """
-    dal = DataAccessLayer(db)
+    dal = DataAccessLayer(db, profile)
     dal.connect()
     session = dal.Session()
     try:
@@ -32,21 +226,129 @@ def session_scope(db: str):
         session.close()
 
 
-def insert_or_ignore(session, model, **kwargs):
-    instance = session.query(model).filter_by(**kwargs).one_or_none()
-    if not instance:
-        instance = model(**kwargs)
-        session.add(instance)
-        session.flush()
-        return instance
+def bulk_upsert(
+    session,
+    model,
+    rows: Iterable[dict],
+    update_columns: Optional[list[str]] = None,
+    chunk_size: int = 5000,
+) -> tuple[int, int]:
+    """
+    Writes rows in chunks using `INSERT ... ON CONFLICT`, one executemany
+    per chunk. Rows conflicting with existing primary keys are skipped,
+    or, if `update_columns` are given, have these columns updated.
+
+    Args:
+        session:            `sqlalchemy.orm.Session` instance
+        model:              datastore model
+        rows:               iterable of dictionaries with column values
+        update_columns:     columns to update on conflict,
+                            conflicting rows are ignored if not given
+        chunk_size:         number of rows in a single statement execution
+
+    Returns:
+        tuple of number of written rows and number of skipped rows
+    """
+    stmt = sqlite_insert(model)
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.name for c in inspect(model).primary_key],
+            set_={c: stmt.excluded[c] for c in update_columns},
+        )
     else:
-        return instance
+        stmt = stmt.on_conflict_do_nothing()
+
+    written = 0
+    total = 0
+    for chunk in chunked(rows, chunk_size):
+        result = session.execute(stmt, chunk)
+        written += result.rowcount
+        total += len(chunk)
+    return written, total - written
+
+
+def _cascades_delete(model) -> bool:
+    return any(rel.cascade.delete for rel in inspect(model).relationships)
 
 
 def delete_instances(session, model, **kwargs) -> int:
-    instances = session.query(model).filter_by(**kwargs).all()
+    """
+    Deletes rows matching given column values. Models without delete
+    cascades are removed with a single `DELETE` statement bypassing the
+    ORM, after which all instances loaded in the session are expired, so
+    deleted rows are not served from the identity map. Models cascading
+    deletes to related rows are loaded and deleted one by one by the ORM.
+
+    Args:
+        session:            `sqlalchemy.orm.Session` instance
+        model:              datastore model
+        kwargs:             column values to match
+
+    Returns:
+        number of deleted rows
+    """
+    query = session.query(model).filter_by(**kwargs)
+    if _cascades_delete(model):
+        n = 0
+        for instance in query.all():
+            session.delete(instance)
+            n += 1
+        return n
+    n = query.delete(synchronize_session=False)
+    session.expire_all()
+    return n
+
+
+def bulk_delete(
+    session, model, column: str, values: Iterable, chunk_size: int = 500
+) -> int:
+    """
+    Deletes rows matching any of given values, issuing a single
+    `DELETE ... WHERE column IN (...)` statement per chunk. As in
+    `delete_instances` loaded instances are expired afterwards, and
+    models cascading deletes are deleted by the ORM instead.
+
+    Args:
+        session:            `sqlalchemy.orm.Session` instance
+        model:              datastore model
+        column:             name of column to match values against
+        values:             iterable of values to delete
+        chunk_size:         number of values in a single statement
+
+    Returns:
+        number of deleted rows
+    """
+    attr = getattr(model, column)
+    cascades = _cascades_delete(model)
     n = 0
-    for i in instances:
-        n += 1
-        session.delete(i)
+    for chunk in chunked(values, chunk_size):
+        if cascades:
+            for instance in session.query(model).filter(attr.in_(chunk)).all():
+                session.delete(instance)
+                n += 1
+            continue
+        stmt = delete(model).where(attr.in_(chunk))
+        result = session.execute(stmt, execution_options={"synchronize_session": False})
+        n += result.rowcount
+    if not cascades:
+        session.expire_all()
     return n
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Generator. Splits iterable into lists of given size; the last one
+    may be shorter.
+
+    Args:
+        iterable:           any iterable, including generators
+        size:               max number of elements in a chunk
+    """
+    if size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
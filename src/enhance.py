@@ -5,8 +5,8 @@ import csv
 from datetime import datetime
 import json
 import os
-import pickle
-from typing import Optional, Union
+import time
+from typing import Callable, Iterable, Iterator, Optional, Union
 from io import BytesIO
 
 
@@ -23,17 +23,79 @@ from sqlalchemy.orm import Session
 
 from src.__init__ import __version__
 from src.bpl_datastore import EnhancedBib
-from src.db_access import session_scope
-from src.utils import save2csv, save2marc, start_from_scratch
+from src.checkpoint import CheckpointJournal
+from src.db_access import chunked, session_scope
+from src.fetcher import fetch_concurrently, thread_sessions
+from src.metrics import Metrics, report
+from src.response_cache import ResponseCache
+from src.utils import MarcWriter, save2csv, start_from_scratch, str2fields
 
 
-def select_for_enhancing(session: Session) -> list[EnhancedBib]:
-    instances = (
+def count_for_enhancing(session: Session) -> int:
+    return (
         session.query(EnhancedBib)
         .filter(EnhancedBib.enhanced == False, EnhancedBib.bibFormat != None)
-        .order_by(EnhancedBib.bibNo)
-    ).all()
-    return instances
+        .count()
+    )
+
+
+def iter_for_enhancing(
+    session: Session, page_size: int = 500, volume: Optional[int] = None
+) -> Iterator[EnhancedBib]:
+    """
+    Generator. Streams bibs ready for enhancing in bibNo order, loading
+    them in pages of `bibNo > last seen` keyset queries, so only one page
+    is held in memory at a time.
+
+    Args:
+        session:                `sqlalchemy.orm.Session` instance
+        page_size:              number of rows loaded per query
+        volume:                 max number of rows to yield, all if not given
+    """
+    last = -1
+    yielded = 0
+    while volume is None or yielded < volume:
+        limit = page_size if volume is None else min(page_size, volume - yielded)
+        page = (
+            session.query(EnhancedBib)
+            .filter(
+                EnhancedBib.enhanced == False,
+                EnhancedBib.bibFormat != None,
+                EnhancedBib.bibNo > last,
+            )
+            .order_by(EnhancedBib.bibNo)
+            .limit(limit)
+            .all()
+        )
+        if not page:
+            break
+        yield from page
+        last = page[-1].bibNo
+        yielded += len(page)
+
+
+def mark_enhanced(session: Session, bibNos: Iterable[int]) -> int:
+    """
+    Flags given bibs as enhanced
+
+    Args:
+        session:                `sqlalchemy.orm.Session` instance
+        bibNos:                 Sierra bib numbers
+
+    Returns:
+        number of updated rows
+    """
+    n = 0
+    for chunk in chunked(bibNos, 500):
+        n += (
+            session.query(EnhancedBib)
+            .filter(EnhancedBib.bibNo.in_(chunk))
+            .update(
+                {"enhanced": True, "enhanced_timestamp": datetime.now()},
+                synchronize_session=False,
+            )
+        )
+    return n
 
 
 def get_worldcat_bib(
@@ -59,6 +121,48 @@ def get_worldcat_bib(
         return None
 
 
+def fetch_worldcat_bib(
+    session: MetadataSession,
+    oclcNo: str,
+    bibNo: int,
+    i: int,
+    n: int,
+    cache: Optional[ResponseCache] = None,
+    metrics: Optional[Metrics] = None,
+) -> Optional[bytes]:
+    """
+    Returns MARC XML of Worldcat record, reusing payload cached by
+    previous runs if cache is given
+
+    Args:
+        session:                `requests.Session` instance
+        oclcNo:                 OCLC #
+        bibNo:                  Sierra bib number
+        i:                      request number in the process
+        n:                      total number of requests in the process
+        cache:                  `ResponseCache` instance
+        metrics:                `Metrics` instance recording request latency
+    """
+    if cache is not None:
+        content = cache.get("worldcat-bib", str(oclcNo))
+        if content is not None:
+            print(f"{i+1}/{n} b{bibNo}a: {oclcNo} = CACHED")
+            if metrics is not None:
+                metrics.count("worldcat_cached")
+            return content
+
+    if metrics is not None:
+        with metrics.stage("worldcat_request"):
+            response = get_worldcat_bib(session, oclcNo, bibNo, i, n)
+    else:
+        response = get_worldcat_bib(session, oclcNo, bibNo, i, n)
+    if response is None:
+        return None
+    if cache is not None:
+        cache.set("worldcat-bib", str(oclcNo), response.content)
+    return response.content
+
+
 def get_token(creds_fh: str) -> WorldcatAccessToken:
     """
     Obtains Worldcat access token
@@ -89,7 +193,7 @@ def manipulate_bib(
     library: str,
     sierra_format: str,
     sierra_opac: str,
-    pickled_isbns: bytes,
+    isbns: Optional[str],
 ) -> None:
     """
     Supports only BPL at the moment!!
@@ -97,7 +201,7 @@ def manipulate_bib(
 
     # replace ISBN tags
     bib.remove_fields("020")
-    isbn_fields = pickle.loads(pickled_isbns)
+    isbn_fields = str2fields(isbns)
     for field in isbn_fields:
         bib.add_ordered_field(field)
 
@@ -120,12 +224,50 @@ def manipulate_bib(
     bib.remove_unsupported_subjects()
 
 
-def launch_bpl_enhancement(out_fh: str = None) -> None:
+def launch_bpl_enhancement(
+    out_fh: str = None,
+    workers: int = 4,
+    rate: Optional[float] = None,
+    commit_every: int = 100,
+    commit_interval: float = 30.0,
+    journal_fh: str = "./src/files/enhanced/BPL/enrich-checkpoint.csv",
+    rotate_every: Optional[int] = None,
+    volume: Optional[int] = None,
+    page_size: int = 500,
+    cache_db: Optional[str] = "./src/response_cache.db",
+    metrics: Optional[Metrics] = None,
+    metrics_fh: Optional[str] = None,
+    db: str = "./src/bpl_db.db",
+    session_factory: Optional[Callable[[], MetadataSession]] = None,
+    failed_fh: Optional[str] = None,
+) -> None:
     """
 
     Args:
         out_fh:             output MARC file
                             defaults to `documents/bpl-enriched-[yymmdd].mrc`
+        workers:            max number of concurrent Worldcat requests
+        rate:               max number of Worldcat requests per second,
+                            no limit if not given
+        commit_every:       commit database changes every n records
+        commit_interval:    commit database changes at least every n seconds
+        journal_fh:         checkpoint journal of records written to the output
+                            file but not committed yet
+        rotate_every:       split output into files of n records
+        volume:             max number of records to enrich, all if not given
+        page_size:          number of records loaded from database at once
+        cache_db:           on-disk cache of Worldcat responses,
+                            no caching if None
+        metrics:            `Metrics` instance recording duration of each
+                            stage of processing of a record
+        metrics_fh:         path to JSON file metrics are saved to,
+                            only printed if not given
+        db:                 path to BPL database
+        session_factory:    function creating Worldcat session, each worker
+                            thread gets its own; defaults to `MetadataSession`
+                            authorized with stored credentials
+        failed_fh:          csv file bib failed to enrich is saved to,
+                            defaults to `failed2enhance-[yymmdd].csv`
     """
     timestamp = datetime.now()
     if out_fh is None:
@@ -133,50 +275,124 @@ def launch_bpl_enhancement(out_fh: str = None) -> None:
             os.getenv("USERPROFILE"),
             f"documents/bpl-enriched-{timestamp:%y%m%d}.mrc",
         )
+    if failed_fh is None:
+        failed_fh = f"./src/files/BPL/enhanced/failed2enhance-{timestamp:%y%m%d}.csv"
     print(f"Output file: {out_fh}")
+    cache = ResponseCache(cache_db) if cache_db else None
+    if metrics is None:
+        metrics = Metrics("enrich")
+
+    # records written out by an interrupted run but never committed
+    journal = CheckpointJournal(journal_fh)
+    recovered = journal.recover()
+    if recovered:
+        with session_scope(db=db) as db_session:
+            mark_enhanced(db_session, recovered)
+        print(f"Recovered {len(recovered)} records written by interrupted run.")
+
+    try:
+        if session_factory is None:
+            creds_fh = os.path.join(
+                os.getenv("USERPROFILE"), f".oclc/bpl_overload.json"
+            )
+            token = get_token(creds_fh)
+            print("Worldcat Metadata API token obtained...")
 
-    creds_fh = os.path.join(os.getenv("USERPROFILE"), f".oclc/bpl_overload.json")
-    token = get_token(creds_fh)
-    print("Worldcat Metadata API token obtained...")
-
-    with MetadataSession(authorization=token) as session:
-        print("Worldcat session opened...")
-
-        # get source data for queries
-        with session_scope(db=f"./src/bpl_db.db") as db_session:
-            rows = select_for_enhancing(db_session)
-            n = len(rows)
-            if n == 0:
-                print(
-                    "No available records for enrichment. Please export another batch."
-                )
-            for i, row in enumerate(rows):
+            def session_factory():
+                return MetadataSession(authorization=token)
+
+        with thread_sessions(session_factory) as get_session, MarcWriter(
+            out_fh, rotate_every=rotate_every
+        ) as marc_writer:
+            print("Worldcat session opened...")
+            journal.reset(marc_writer.next_fh)
+
+            # get source data for queries
+            with session_scope(db=db) as db_session:
+                # rows are modified only here, no need to reload them after commit
+                db_session.expire_on_commit = False
+                n = count_for_enhancing(db_session)
+                if volume is not None:
+                    n = min(n, volume)
+                if n == 0:
+                    print(
+                        "No available records for enrichment. Please export another batch."
+                    )
+                rows = iter_for_enhancing(db_session, page_size, volume)
+
+                # worker threads use only plain values, ORM instances
+                # are accessed exclusively in this thread
+                jobs = ((row, i, row.oclcNo, row.bibNo) for i, row in enumerate(rows))
+
+                def fetch(job):
+                    _, i, oclcNo, bibNo = job
+                    return fetch_worldcat_bib(
+                        get_session(), oclcNo, bibNo, i, n, cache, metrics
+                    )
+
+                uncommitted = 0
+                last_commit = time.monotonic()
                 try:
-                    response = get_worldcat_bib(session, row.oclcNo, row.bibNo, i, n)
+                    for (row, _, _, _), content in fetch_concurrently(
+                        fetch, jobs, workers=workers, rate=rate
+                    ):
+                        if content is not None:
+                            with metrics.stage("parse_xml"):
+                                data = BytesIO(content)
+                                worldcat_bib = parse_xml_to_array(data)[0]
+                            with metrics.stage("to_local_bib"):
+                                bib = pymarc_record_to_local_bib(worldcat_bib, "BPL")
+                            with metrics.stage("manipulate_bib"):
+                                manipulate_bib(
+                                    bib,
+                                    row.bibNo,
+                                    "BPL",
+                                    row.bibFormat,
+                                    row.opacDisplay,
+                                    row.isbns,
+                                )
+                            with metrics.stage("save2marc"):
+                                if marc_writer.next_fh != marc_writer.fh:
+                                    journal.baseline(marc_writer.next_fh)
+                                marc_writer.write(bib)
+                                journal.record(
+                                    row.bibNo, marc_writer.fh, marc_writer.tell()
+                                )
+                            row.enhanced = True
+                            row.enhanced_timestamp = datetime.now()
+                            uncommitted += 1
+                            metrics.count("enriched")
+                            if (
+                                uncommitted >= commit_every
+                                or time.monotonic() - last_commit >= commit_interval
+                            ):
+                                with metrics.stage("commit"):
+                                    marc_writer.checkpoint()
+                                    journal.checkpoint()
+                                    db_session.commit()
+                                    journal.reset(marc_writer.next_fh)
+                                uncommitted = 0
+                                last_commit = time.monotonic()
+                        else:
+                            metrics.count("failed")
+                            save2csv(failed_fh, [row.bibNo, row.oclcNo])
+                            raise WorldcatSessionError(
+                                f"API error. See report at {failed_fh}"
+                            )
                 except WorldcatRequestError:
                     raise WorldcatRequestError(
                         "API request error. Resume with 'python run.py enrich-resume' command."
                     )
 
-                if response is not None:
-                    data = BytesIO(response.content)
-                    worldcat_bib = parse_xml_to_array(data)[0]
-                    bib = pymarc_record_to_local_bib(worldcat_bib, "BPL")
-                    manipulate_bib(
-                        bib,
-                        row.bibNo,
-                        "BPL",
-                        row.bibFormat,
-                        row.opacDisplay,
-                        row.isbns,
-                    )
-                    save2marc(out_fh, bib)
-                    row.enhanced = True
-                    row.enhanced_timestamp = datetime.now()
-                    db_session.commit()
-                else:
-                    fail_fh = (
-                        f"./src/files/BPL/enhanced/failed2enhance-{timestamp:%y%m%d}.csv",
-                    )
-                    save2csv(fail_fh, [row.bibNo, row.oclcNo])
-                    raise WorldcatSessionError(f"API error. See report at {fail_fh}")
+                marc_writer.checkpoint()
+                journal.checkpoint()
+
+        # all changes committed on exit from the session scope
+        journal.clear()
+        if cache is not None:
+            print(cache.summary())
+    finally:
+        # hand entries of a failed run over to the next one's recovery
+        journal.close()
+        # failed runs are the ones most in need of diagnosis
+        report(metrics, metrics_fh)
@@ -0,0 +1,131 @@
+"""
+Concurrent execution of network requests with a bounded number of requests
+in flight and an optional rate limit.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Args:
+        rate:               number of tokens added per second
+        capacity:           max number of tokens that can accumulate,
+                            defines allowed burst; defaults to 1
+    """
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("Rate must be a positive number.")
+        self.rate = rate
+        self.capacity = capacity or 1
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes a token from the bucket, blocking until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@contextmanager
+def thread_sessions(factory: Callable[[], Any]):
+    """
+    Provides function returning session of the calling thread, creating
+    it with `factory` on its first call. `requests.Session` is not
+    thread-safe, so workers of `fetch_concurrently` must not share one.
+    All created sessions are closed on exit.
+
+    Args:
+        factory:            function creating a new session
+
+    Example:
+        with thread_sessions(requests.Session) as get_session:
+            fetch = lambda url: get_session().get(url)
+            for url, response in fetch_concurrently(fetch, urls):
+                ...
+    """
+    local = threading.local()
+    sessions = []
+    lock = threading.Lock()
+
+    def get_session():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = factory()
+            with lock:
+                sessions.append(session)
+        return session
+
+    try:
+        yield get_session
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def fetch_concurrently(
+    fetch: Callable[[Any], Any],
+    items: Iterable,
+    workers: int = 4,
+    rate: Optional[float] = None,
+) -> Iterator[tuple[Any, Any]]:
+    """
+    Generator. Calls `fetch` for each item in a pool of threads keeping at
+    most `workers` calls in flight. Results are yielded in the order of
+    items. An exception raised by `fetch` is re-raised when its result is
+    reached and any pending calls are cancelled.
+
+    Args:
+        fetch:              function making a request for a single item
+        items:              iterable of items to fetch; consumed lazily
+        workers:            max number of concurrent requests
+        rate:               max number of requests started per second,
+                            no limit if not given
+
+    Yields:
+        tuple of item and value returned by `fetch`
+    """
+    if workers < 1:
+        raise ValueError("Number of workers must be a positive integer.")
+    bucket = TokenBucket(rate) if rate else None
+
+    def limited_fetch(item):
+        if bucket is not None:
+            bucket.acquire()
+        return fetch(item)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, executor.submit(limited_fetch, item)))
+            if len(pending) >= workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
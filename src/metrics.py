@@ -0,0 +1,229 @@
+"""
+Lightweight instrumentation of processing stages. Latencies are recorded
+in log-scaled histograms of fixed size and events in counters, so
+overhead and memory do not grow with the number of processed records.
+"""
+from contextlib import contextmanager
+import json
+import math
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+
+class Histogram:
+    """
+    Latency histogram with buckets growing by `factor`; reported
+    percentiles are upper bounds of their buckets, so they overestimate
+    by less than `factor`.
+
+    Args:
+        base:               upper bound of the first bucket in seconds
+        factor:             ratio of consecutive bucket bounds
+    """
+
+    def __init__(self, base: float = 1e-6, factor: float = 2**0.25):
+        self.base = base
+        self.factor = factor
+        self._log_factor = math.log(factor)
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        if seconds <= self.base:
+            bucket = 0
+        else:
+            bucket = math.ceil(math.log(seconds / self.base) / self._log_factor)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns latency in seconds below which `p` percent of observations fall
+
+        Args:
+            p:              percentile between 0 and 100
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                bound = self.base * self.factor**bucket
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return dict(
+            count=self.count,
+            total=self.total,
+            mean=self.total / self.count if self.count else 0.0,
+            min=self.min if self.count else 0.0,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            max=self.max,
+        )
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage latency histograms and counters.
+
+    Example:
+        metrics = Metrics("enrich")
+        with metrics.stage("parse"):
+            ...
+        metrics.count("records")
+        print(metrics.summary())
+    """
+
+    def __init__(self, name: str = "metrics"):
+        self.name = name
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Records duration of a single execution of a stage
+
+        Args:
+            stage:          name of stage
+            seconds:        duration in seconds
+        """
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.add(seconds)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """
+        Times enclosed block as an execution of a stage; blocks exiting
+        with an exception are counted as `<stage>.errors` instead
+
+        Args:
+            stage:          name of stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except:
+            self.count(f"{stage}.errors")
+            raise
+        self.observe(stage, time.perf_counter() - start)
+
+    def iterate(self, stage: str, iterable: Iterable) -> Iterator:
+        """
+        Generator. Yields items of iterable timing retrieval of each one
+        as an execution of a stage, e.g. reading a chunk from a file
+
+        Args:
+            stage:          name of stage
+            iterable:       iterable to time
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def count(self, counter: str, n: int = 1) -> None:
+        """
+        Increments a counter
+
+        Args:
+            counter:        name of counter
+            n:              increment
+        """
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return dict(
+                name=self.name,
+                started=self.started,
+                elapsed=time.time() - self.started,
+                stages={
+                    stage: histogram.to_dict()
+                    for stage, histogram in self.histograms.items()
+                },
+                counters=dict(self.counters),
+            )
+
+    def summary(self) -> str:
+        """
+        Returns table of stage latencies in milliseconds followed by counters
+        """
+        data = self.to_dict()
+        width = max([len(stage) for stage in data["stages"]] + [5])
+        lines = [
+            f"{self.name} metrics ({data['elapsed']:.1f} sec):",
+            f"{'stage':<{width}} {'count':>8} {'total s':>9} {'mean ms':>9} "
+            f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+        ]
+        for stage, h in data["stages"].items():
+            lines.append(
+                f"{stage:<{width}} {h['count']:>8} {h['total']:>9.2f} "
+                f"{h['mean'] * 1000:>9.2f} {h['p50'] * 1000:>9.2f} "
+                f"{h['p90'] * 1000:>9.2f} {h['p99'] * 1000:>9.2f} "
+                f"{h['max'] * 1000:>9.2f}"
+            )
+        for counter, n in sorted(data["counters"].items()):
+            lines.append(f"{counter}: {n}")
+        return "\n".join(lines)
+
+    def save(self, fh: str) -> None:
+        """
+        Writes metrics to a JSON file
+
+        Args:
+            fh:             path to output file
+        """
+        with open(fh, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics discarding all observations, stand-in used when caller
+    does not collect metrics
+    """
+
+    def observe(self, stage: str, seconds: float) -> None:
+        pass
+
+    def count(self, counter: str, n: int = 1) -> None:
+        pass
+
+
+def report(metrics: Optional[Metrics], metrics_fh: Optional[str] = None) -> None:
+    """
+    Prints metrics summary and optionally saves them as JSON
+
+    Args:
+        metrics:            `Metrics` instance, nothing is done if None
+        metrics_fh:         path to JSON output file
+    """
+    if metrics is None:
+        return
+    print(metrics.summary())
+    if metrics_fh:
+        metrics.save(metrics_fh)
+        print(f"Metrics saved to {metrics_fh}")
@@ -0,0 +1,267 @@
+"""
+Columnar export of NYPL matching data and aggregate stats computed on it.
+Parquet files are read only for the needed columns, so summaries take
+seconds instead of full scans of the SQLite tables.
+"""
+import os
+import time
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sqlalchemy import Integer, func, select
+
+try:
+    from .nyp_datastore import (
+        OUTCOMES,
+        HoldDelete,
+        OclcMatch,
+        SierraBib,
+        SierraBibOcns,
+    )
+    from .db_access import get_cached_engine
+except ImportError:
+    from nyp_datastore import (
+        OUTCOMES,
+        HoldDelete,
+        OclcMatch,
+        SierraBib,
+        SierraBibOcns,
+    )
+    from db_access import get_cached_engine
+
+
+CHUNK_SIZE = 100000
+
+# Arrow schemas of exported tables; tables not listed in `PARTITIONS`
+# are written as a single unpartitioned dataset
+SCHEMAS = {
+    "oclc_match": pa.schema(
+        [
+            ("mid", pa.int64()),
+            ("bibNo", pa.int64()),
+            ("reportId", pa.int32()),
+            ("isOcnProcess", pa.bool_()),
+            ("statusId", pa.int8()),
+            ("procDate", pa.date32()),
+            ("ocn", pa.int64()),
+            ("changedOcn", pa.bool_()),
+        ]
+    ),
+    "sierra_bib": pa.schema(
+        [
+            ("bibNo", pa.int64()),
+            ("title", pa.string()),
+            ("isResearch", pa.bool_()),
+            ("bibCode3", pa.string()),
+            ("bibFormat", pa.string()),
+        ]
+    ),
+    "sierra_bib_ocns": pa.schema(
+        [
+            ("soid", pa.int64()),
+            ("ocn", pa.int64()),
+            ("bibNo", pa.int64()),
+        ]
+    ),
+    "hold_delete": pa.schema(
+        [
+            ("ocn", pa.int64()),
+            ("title", pa.string()),
+            ("keep", pa.bool_()),
+        ]
+    ),
+}
+
+PARTITIONS = {
+    "oclc_match": ds.partitioning(
+        pa.schema([("procDate", pa.date32())]), flavor="hive"
+    ),
+}
+
+MODELS = {
+    "oclc_match": OclcMatch,
+    "sierra_bib": SierraBib,
+    "sierra_bib_ocns": SierraBibOcns,
+    "hold_delete": HoldDelete,
+}
+
+
+def _table_columns(model) -> list:
+    # rows of data errors are stored with an empty string as bibNo
+    columns = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Integer):
+            columns.append(func.nullif(column, "").label(column.name))
+        else:
+            columns.append(column)
+    return columns
+
+
+def read_batches(
+    conn, name: str, chunk_size: int = CHUNK_SIZE
+) -> Iterator[pa.RecordBatch]:
+    """
+    Generator. Reads table in chunks converting them into Arrow record batches
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+        name:               name of table to read, see `MODELS`
+        chunk_size:         number of rows in a batch
+    """
+    model = MODELS[name]
+    schema = SCHEMAS[name]
+    result = conn.execution_options(stream_results=True).execute(
+        select(*_table_columns(model))
+    )
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=f.type) for values, f in zip(columns, schema)],
+            schema=schema,
+        )
+
+
+def export_parquet(
+    db: str = "nyp_db.db",
+    out_dir: str = "./files/NYPL/parquet",
+    chunk_size: int = CHUNK_SIZE,
+) -> dict[str, int]:
+    """
+    Exports NYPL datastore tables to Parquet datasets, one directory
+    per table. Matching outcomes are partitioned by report date.
+    Previously exported data of the same tables is replaced.
+
+    Args:
+        db:                 path to NYPL database
+        out_dir:            directory where datasets are written
+        chunk_size:         number of rows read from the database at once
+
+    Returns:
+        number of exported rows of each table
+    """
+    # batches are consumed by Arrow's writer threads, so the connection
+    # must not be bound to the thread that opened it
+    engine = get_cached_engine(db)
+    counts = {}
+    with engine.connect() as conn:
+        for name, schema in SCHEMAS.items():
+            start = time.time()
+            n = 0
+
+            def counted(batches):
+                nonlocal n
+                for batch in batches:
+                    n += batch.num_rows
+                    yield batch
+
+            ds.write_dataset(
+                counted(read_batches(conn, name, chunk_size)),
+                os.path.join(out_dir, name),
+                schema=schema,
+                format="parquet",
+                partitioning=PARTITIONS.get(name),
+                existing_data_behavior="delete_matching",
+            )
+            counts[name] = n
+            print(f"Exported {n} rows of {name} in {time.time() - start:.1f} sec.")
+    return counts
+
+
+def load_table(
+    data_dir: str, name: str, columns: Optional[list[str]] = None
+) -> pd.DataFrame:
+    """
+    Reads exported dataset into a DataFrame
+
+    Args:
+        data_dir:           directory with exported datasets
+        name:               name of table, see `SCHEMAS`
+        columns:            columns to read, all if not given
+    """
+    dataset = ds.dataset(
+        os.path.join(data_dir, name),
+        format="parquet",
+        partitioning=PARTITIONS.get(name),
+    )
+    return dataset.to_table(columns=columns).to_pandas()
+
+
+def latest_outcomes(match: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keeps only the last matching outcome of each bib; records were sent
+    multiple times, so earlier outcomes are superseded. Rows without
+    bib number (data errors) cannot be deduplicated and are all kept.
+
+    Args:
+        match:              `oclc_match` DataFrame with bibNo, procDate,
+                            reportId, and mid columns
+    """
+    known = match["bibNo"].notna()
+    latest = (
+        match[known]
+        .sort_values(["bibNo", "procDate", "reportId", "mid"])
+        .drop_duplicates("bibNo", keep="last")
+    )
+    return pd.concat([latest, match[~known]])
+
+
+def outcome_stats(data_dir: str, latest_only: bool = True) -> dict[str, pd.DataFrame]:
+    """
+    Computes counts of matching outcomes per status, per OCN/full process,
+    and per report date
+
+    Args:
+        data_dir:           directory with exported datasets
+        latest_only:        counts only the last outcome of each bib
+
+    Returns:
+        dictionary of summary tables: 'status', 'process', and 'date'
+    """
+    match = load_table(
+        data_dir,
+        "oclc_match",
+        columns=["mid", "bibNo", "reportId", "isOcnProcess", "statusId", "procDate"],
+    )
+    if latest_only:
+        match = latest_outcomes(match)
+
+    statuses = {v: k for k, v in OUTCOMES.items()}
+    status = pd.Categorical(match["statusId"].map(statuses), categories=list(OUTCOMES))
+    process = match["isOcnProcess"].map({True: "ocn", False: "full"})
+
+    by_status = pd.Series(status).value_counts(sort=False).rename("count").to_frame()
+    by_status.index.name = "status"
+    by_process = pd.crosstab(process.values, status, dropna=False)
+    by_process.index.name = "process"
+    by_process.columns.name = "status"
+    by_date = pd.crosstab(match["procDate"].values, status, dropna=False)
+    by_date.index.name = "procDate"
+    by_date.columns.name = "status"
+    return dict(status=by_status, process=by_process, date=by_date)
+
+
+def print_stats(data_dir: str, latest_only: bool = True) -> None:
+    """
+    Prints summary tables of matching outcomes
+
+    Args:
+        data_dir:           directory with exported datasets
+        latest_only:        counts only the last outcome of each bib
+    """
+    start = time.time()
+    stats = outcome_stats(data_dir, latest_only)
+    for name, table in stats.items():
+        print(f"Outcomes by {name}:")
+        print(table.to_string())
+        print()
+    print(f"Took {time.time() - start:.1f} sec.")
+
+
+if __name__ == "__main__":
+    export_parquet()
+    print_stats("./files/NYPL/parquet")
@@ -1,7 +1,29 @@
-from sqlalchemy import Boolean, Column, Date, ForeignKey, Integer, String, create_engine
+from typing import Optional
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    delete,
+    func,
+    inspect,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
+try:
+    from .db_access import create_indexes, create_sqlite_engine, session_scope
+except ImportError:
+    from db_access import create_indexes, create_sqlite_engine, session_scope
+
 
 Base = declarative_base()
 
@@ -42,6 +64,11 @@ class SierraBibOcns(Base):
     ocn = Column(Integer, nullable=True)
     bibNo = Column(Integer, ForeignKey("sierra_bib.bibNo"), nullable=False)
 
+    __table_args__ = (
+        Index("ix_sierra_bib_ocns_ocn", "ocn"),
+        Index("ix_sierra_bib_ocns_bibNo", "bibNo"),
+    )
+
 
 class OclcMatch(Base):
     """
@@ -59,6 +86,13 @@ class OclcMatch(Base):
     ocn = Column(Integer)
     changedOcn = Column(Boolean)
 
+    __table_args__ = (
+        Index("ix_oclc_match_bibNo_procDate", "bibNo", "procDate"),
+        Index("ix_oclc_match_procDate", "procDate"),
+        Index("ix_oclc_match_statusId", "statusId"),
+        Index("ix_oclc_match_reportId_bibNo", "reportId", "bibNo"),
+    )
+
     def __repr__(self):
         return (
             f"<OclcMatch(mid='mid', bibNo='{self.bibNo}', reportId='{self.reportId}, "
@@ -67,6 +101,26 @@ class OclcMatch(Base):
         )
 
 
+class LatestOutcome(Base):
+    """
+    Last OCLC matching outcome of each bib, materialized copy of the
+    newest `OclcMatch` row by procDate, reportId, and mid
+    """
+
+    __tablename__ = "latest_outcome"
+
+    bibNo = Column(Integer, primary_key=True, autoincrement=False)
+    mid = Column(Integer, ForeignKey("oclc_match.mid"), nullable=False)
+    reportId = Column(Integer, ForeignKey("report.rid"), nullable=False)
+    isOcnProcess = Column(Boolean, nullable=False)
+    statusId = Column(Integer, ForeignKey("status.sid"), nullable=False)
+    procDate = Column(Date, nullable=False)
+    ocn = Column(Integer)
+    changedOcn = Column(Boolean)
+
+    __table_args__ = (Index("ix_latest_outcome_statusId", "statusId"),)
+
+
 class Report(Base):
     """
     Report file handles
@@ -103,14 +157,122 @@ class HoldDelete(Base):
     keep = Column(Boolean, nullable=False, default=False)
 
 
-def get_engine(db: str = "nyp_db.db"):
-    return create_engine(f"sqlite:///{db}")
+def get_engine(db: str = "nyp_db.db", profile: str = "default"):
+    return create_sqlite_engine(db, profile)
+
+
+def add_indexes(db: str = "nyp_db.db") -> list[str]:
+    """
+    Adds missing indexes to an existing datastore
+
+    Args:
+        db:                 path to NYPL database
+
+    Returns:
+        names of created indexes
+    """
+    engine = get_engine(db)
+    created = create_indexes(engine, Base.metadata)
+    engine.dispose()
+    return created
+
+
+def _latest_outcomes_query(reportIds: Optional[list[int]] = None):
+    # newest row of each bib; rows of data errors have no bib number;
+    # given reports only select bibs to rank, so other rows are not scanned
+    columns = [c.name for c in LatestOutcome.__table__.columns]
+    rank = (
+        func.row_number()
+        .over(
+            partition_by=OclcMatch.bibNo,
+            order_by=(
+                OclcMatch.procDate.desc(),
+                OclcMatch.reportId.desc(),
+                OclcMatch.mid.desc(),
+            ),
+        )
+        .label("rank")
+    )
+    ranked = select(*[getattr(OclcMatch, c) for c in columns], rank).where(
+        OclcMatch.bibNo != ""
+    )
+    if reportIds is not None:
+        affected = (
+            select(OclcMatch.bibNo)
+            .where(OclcMatch.reportId.in_(reportIds))
+            .scalar_subquery()
+        )
+        ranked = ranked.where(OclcMatch.bibNo.in_(affected))
+    ranked = ranked.subquery()
+    return columns, select(*[ranked.c[c] for c in columns]).where(ranked.c.rank == 1)
+
+
+def build_latest_outcomes(conn: Connection) -> int:
+    """
+    Rebuilds `latest_outcome` table from all matching outcomes
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+
+    Returns:
+        number of bibs in the table
+    """
+    LatestOutcome.__table__.create(conn, checkfirst=True)
+    conn.execute(delete(LatestOutcome))
+    columns, query = _latest_outcomes_query()
+    result = conn.execute(LatestOutcome.__table__.insert().from_select(columns, query))
+    return result.rowcount
+
+
+def update_latest_outcomes(conn: Connection, reportIds: list[int]) -> int:
+    """
+    Updates `latest_outcome` table with outcomes of newly ingested reports.
+    Stored outcome of a bib is replaced only if the new one comes later
+    by procDate, reportId, and mid. The table is built from scratch
+    if it does not exist yet.
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+        reportIds:          `Report.rid` of ingested reports
+
+    Returns:
+        number of inserted or updated bibs
+    """
+    if not inspect(conn).has_table(LatestOutcome.__tablename__):
+        return build_latest_outcomes(conn)
+
+    columns, query = _latest_outcomes_query(reportIds)
+    stmt = sqlite_insert(LatestOutcome).from_select(columns, query)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["bibNo"],
+        set_={c: stmt.excluded[c] for c in columns if c != "bibNo"},
+        where=(
+            tuple_(stmt.excluded.procDate, stmt.excluded.reportId, stmt.excluded.mid)
+            > tuple_(LatestOutcome.procDate, LatestOutcome.reportId, LatestOutcome.mid)
+        ),
+    )
+    return conn.execute(stmt).rowcount
+
+
+def find_latest_by_status(conn: Connection, status: str) -> list[int]:
+    """
+    Finds bibs whose last matching outcome has given status
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+        status:             outcome category, see `OUTCOMES`
+
+    Returns:
+        list of bib numbers
+    """
+    stmt = select(LatestOutcome.bibNo).where(LatestOutcome.statusId == OUTCOMES[status])
+    return conn.execute(stmt).scalars().all()
 
 
 def init_datastore(db: str = "nyp_db.db"):
     """Initiates datastore"""
 
-    engine = create_engine(f"sqlite:///{db}")
+    engine = get_engine(db)
     Base.metadata.create_all(engine)
     with session_scope(db) as session:
         for k, v in OUTCOMES.items():
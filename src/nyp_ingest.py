@@ -1,9 +1,17 @@
 import csv
 from datetime import datetime, date
+import multiprocessing as mp
+from multiprocessing.pool import Pool
 import os
-from typing import Optional
+from queue import Empty, Full
+import threading
+from typing import Iterator, Optional
 import time
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.engine import Connection
@@ -17,8 +25,10 @@ try:
         SierraBib,
         SierraBibOcns,
         get_engine,
-        session_scope,
+        update_latest_outcomes,
     )
+    from .db_access import chunked
+    from .metrics import Metrics, NullMetrics
 except ImportError:
     from nyp_datastore import (
         OUTCOMES,
@@ -28,8 +38,13 @@ except ImportError:
         SierraBib,
         SierraBibOcns,
         get_engine,
-        session_scope,
+        update_latest_outcomes,
     )
+    from db_access import chunked
+    from metrics import Metrics, NullMetrics
+
+
+CHUNK_SIZE = 10000
 
 
 def add_report(conn: Connection, handle: str) -> int:
@@ -147,66 +162,509 @@ def ocn_str2int(ocn_str: str) -> Optional[int]:
         return None
 
 
-def read_deletions(fh: str) -> None:
+# vectorized counterparts of the scalar normalizers above operating on
+# whole columns with Arrow compute kernels; values the kernels could treat
+# differently from Python string methods (non-ASCII text, unusual number
+# formats) fall back to the scalar functions, so results are identical
+
+_OCN_PREFIX = r"^(?i:ocm|ocn|on|\(ocolc\))"
+_PLAIN_INT = r"^-?[0-9]{1,18}$"
+# ASCII values not matching this are rejected by int() for sure
+_MAYBE_INT = r"^[\t\n\v\f\r \x1c-\x1f]*[+-]?[0-9_]+[\t\n\v\f\r \x1c-\x1f]*$"
+_TITLE_PUNCTUATION = ".,:;/\\'\""
+
+
+def _to_arrow(values: pd.Series) -> pa.Array:
+    return pa.array(values, type=pa.string(), from_pandas=True)
+
+
+def _strs2int(values: pa.Array, index: pd.Index) -> pd.Series:
+    plain = pc.fill_null(pc.match_substring_regex(values, _PLAIN_INT), False)
+    ints = pc.cast(pc.if_else(plain, values, pa.scalar(None, pa.string())), pa.int64())
+    result = pd.Series(ints.to_pylist(), index=index, dtype=object)
+    maybe = pc.or_(
+        pc.match_substring_regex(values, _MAYBE_INT),
+        pc.invert(pc.string_is_ascii(values)),
+    )
+    other = pc.and_(pc.invert(plain), pc.fill_null(maybe, False))
+    if pc.any(other).as_py():
+        fallback = [ocn_str2int(v) for v in values.filter(other).to_pylist()]
+        mask = other.to_numpy(zero_copy_only=False)
+        result[mask] = pd.Series(fallback, index=index[mask], dtype=object)
+    return result
+
+
+def ocn_strs2int(values: pd.Series) -> pd.Series:
+    """
+    Vectorized `ocn_str2int`
+
+    Args:
+        values:             column of strings
+
+    Returns:
+        column of integers or None, as objects
+    """
+    return _strs2int(_to_arrow(values), values.index)
+
+
+def norm_ocns(values: pd.Series) -> pd.Series:
+    """
+    Vectorized `norm_ocn`
+
+    Args:
+        values:             column of OCN strings
+
+    Returns:
+        column of integers or None, as objects
     """
-    Parses, normalizes and stores in db OCLC deletion report
+    stripped = pc.replace_substring_regex(_to_arrow(values), _OCN_PREFIX, "")
+    return _strs2int(stripped, values.index)
+
+
+def norm_titles(values: pd.Series) -> pd.Series:
     """
-    engine = get_engine()
+    Vectorized `norm_title`
+
+    Args:
+        values:             column of title strings
+
+    Returns:
+        column of normalized titles
+    """
+    original = _to_arrow(values)
+    titles = pc.list_element(pc.split_pattern(original, "@", max_splits=1), 0)
+    for char in _TITLE_PUNCTUATION:
+        titles = pc.replace_substring(titles, char, "")
+    titles = pc.utf8_trim_whitespace(pc.utf8_lower(titles))
+    result = titles.to_pandas().set_axis(values.index)
+    other = pc.invert(pc.fill_null(pc.string_is_ascii(original), True))
+    if pc.any(other).as_py():
+        fallback = [norm_title(v) for v in original.filter(other).to_pylist()]
+        mask = other.to_numpy(zero_copy_only=False)
+        result[mask] = pd.Series(fallback, index=values.index[mask], dtype=object)
+    return result
+
+
+def find_oclc_ids_frame(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized `find_oclc_ids`; extracts OCNs from Sierra export rows
+
+    Args:
+        rows:               Sierra export rows with columns numbered
+                            as in the export
+
+    Returns:
+        frame of unique pairs of row index and OCN in 'row' and 'ocn' columns
+    """
+    values = [_to_arrow(rows[2])]
+    positions = [np.arange(len(rows))]
+    # 035 and 991 tags are repeatable
+    for column in (3, 5):
+        split = pc.split_pattern(_to_arrow(rows[column]), "@")
+        values.append(pc.list_flatten(split))
+        positions.append(pc.list_parent_indices(split).to_numpy())
+    values = pa.concat_arrays(values)
+    ocns = norm_ocns(pd.Series(values.to_pandas()))
+    found = pd.DataFrame(
+        {"row": rows.index[np.concatenate(positions)], "ocn": ocns.to_numpy()}
+    )
+    found = found[found["ocn"].notna()]
+    return found.drop_duplicates().reset_index(drop=True)
+
+
+def read_deletions(
+    fh: str,
+    chunk_size: int = CHUNK_SIZE,
+    db: str = "nyp_db.db",
+    metrics: Optional[Metrics] = None,
+) -> None:
+    """
+    Parses, normalizes and stores in db OCLC deletion report.
+    Rows are written in chunks, each with a single executemany
+    inside its own transaction.
+
+    Args:
+        fh:                 path to deletion report
+        chunk_size:         number of rows written per transaction
+        db:                 path to NYPL database
+        metrics:            `Metrics` instance recording duration of stages,
+                            not collected if not given
+    """
+    if metrics is None:
+        metrics = NullMetrics()
+    engine = get_engine(db, profile="bulk-load")
     with engine.connect() as conn:
         with open(fh, "r") as f:
             print(f"Processing {fh}.")
             reader = csv.reader(f, delimiter="|")
             n = 0
-            for row in reader:
-                n += 1
-                ocn = norm_ocn(row[0])
-                title = norm_title(row[1])
-                stmt = insert(HoldDelete).values(
-                    ocn=ocn,
-                    title=title,
-                )
-                conn.execute(stmt)
+            for rows in metrics.iterate("read", chunked(reader, chunk_size)):
+                with metrics.stage("parse"):
+                    chunk = [
+                        dict(ocn=norm_ocn(row[0]), title=norm_title(row[1]))
+                        for row in rows
+                    ]
+                with metrics.stage("write"), conn.begin():
+                    conn.execute(insert(HoldDelete), chunk)
+                n += len(chunk)
+            metrics.count("rows", n)
             print(f"Saved {n} rows.")
 
 
-def read_report(fh: str) -> None:
+def parse_report_rows(
+    reader: Iterator[list], reportId: int, isOcnProcess: bool, procDate: date
+) -> Iterator[dict]:
+    """
+    Generator. Normalizes BibProcessingReport rows into `OclcMatch` values
+
+    Args:
+        reader:             csv reader over report rows
+        reportId:           `Report.rid` of the parsed file
+        isOcnProcess:       True if report comes from OCN matching process
+        procDate:           date of the report
+
+    Yields:
+        dictionary of `OclcMatch` column values
+    """
+    for row in reader:
+        control_no = norm_ocn(row[2])
+        ocn = norm_ocn(row[3])
+        yield dict(
+            bibNo=row[1][2:-1],
+            reportId=reportId,
+            isOcnProcess=isOcnProcess,
+            statusId=get_status_id(row[4]),
+            procDate=procDate,
+            ocn=ocn,
+            changedOcn=is_ocn_changed(control_no, ocn),
+        )
+
+
+def parse_report_chunk(
+    rows: list[list], reportId: int, isOcnProcess: bool, procDate: date
+) -> list[dict]:
+    """
+    Vectorized `parse_report_rows`; normalizes a block of
+    BibProcessingReport rows in one call
+
+    Args:
+        rows:               report rows
+        reportId:           `Report.rid` of the parsed file
+        isOcnProcess:       True if report comes from OCN matching process
+        procDate:           date of the report
+
+    Returns:
+        list of dictionaries of `OclcMatch` column values
+    """
+    frame = pd.DataFrame(rows, dtype=object)
+    control_nos = norm_ocns(frame[2]).tolist()
+    ocns = norm_ocns(frame[3]).tolist()
+    statuses = {status: get_status_id(status) for status in frame[4].unique()}
+    return [
+        dict(
+            bibNo=bibNo,
+            reportId=reportId,
+            isOcnProcess=isOcnProcess,
+            statusId=statuses[status],
+            procDate=procDate,
+            ocn=ocn,
+            changedOcn=is_ocn_changed(control_no, ocn),
+        )
+        for bibNo, status, control_no, ocn in zip(
+            frame[1].str[2:-1], frame[4], control_nos, ocns
+        )
+    ]
+
+
+def read_report(
+    fh: str,
+    chunk_size: int = CHUNK_SIZE,
+    db: str = "nyp_db.db",
+    metrics: Optional[Metrics] = None,
+) -> int:
+    """
+    Parses, normalizes and stores in db OCLC BibProcessingReport.
+    Rows are written in chunks, each with a single executemany
+    inside its own transaction. Latest outcomes of the report's bibs
+    are updated afterwards.
+
+    Args:
+        fh:                 path to BibProcessingReport
+        chunk_size:         number of rows written per transaction
+        db:                 path to NYPL database
+        metrics:            `Metrics` instance recording duration of stages,
+                            not collected if not given
+
+    Returns:
+        number of saved rows
+    """
     start = time.time()
-    engine = get_engine()
+    if metrics is None:
+        metrics = NullMetrics()
+    engine = get_engine(db, profile="bulk-load")
     with engine.connect() as conn:
         with open(fh, "r") as f:
             print(f"Processing {fh}.")
-            reportId = add_report(conn, fh)
+            with conn.begin():
+                reportId = add_report(conn, fh)
             isOcnProcess = is_ocn_process(fh)
             procDate = get_file_date(fh)
             reader = csv.reader(f, delimiter="|")
             n = 0
-            for row in reader:
-                n += 1
-                bibNo = row[1][2:-1]
-                control_no = norm_ocn(row[2])
-                ocn = norm_ocn(row[3])
-                statusId = get_status_id(row[4])
-
-                changedOcn = is_ocn_changed(control_no, ocn)
-
-                stmt = insert(OclcMatch).values(
-                    bibNo=bibNo,
-                    reportId=reportId,
-                    isOcnProcess=isOcnProcess,
-                    statusId=statusId,
-                    procDate=procDate,
-                    ocn=ocn,
-                    changedOcn=changedOcn,
-                )
-                conn.execute(stmt)
+            for rows in metrics.iterate("read", chunked(reader, chunk_size)):
+                with metrics.stage("parse"):
+                    chunk = parse_report_chunk(rows, reportId, isOcnProcess, procDate)
+                with metrics.stage("write"), conn.begin():
+                    conn.execute(insert(OclcMatch), chunk)
+                n += len(chunk)
+            metrics.count("rows", n)
 
             print(f"Saved {n} rows.")
+            with metrics.stage("update_latest"), conn.begin():
+                updated = update_latest_outcomes(conn, [reportId])
+            print(f"Updated latest outcome of {updated} bibs.")
     end = time.time()
-    print(f"Took {end-start} sec to process.")
+    elapsed = end - start
+    rate = n / elapsed if elapsed else 0.0
+    print(f"Took {elapsed} sec to process ({rate:.0f} rows/sec).")
+    return n
+
+
+def _init_parse_worker(queue: mp.Queue, writer_failed) -> None:
+    global _batch_queue, _writer_failed
+    _batch_queue = queue
+    _writer_failed = writer_failed
+
+
+def _put_batch(batch: list[dict]) -> None:
+    # a full queue may never drain if the writer is gone, so waiting
+    # is interrupted to check whether the run was aborted
+    while True:
+        if _writer_failed.is_set():
+            raise RuntimeError("Writer process failed, parsing stopped.")
+        try:
+            _batch_queue.put(batch, timeout=1)
+            return
+        except Full:
+            pass
+
+
+def _parse_report_worker(args: tuple) -> tuple[str, int, float]:
+    """
+    Pool worker. Parses a single report and puts batches of normalized
+    rows on the writer's queue. Returns number of rows and seconds spent
+    on parsing, excluding waits for the writer.
+    """
+    fh, reportId, chunk_size = args
+    parsing = 0.0
+    with open(fh, "r") as f:
+        reader = csv.reader(f, delimiter="|")
+        isOcnProcess = is_ocn_process(fh)
+        procDate = get_file_date(fh)
+        n = 0
+        for rows in chunked(reader, chunk_size):
+            start = time.perf_counter()
+            chunk = parse_report_chunk(rows, reportId, isOcnProcess, procDate)
+            parsing += time.perf_counter() - start
+            _put_batch(chunk)
+            n += len(chunk)
+    return fh, n, parsing
+
+
+def _write_batches(queue: mp.Queue, db: str, failed) -> None:
+    """
+    Writer process. Drains queue of `OclcMatch` row batches into the
+    database until a `None` sentinel is received. Sets `failed` event
+    on error, so parsing workers stop.
+    """
+    try:
+        engine = get_engine(db, profile="bulk-load")
+        with engine.connect() as conn:
+            for batch in iter(queue.get, None):
+                with conn.begin():
+                    conn.execute(insert(OclcMatch), batch)
+    except:
+        failed.set()
+        raise
 
 
-def read_sierra_export(fh: str) -> None:
+def _join_pool(pool: Pool, queue: mp.Queue, writer: mp.Process) -> None:
+    """
+    Waits for closed pool to finish. Workers exit only once their queued
+    batches are flushed to the writer, so if the writer is gone the queue
+    is drained and the batches discarded.
+    """
+    joiner = threading.Thread(target=pool.join)
+    joiner.start()
+    while joiner.is_alive():
+        if writer.is_alive():
+            joiner.join(timeout=1)
+        else:
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+
+
+def ingest_reports(
+    fdir: str,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    db: str = "nyp_db.db",
+    metrics: Optional[Metrics] = None,
+) -> int:
+    """
+    Parses all BibProcessingReports found in a directory in a pool of
+    worker processes. Parsed batches are written to the database by a single
+    writer process to avoid SQLite lock contention. Latest outcomes
+    of all parsed bibs are updated once all reports are written.
+
+    Args:
+        fdir:               directory with BibProcessingReports
+        workers:            number of parsing processes, defaults to
+                            number of CPUs
+        chunk_size:         number of rows in a batch passed to the writer
+        db:                 path to NYPL database
+        metrics:            `Metrics` instance recording parsing time
+                            of each report and duration of other stages,
+                            not collected if not given
+
+    Returns:
+        number of parsed rows
     """
+    start = time.time()
+    if metrics is None:
+        metrics = NullMetrics()
+    workers = workers or os.cpu_count() or 1
+    reports = find_bib_proc_reports(fdir)
+    print(f"Identified {len(reports)} reports in {fdir}")
+
+    engine = get_engine(db, profile="bulk-load")
+    with engine.begin() as conn:
+        tasks = [(fh, add_report(conn, fh), chunk_size) for fh in reports]
+    engine.dispose()
+
+    queue = mp.Queue(maxsize=workers * 2)
+    failed = mp.Event()
+    writer = mp.Process(target=_write_batches, args=(queue, db, failed))
+    writer.start()
+    pool = mp.Pool(workers, initializer=_init_parse_worker, initargs=(queue, failed))
+    total = 0
+    try:
+        results = pool.imap_unordered(_parse_report_worker, tasks)
+        for _ in tasks:
+            while True:
+                try:
+                    fh, n, parsing = results.next(timeout=1)
+                    break
+                except mp.TimeoutError:
+                    if not writer.is_alive():
+                        raise RuntimeError(
+                            "Writer process failed with exit code "
+                            f"{writer.exitcode}."
+                        )
+            metrics.observe("parse_report", parsing)
+            metrics.count("reports")
+            total += n
+            print(f"Parsed {n} rows from {fh}.")
+    except:
+        # remaining workers stop at their next batch
+        failed.set()
+        raise
+    finally:
+        # workers must exit on their own to flush batches buffered
+        # in the queue, terminating them would lose data
+        pool.close()
+        _join_pool(pool, queue, writer)
+        while writer.is_alive():
+            try:
+                queue.put(None, timeout=1)
+                break
+            except Full:
+                pass
+        writer.join()
+        if writer.exitcode != 0:
+            # sentinel may never be consumed
+            queue.cancel_join_thread()
+
+    if writer.exitcode != 0:
+        raise RuntimeError(f"Writer process failed with exit code {writer.exitcode}.")
+
+    metrics.count("rows", total)
+    with metrics.stage("update_latest"), engine.begin() as conn:
+        updated = update_latest_outcomes(conn, [reportId for _, reportId, _ in tasks])
+    engine.dispose()
+    print(f"Updated latest outcome of {updated} bibs.")
+
+    end = time.time()
+    elapsed = end - start
+    rate = total / elapsed if elapsed else 0.0
+    print(f"Saved {total} rows.")
+    print(f"Took {elapsed} sec to process ({rate:.0f} rows/sec).")
+    return total
+
+
+def parse_sierra_export_rows(
+    reader: Iterator[list],
+) -> Iterator[tuple[dict, list[dict]]]:
+    """
+    Generator. Normalizes Sierra export rows
+
+    Args:
+        reader:             csv reader over Sierra export rows
+
+    Yields:
+        tuple of `SierraBib` values and list of `SierraBibOcns` values
+    """
+    for row in reader:
+        bibNo = row[0][1:-1]
+        bib = dict(
+            bibNo=bibNo, title=norm_title(row[1]), isResearch=is_research(row[4])
+        )
+        ocns = [dict(ocn=o, bibNo=bibNo) for o in find_oclc_ids(row)]
+        yield bib, ocns
+
+
+def parse_sierra_export_chunk(rows: list[list]) -> tuple[list[dict], list[dict]]:
+    """
+    Vectorized `parse_sierra_export_rows`; normalizes a block of Sierra
+    export rows in one call
+
+    Args:
+        rows:               Sierra export rows
+
+    Returns:
+        tuple of list of `SierraBib` values and list of `SierraBibOcns` values
+    """
+    frame = pd.DataFrame(rows, dtype=object)
+    bibNos = frame[0].str[1:-1].tolist()
+    bibs = [
+        dict(bibNo=bibNo, title=title, isResearch=isResearch)
+        for bibNo, title, isResearch in zip(
+            bibNos,
+            norm_titles(frame[1]),
+            frame[4].str.contains("RL", regex=False).tolist(),
+        )
+    ]
+    found = find_oclc_ids_frame(frame)
+    ocns = [
+        dict(ocn=ocn, bibNo=bibNos[row])
+        for row, ocn in zip(found["row"].tolist(), found["ocn"])
+    ]
+    return bibs, ocns
+
+
+def read_sierra_export(
+    fh: str,
+    chunk_size: int = CHUNK_SIZE,
+    db: str = "nyp_db.db",
+    metrics: Optional[Metrics] = None,
+) -> int:
+    """
+    Parses, normalizes and stores in db Sierra bibs and their OCNs.
+    The export is streamed and written in chunks, so memory use does not
+    depend on the size of the file.
+
     Sierra's export config:
         RECORD #(BIBLIO)
         245|a
@@ -218,35 +676,44 @@ def read_sierra_export(fh: str) -> None:
         text qualifier: ""
         field delimiter: ^
         repeated field delimiter: @
+
+    Args:
+        fh:                 path to Sierra export
+        chunk_size:         number of bibs written per transaction
+        db:                 path to NYPL database
+        metrics:            `Metrics` instance recording duration of stages,
+                            not collected if not given
+
+    Returns:
+        number of saved bibs
     """
+    start = time.time()
+    if metrics is None:
+        metrics = NullMetrics()
     with open(fh, "r", encoding="utf-8") as f:
         print(f"Processing {fh}.")
         reader = csv.reader(f, delimiter="^")
         next(reader)  # skip header
-        engine = get_engine()
+        engine = get_engine(db, profile="bulk-load")
         with engine.connect() as conn:
-            for n, row in enumerate(reader):
-                bibNo = row[0][1:-1]
-                title = norm_title(row[1])
-                ocns = find_oclc_ids(row)
-                isResearch = is_research(row[4])
-
-                stmt = insert(SierraBib).values(
-                    bibNo=bibNo, title=title, isResearch=isResearch
-                )
-                conn.execute(stmt)
-                for o in ocns:
-                    stmt = insert(SierraBibOcns).values(ocn=o, bibNo=bibNo)
-                    conn.execute(stmt)
-            print(f"Saved {n} rows.")
+            n = 0
+            for rows in metrics.iterate("read", chunked(reader, chunk_size)):
+                with metrics.stage("parse"):
+                    bibs, ocns = parse_sierra_export_chunk(rows)
+                with metrics.stage("write"), conn.begin():
+                    conn.execute(insert(SierraBib), bibs)
+                    if ocns:
+                        conn.execute(insert(SierraBibOcns), ocns)
+                n += len(rows)
+                metrics.count("rows", len(rows))
+                elapsed = time.time() - start
+                rate = n / elapsed if elapsed else 0.0
+                print(f"Saved {n} rows ({rate:.0f} rows/sec).")
+    return n
 
 
 if __name__ == "__main__":
-    fdir = "./files/NYPL/orig_reports"
-    reports = find_bib_proc_reports(fdir)
-    print(f"Identified {len(reports)} in {fdir}")
-    for report in reports:
-        read_report(report)
+    ingest_reports("./files/NYPL/orig_reports")
 
     # read_deletions(
     #     "./files/NYPL/orig_reports/metacoll.NYP.NYP-1419-20220602-report.20220806-070829.txt"
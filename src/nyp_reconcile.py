@@ -0,0 +1,162 @@
+"""
+Reconciliation of OCLC holdings deletion list with NYPL research bibs.
+OCNs found in research bibs must keep their holdings; titles matching
+research bibs without a shared OCN are listed for manual review.
+"""
+
+import time
+from typing import Iterator, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection
+
+try:
+    from .nyp_datastore import HoldDelete, SierraBib, SierraBibOcns, get_engine
+    from .title_index import TitleIndex
+    from .utils import CsvWriter, start_from_scratch
+except ImportError:
+    from nyp_datastore import HoldDelete, SierraBib, SierraBibOcns, get_engine
+    from title_index import TitleIndex
+    from utils import CsvWriter, start_from_scratch
+
+
+def keep_research_ocns(conn: Connection) -> int:
+    """
+    Flags to keep deletion list OCNs present in any research bib,
+    with a single set-based update
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+
+    Returns:
+        number of newly flagged OCNs
+    """
+    research_ocns = (
+        select(SierraBibOcns.ocn)
+        .join(SierraBib, SierraBib.bibNo == SierraBibOcns.bibNo)
+        .where(SierraBib.isResearch.is_(True))
+    )
+    stmt = (
+        update(HoldDelete)
+        .where(HoldDelete.keep.is_(False), HoldDelete.ocn.in_(research_ocns))
+        .values(keep=True)
+    )
+    return conn.execute(stmt).rowcount
+
+
+def find_title_matches(conn: Connection):
+    """
+    Finds deletion list entries not flagged to keep whose normalized title
+    is identical to title of a research bib
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+
+    Returns:
+        result rows of ocn, title, and bibNo
+    """
+    stmt = (
+        select(HoldDelete.ocn, HoldDelete.title, SierraBib.bibNo)
+        .join(SierraBib, SierraBib.title == HoldDelete.title)
+        .where(
+            HoldDelete.keep.is_(False),
+            HoldDelete.title != "",
+            SierraBib.isResearch.is_(True),
+        )
+        .order_by(HoldDelete.ocn, SierraBib.bibNo)
+    )
+    return conn.execution_options(stream_results=True).execute(stmt)
+
+
+def find_similar_titles(
+    conn: Connection, index: TitleIndex, min_score: float, limit: int = 10
+) -> Iterator[tuple[int, str, int, float]]:
+    """
+    Generator. Finds research bibs with titles similar to titles of
+    deletion list entries not flagged to keep, using title index
+
+    Args:
+        conn:               `sqlalchemy.engine.Connection` instance
+        index:              `TitleIndex` instance
+        min_score:          min similarity of titles, between 0 and 1
+        limit:              max number of candidates considered per title
+
+    Yields:
+        tuples of ocn, title, bibNo, and similarity score
+    """
+    stmt = (
+        select(HoldDelete.ocn, HoldDelete.title)
+        .where(HoldDelete.keep.is_(False), HoldDelete.title != "")
+        .order_by(HoldDelete.ocn)
+    )
+    for ocn, title in conn.execution_options(stream_results=True).execute(stmt):
+        candidates = index.candidates(title, limit, min_score)
+        if not candidates:
+            continue
+        research = set(
+            conn.execute(
+                select(SierraBib.bibNo).where(
+                    SierraBib.bibNo.in_([bibNo for bibNo, _ in candidates]),
+                    SierraBib.isResearch.is_(True),
+                )
+            ).scalars()
+        )
+        for bibNo, score in candidates:
+            if bibNo in research:
+                yield ocn, title, bibNo, round(score, 3)
+
+
+def reconcile_deletions(
+    db: str = "nyp_db.db",
+    review_fh: str = "./files/NYPL/hold-delete-title-matches.csv",
+    min_score: Optional[float] = None,
+) -> dict[str, int]:
+    """
+    Reconciles holdings deletion list against research bibs in one pass.
+    OCN matches are flagged to keep, title matches are written to
+    a review file as ocn, title, bibNo, and score rows. Titles must be
+    identical unless `min_score` is given, then similar titles are found
+    with the title index built by `build_title_index`.
+
+    Args:
+        db:                 path to NYPL database
+        review_fh:          path to csv file with title matches
+        min_score:          min similarity of titles, between 0 and 1
+
+    Returns:
+        dictionary with number of OCN matches, title matches,
+        and OCNs flagged to keep overall
+    """
+    start = time.time()
+    engine = get_engine(db)
+    with engine.begin() as conn:
+        ocn_matches = keep_research_ocns(conn)
+    print(f"Flagged {ocn_matches} OCNs to keep ({time.time() - start:.1f} sec).")
+
+    lap = time.time()
+    start_from_scratch(review_fh)
+    with engine.connect() as conn, CsvWriter(review_fh) as out:
+        out.writerow(["ocn", "title", "bibNo", "score"])
+        if min_score is None:
+            for row in find_title_matches(conn):
+                out.writerow([*row, 1.0])
+        else:
+            index = TitleIndex(db)
+            for row in find_similar_titles(conn, index, min_score):
+                out.writerow(row)
+        title_matches = out.written - 1
+        kept = conn.execute(
+            select(func.count()).where(HoldDelete.keep.is_(True))
+        ).scalar()
+    engine.dispose()
+    print(
+        f"Found {title_matches} title matches for review in {review_fh} "
+        f"({time.time() - lap:.1f} sec)."
+    )
+    print(f"{kept} OCNs flagged to keep in total.")
+    print(f"Took {time.time() - start:.1f} sec to reconcile deletions.")
+    return dict(ocn_matches=ocn_matches, title_matches=title_matches, kept=kept)
+
+
+if __name__ == "__main__":
+    reconcile_deletions()
@@ -1,51 +1,208 @@
+from contextlib import ExitStack
 import csv
 import os
+from typing import Callable, Iterable, NamedTuple, Optional
 
-from utils import save2csv
+try:
+    from .utils import CsvWriter
+except ImportError:
+    from utils import CsvWriter
 
 
-def find_created(fh_in: str, fh_out: str) -> None:
+def whole_row(row: list) -> list:
+    return row
+
+
+def bib_no_only(row: list) -> list:
+    return [row[1]]
+
+
+def changed_oclc_no_row(row: list) -> list:
+    return [row[1][1:], row[2], row[3]]
+
+
+def is_created(row: list) -> bool:
+    return row[-1] == "create"
+
+
+def is_invalid_oclc_no(row: list) -> bool:
+    return row[1] == ""
+
+
+def is_509_error(row: list) -> bool:
+    return row[-1] == "Invalid tag 509."
+
+
+def is_008_38_error(row: list) -> bool:
+    return row[-1] == "Invalid code in Modified Record (008/38)."
+
+
+def is_changed_oclc_no(row: list) -> bool:
+    return row[2] != row[3]
+
+
+class Rule(NamedTuple):
+    """
+    Routes report rows matching predicate to an output file
+
+    Args:
+        name:               rule's name
+        predicate:          function returning True for rows to extract
+        fh_out:             path to output csv file
+        transform:          function converting matching row to output row
+    """
+
+    name: str
+    predicate: Callable[[list], bool]
+    fh_out: str
+    transform: Callable[[list], list] = whole_row
+
+
+# predefined report categories: predicate and output row transformation
+CATEGORIES = {
+    "created": (is_created, whole_row),
+    "invalid_oclc_no": (is_invalid_oclc_no, whole_row),
+    "509_error": (is_509_error, bib_no_only),
+    "008_38_error": (is_008_38_error, bib_no_only),
+    "changed_oclc_no": (is_changed_oclc_no, changed_oclc_no_row),
+}
+
+# categories applicable to each report type and its field delimiter
+REPORT_TYPES = {
+    "processing": (["created", "changed_oclc_no"], "|"),
+    "exception": (["509_error", "008_38_error"], "|"),
+    "enhance": (["created", "invalid_oclc_no"], ","),
+}
+
+
+def category_rule(category: str, fh_out: str) -> Rule:
+    """
+    Creates rule for one of predefined report categories
+
+    Args:
+        category:           one of `CATEGORIES` keys
+        fh_out:             path to output csv file
+    """
+    predicate, transform = CATEGORIES[category]
+    return Rule(category, predicate, fh_out, transform)
+
+
+def detect_report_type(fh_in: str) -> str:
+    """
+    Recognizes type of report by its first row. BibExceptionReports are
+    pipe delimited with 3 columns, BibProcessingReports are pipe delimited
+    with more columns, and enhance reports are comma delimited.
+
+    Args:
+        fh_in:              path to report
+
+    Returns:
+        one of `REPORT_TYPES` keys
+    """
     with open(fh_in, "r") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if row[-1] == "create":
-                save2csv(fh_out, row)
+        line = f.readline()
+    if "|" in line:
+        return "exception" if len(line.split("|")) == 3 else "processing"
+    return "enhance"
+
+
+def scan_reports(
+    fhs_in: Iterable[str], rules: list[Rule], delimiter: str = ","
+) -> dict[str, int]:
+    """
+    Reads each report once routing every row to all rules it matches.
+    Output files are opened once for all reports.
+
+    Args:
+        fhs_in:             paths to reports
+        rules:              list of `Rule` instances
+        delimiter:          field delimiter of reports
+
+    Returns:
+        number of rows written by each rule
+    """
+    counts = {rule.name: 0 for rule in rules}
+    with ExitStack() as stack:
+        sinks = [(rule, stack.enter_context(CsvWriter(rule.fh_out))) for rule in rules]
+        for fh_in in fhs_in:
+            with open(fh_in, "r") as f:
+                reader = csv.reader(f, delimiter=delimiter)
+                for row in reader:
+                    for rule, out in sinks:
+                        if rule.predicate(row):
+                            out.writerow(rule.transform(row))
+                            counts[rule.name] += 1
+    return counts
+
+
+def triage_report(
+    fh_in: str,
+    out_dir: str,
+    categories: Optional[list[str]] = None,
+    extra_rules: Optional[list[Rule]] = None,
+    delimiter: Optional[str] = None,
+    report_type: Optional[str] = None,
+) -> dict[str, int]:
+    """
+    Extracts all requested categories of rows from a report in a single pass.
+    Each category is saved to `[out_dir]/[category].csv`.
+
+    Args:
+        fh_in:              path to report
+        out_dir:            directory for output files
+        categories:         names of predefined categories, all categories
+                            of the report type if not given
+        extra_rules:        additional user-defined rules
+        delimiter:          field delimiter of the report,
+                            defaults to delimiter of the report type
+        report_type:        one of `REPORT_TYPES` keys, recognized from
+                            the report's format if not given
+
+    Returns:
+        number of rows written for each category
+    """
+    if report_type is None:
+        report_type = detect_report_type(fh_in)
+    type_categories, type_delimiter = REPORT_TYPES[report_type]
+    if categories is None:
+        categories = type_categories
+    if delimiter is None:
+        delimiter = type_delimiter
+    rules = [
+        category_rule(category, os.path.join(out_dir, f"{category}.csv"))
+        for category in categories
+    ]
+    if extra_rules:
+        rules.extend(extra_rules)
+    return scan_reports([fh_in], rules, delimiter=delimiter)
+
+
+def find_created(fh_in: str, fh_out: str) -> None:
+    scan_reports([fh_in], [category_rule("created", fh_out)])
 
 
 def find_invalid_oclc_no(fh_in: str, fh_out: str) -> None:
-    with open(fh_in, "r") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if row[1] == "":
-                save2csv(fh_out, row)
+    scan_reports([fh_in], [category_rule("invalid_oclc_no", fh_out)])
 
 
 def find_509_error(fh_in: str, fh_out: str) -> None:
-    with open(fh_in, "r") as f:
-        reader = csv.reader(f, delimiter="|")
-        for row in reader:
-            if row[-1] == "Invalid tag 509.":
-                save2csv(fh_out, [row[1]])
-                # print(row)
+    scan_reports([fh_in], [category_rule("509_error", fh_out)], delimiter="|")
 
 
 def find_008_38_error(fh_in: str, fh_out: str) -> None:
-    with open(fh_in, "r") as f:
-        reader = csv.reader(f, delimiter="|")
-        for row in reader:
-            if row[-1] == "Invalid code in Modified Record (008/38).":
-                save2csv(fh_out, [row[1]])
+    scan_reports([fh_in], [category_rule("008_38_error", fh_out)], delimiter="|")
 
 
 def find_provisional(fdir: str, fh_out: str) -> None:
-    for file in os.listdir(fdir):
-        if "BibUnresolvedCrossRefReport" in os.path.basename(file):
-            print(os.path.basename(file))
-            with open(f"./files/provisional/{file}", "r") as f:
-                reader = csv.reader(f, delimiter="\t")
-                for row in reader:
-                    oclcNo = f"(OCoLC){row[1]}"
-                    save2csv(fh_out, [None, oclcNo])
+    with CsvWriter(fh_out) as out:
+        for file in os.listdir(fdir):
+            if "BibUnresolvedCrossRefReport" in os.path.basename(file):
+                print(os.path.basename(file))
+                with open(f"./files/provisional/{file}", "r") as f:
+                    reader = csv.reader(f, delimiter="\t")
+                    for row in reader:
+                        oclcNo = f"(OCoLC){row[1]}"
+                        out.writerow([None, oclcNo])
 
 
 def find_changed_oclc_no(fdir: str, fh_out: str) -> None:
@@ -56,17 +213,12 @@ def find_changed_oclc_no(fdir: str, fh_out: str) -> None:
         fdir:               directory with Processing Report files
         fh_out:             path to output report
     """
+    fhs_in = []
     for file in os.listdir(fdir):
         if "BibProcessingReport" in os.path.basename(file):
             print(f"Parsing: {os.path.basename(file)}")
-            with open(f"{fdir}/{file}", "r") as f:
-                reader = csv.reader(f, delimiter="|")
-                for row in reader:
-                    bibNo = row[1][1:]
-                    oldOclc = row[2]
-                    newOclc = row[3]
-                    if oldOclc != newOclc:
-                        save2csv(fh_out, [bibNo, oldOclc, newOclc])
+            fhs_in.append(f"{fdir}/{file}")
+    scan_reports(fhs_in, [category_rule("changed_oclc_no", fh_out)], delimiter="|")
 
 
 if __name__ == "__main__":
@@ -78,6 +230,9 @@ if __name__ == "__main__":
     # fh_out = "./files/509/008error.localNos.csv"
     # find_509_error(fh_in, fh_out)
 
+    # fh_in = "./files/509/FullMatch.WL.mrc.BibExceptionReport.txt"
+    # triage_report(fh_in, "./files/509", ["509_error", "008_38_error"])
+
     # fdir = "./files/provisional"
     # fh_out = "./files/provisional/all-provisional.csv"
     # find_provisional(fdir, fh_out)
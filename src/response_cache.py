@@ -0,0 +1,204 @@
+"""
+On-disk cache of API responses, so retried runs reuse already fetched
+payloads instead of spending API quota again.
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    LargeBinary,
+    String,
+    delete,
+    func,
+    select,
+    update,
+)
+from sqlalchemy.ext.declarative import declarative_base
+
+try:
+    from .db_access import get_cached_engine
+except ImportError:
+    from db_access import get_cached_engine
+
+
+Base = declarative_base()
+
+
+class CachedResponse(Base):
+    """
+    Response payload for an identifier requested from an endpoint
+    """
+
+    __tablename__ = "cached_response"
+
+    endpoint = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    content = Column(LargeBinary, nullable=False)
+    created = Column(Float, nullable=False)
+    accessed = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_cached_response_accessed", "accessed"),)
+
+
+class ResponseCache:
+    """
+    Thread-safe cache of response payloads stored in SQLite. Entries
+    older than `ttl` are ignored and least recently used entries are
+    evicted once the cache grows over `max_entries`.
+
+    Args:
+        db:                 path to cache database
+        ttl:                number of seconds entries remain valid
+        max_entries:        max number of entries kept
+    """
+
+    def __init__(
+        self,
+        db: str = "./src/response_cache.db",
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 100000,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.engine = get_cached_engine(db)
+        Base.metadata.create_all(self.engine)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._inserts = 0
+
+    def get(self, endpoint: str, key: str) -> Optional[bytes]:
+        """
+        Returns cached payload or None if not cached or expired
+
+        Args:
+            endpoint:       name of API endpoint
+            key:            requested identifier
+        """
+        now = time.time()
+        with self._lock, self.engine.begin() as conn:
+            row = conn.execute(
+                select(CachedResponse.content, CachedResponse.created).where(
+                    CachedResponse.endpoint == endpoint, CachedResponse.key == key
+                )
+            ).first()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row.created > self.ttl:
+                self.expired += 1
+                self.misses += 1
+                return None
+            conn.execute(
+                update(CachedResponse)
+                .where(CachedResponse.endpoint == endpoint, CachedResponse.key == key)
+                .values(accessed=now)
+            )
+            self.hits += 1
+            return row.content
+
+    def set(self, endpoint: str, key: str, content: bytes) -> None:
+        """
+        Stores payload replacing any previous entry
+
+        Args:
+            endpoint:       name of API endpoint
+            key:            requested identifier
+            content:        response payload
+        """
+        now = time.time()
+        with self._lock, self.engine.begin() as conn:
+            conn.execute(
+                CachedResponse.__table__.insert().prefix_with("OR REPLACE"),
+                dict(
+                    endpoint=endpoint,
+                    key=key,
+                    content=content,
+                    created=now,
+                    accessed=now,
+                ),
+            )
+            self._inserts += 1
+            # checking size on every insert would cost a count per request
+            if self._inserts % 100 == 0:
+                self._evict(conn)
+
+    def cached(
+        self, endpoint: str, key: str, fetch: Callable[[], Optional[bytes]]
+    ) -> Optional[bytes]:
+        """
+        Returns cached payload, calling `fetch` and storing its result
+        on a miss; None returned by `fetch` is not cached
+
+        Args:
+            endpoint:       name of API endpoint
+            key:            requested identifier
+            fetch:          function requesting payload from the API
+        """
+        content = self.get(endpoint, key)
+        if content is None:
+            content = fetch()
+            if content is not None:
+                self.set(endpoint, key, content)
+        return content
+
+    def evict(self) -> int:
+        """
+        Removes expired entries and least recently used entries over
+        the size cap
+
+        Returns:
+            number of removed entries
+        """
+        with self._lock, self.engine.begin() as conn:
+            return self._evict(conn)
+
+    def _evict(self, conn) -> int:
+        result = conn.execute(
+            delete(CachedResponse).where(
+                CachedResponse.created < time.time() - self.ttl
+            )
+        )
+        n = result.rowcount
+        total = conn.execute(select(func.count()).select_from(CachedResponse)).scalar()
+        if total > self.max_entries:
+            cutoff = (
+                select(CachedResponse.accessed)
+                .order_by(CachedResponse.accessed.desc())
+                .offset(self.max_entries)
+                .limit(1)
+                .scalar_subquery()
+            )
+            result = conn.execute(
+                delete(CachedResponse).where(CachedResponse.accessed <= cutoff)
+            )
+            n += result.rowcount
+        self.evicted += n
+        return n
+
+    def stats(self) -> dict:
+        """
+        Returns cache hit statistics
+        """
+        requests = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            expired=self.expired,
+            evicted=self.evicted,
+            hit_rate=self.hits / requests if requests else 0.0,
+        )
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (
+            f"Cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.1%} hit rate), {stats['expired']} expired, "
+            f"{stats['evicted']} evicted."
+        )
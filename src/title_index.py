@@ -0,0 +1,239 @@
+"""
+Inverted index of normalized Sierra bib titles used for title-based
+fallback matching when OCN match fails. Candidates are blocked on shared
+title words, so only bibs sharing at least one selective word are scored.
+"""
+import math
+import time
+from typing import Optional
+
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    String,
+    bindparam,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.declarative import declarative_base
+
+try:
+    from .db_access import get_cached_engine
+    from .nyp_datastore import SierraBib, get_engine
+except ImportError:
+    from db_access import get_cached_engine
+    from nyp_datastore import SierraBib, get_engine
+
+
+Base = declarative_base()
+
+
+class TitleToken(Base):
+    """
+    Title words with number of bibs they appear in and their
+    inverse document frequency
+    """
+
+    __tablename__ = "title_token"
+
+    tid = Column(Integer, primary_key=True)
+    token = Column(String, nullable=False, unique=True)
+    df = Column(Integer, nullable=False)
+    idf = Column(Float, nullable=False)
+
+
+class TitlePosting(Base):
+    """
+    Bibs whose title contains a word
+    """
+
+    __tablename__ = "title_posting"
+
+    tid = Column(Integer, primary_key=True, autoincrement=False)
+    bibNo = Column(Integer, primary_key=True, autoincrement=False)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class TitleNorm(Base):
+    """
+    Length of bib's title vector used to normalize similarity scores
+    """
+
+    __tablename__ = "title_norm"
+
+    bibNo = Column(Integer, primary_key=True, autoincrement=False)
+    norm = Column(Float, nullable=False)
+
+
+def tokenize(title: str) -> set[str]:
+    """
+    Splits title normalized with `norm_title` into unique words
+
+    Args:
+        title:              normalized title
+    """
+    return set(title.split())
+
+
+def _register_math(conn: Connection) -> None:
+    # SQLite is often compiled without math functions
+    dbapi_conn = conn.connection
+    dbapi_conn.create_function("ln", 1, math.log, deterministic=True)
+    dbapi_conn.create_function("sqrt", 1, math.sqrt, deterministic=True)
+
+
+def build_title_index(db: str = "nyp_db.db", chunk_size: int = 10000) -> int:
+    """
+    Builds title index of all Sierra bibs replacing any previous one.
+    Titles are read in chunks; vocabulary, postings, and norms are then
+    computed with set-based queries.
+
+    Args:
+        db:                 path to NYPL database
+        chunk_size:         number of bibs tokenized at once
+
+    Returns:
+        number of indexed bibs
+    """
+    start = time.time()
+    engine = get_engine(db, profile="bulk-load")
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        _register_math(conn)
+        with conn.begin():
+            conn.execute(
+                text("CREATE TEMP TABLE title_stage (token TEXT, bibNo INTEGER)")
+            )
+            last = None
+            n = 0
+            while True:
+                stmt = select(SierraBib.bibNo, SierraBib.title).order_by(
+                    SierraBib.bibNo
+                )
+                if last is not None:
+                    stmt = stmt.where(SierraBib.bibNo > last)
+                rows = conn.execute(stmt.limit(chunk_size)).all()
+                if not rows:
+                    break
+                tokens = [
+                    dict(token=token, bibNo=bibNo)
+                    for bibNo, title in rows
+                    for token in tokenize(title)
+                ]
+                if tokens:
+                    conn.execute(
+                        text("INSERT INTO title_stage VALUES (:token, :bibNo)"),
+                        tokens,
+                    )
+                last = rows[-1].bibNo
+                n += len(rows)
+            print(f"Tokenized {n} titles ({time.time() - start:.1f} sec).")
+
+            total = conn.execute(
+                text("SELECT COUNT(DISTINCT bibNo) FROM title_stage")
+            ).scalar()
+            conn.execute(
+                text(
+                    "INSERT INTO title_token (token, df, idf) "
+                    "SELECT token, COUNT(*), ln(:total * 1.0 / COUNT(*)) "
+                    "FROM title_stage GROUP BY token"
+                ),
+                dict(total=total),
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO title_posting (tid, bibNo) "
+                    "SELECT t.tid, s.bibNo FROM title_stage s "
+                    "JOIN title_token t ON t.token = s.token"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO title_norm (bibNo, norm) "
+                    "SELECT s.bibNo, sqrt(SUM(t.idf * t.idf)) FROM title_stage s "
+                    "JOIN title_token t ON t.token = s.token GROUP BY s.bibNo"
+                )
+            )
+            conn.execute(text("DROP TABLE title_stage"))
+    engine.dispose()
+    print(f"Indexed {total} titles in {time.time() - start:.1f} sec.")
+    return total
+
+
+class TitleIndex:
+    """
+    Query interface of a persisted title index. Candidate bibs are ranked
+    by cosine similarity of their title words weighted by inverse document
+    frequency.
+
+    Args:
+        db:                 path to NYPL database with built title index
+        max_df:             words present in more than this fraction of
+                            titles are not used to find candidates
+    """
+
+    def __init__(self, db: str = "nyp_db.db", max_df: float = 0.05):
+        self.engine = get_cached_engine(db)
+        with self.engine.connect() as conn:
+            self.total = conn.execute(
+                select(func.count()).select_from(TitleNorm)
+            ).scalar()
+        self.max_df = max(1, int(self.total * max_df))
+        self._candidates = text(
+            "SELECT p.bibNo, SUM(t.idf * t.idf) / n.norm AS score "
+            "FROM title_token t "
+            "JOIN title_posting p ON p.tid = t.tid "
+            "JOIN title_norm n ON n.bibNo = p.bibNo "
+            "WHERE t.token IN :tokens AND t.df <= :max_df "
+            "GROUP BY p.bibNo ORDER BY score DESC, p.bibNo LIMIT :limit"
+        ).bindparams(bindparam("tokens", expanding=True))
+
+    def candidates(
+        self, title: str, limit: int = 10, min_score: Optional[float] = None
+    ) -> list[tuple[int, float]]:
+        """
+        Finds bibs with titles similar to given one
+
+        Args:
+            title:          title normalized with `norm_title`
+            limit:          max number of returned candidates
+            min_score:      drops candidates scoring lower, between 0 and 1
+
+        Returns:
+            list of bib numbers and their scores, best match first
+        """
+        tokens = tokenize(title)
+        if not tokens or not self.total:
+            return []
+        with self.engine.connect() as conn:
+            idfs = dict(
+                conn.execute(
+                    select(TitleToken.token, TitleToken.idf).where(
+                        TitleToken.token.in_(tokens)
+                    )
+                ).all()
+            )
+            # words never seen in titles count as the rarest ones
+            unseen = math.log(self.total)
+            query_norm = math.sqrt(
+                sum(idfs.get(token, unseen) ** 2 for token in tokens)
+            )
+            if not idfs or not query_norm:
+                return []
+            rows = conn.execute(
+                self._candidates,
+                dict(tokens=list(idfs), max_df=self.max_df, limit=limit),
+            ).all()
+        scored = [(bibNo, score / query_norm) for bibNo, score in rows]
+        if min_score is not None:
+            scored = [(bibNo, score) for bibNo, score in scored if score >= min_score]
+        return scored
+
+
+if __name__ == "__main__":
+    build_title_index()
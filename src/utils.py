@@ -1,7 +1,10 @@
 import csv
+import gzip
 import os
+import re
+from typing import Optional
 
-from pymarc import Record
+from pymarc import Field, Record
 
 
 def save2csv(dst_fh, row):
@@ -23,9 +26,226 @@ def save2csv(dst_fh, row):
         out.writerow(row)
 
 
-def save2marc(dst_fh: str, record: Record) -> None:
-    with open(dst_fh, "ab") as out:
-        out.write(record.as_marc())
+class CsvWriter:
+    """
+    Buffered csv sink keeping a single handle open for all rows.
+    Use as a context manager. Like `save2csv` it appends to existing files.
+
+    Args:
+        dst_fh:             output file; gzip compressed if it ends with '.gz'
+        flush_every:        flush buffer every n rows
+        compress:           forces gzip compression on or off regardless of
+                            file extension
+    """
+
+    def __init__(
+        self,
+        dst_fh: str,
+        flush_every: Optional[int] = 10000,
+        compress: Optional[bool] = None,
+    ):
+        self.dst_fh = dst_fh
+        self.flush_every = flush_every
+        if compress is None:
+            compress = dst_fh.endswith(".gz")
+        if compress:
+            self._handle = gzip.open(dst_fh, "at", encoding="utf-8")
+        else:
+            self._handle = open(dst_fh, "a", encoding="utf-8")
+        self._writer = csv.writer(
+            self._handle,
+            delimiter=",",
+            lineterminator="\n",
+            quotechar='"',
+            quoting=csv.QUOTE_MINIMAL,
+        )
+        self.written = 0
+        self._unflushed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def writerow(self, row: list) -> None:
+        self._writer.writerow(row)
+        self.written += 1
+        self._unflushed += 1
+        if self.flush_every and self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        self._handle.flush()
+        self._unflushed = 0
+
+    def close(self) -> None:
+        if not self._handle.closed:
+            self._handle.close()
+
+
+class MarcWriter:
+    """
+    Buffered MARC file sink keeping a single handle open for all records.
+    Use as a context manager.
+
+    Args:
+        dst_fh:             output file; when output is rotated parts are
+                            named `[dst_fh stem]-001.mrc`, `-002`, etc.
+        buffer_size:        size of write buffer in bytes, the buffer
+                            is flushed to disk when full
+        flush_every:        flush buffer every n records
+        rotate_every:       start a new output file every n records;
+                            numbering continues from existing part files
+    """
+
+    def __init__(
+        self,
+        dst_fh: str,
+        buffer_size: int = 1024 * 1024,
+        flush_every: Optional[int] = None,
+        rotate_every: Optional[int] = None,
+    ):
+        self.dst_fh = dst_fh
+        self.buffer_size = buffer_size
+        self.flush_every = flush_every
+        self.rotate_every = rotate_every
+        self.written = 0
+        self._handle = None
+        self._handle_fh = None
+        self._unflushed = 0
+        self._existing = self._count_existing() if rotate_every else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _count_existing(self) -> int:
+        # records in parts written by previous runs, the last part is
+        # counted only up to its capacity, so it is not overfilled
+        root, ext = os.path.splitext(self.dst_fh)
+        dirname = os.path.dirname(root) or "."
+        if not os.path.isdir(dirname):
+            return 0
+        pattern = re.compile(
+            re.escape(os.path.basename(root)) + r"-(\d{3,})" + re.escape(ext) + "$"
+        )
+        parts = [
+            int(match.group(1))
+            for match in map(pattern.match, os.listdir(dirname))
+            if match
+        ]
+        if not parts:
+            return 0
+        last = max(parts)
+        records = 0
+        with open(f"{root}-{last:03d}{ext}", "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                records += block.count(b"\x1d")
+        return (last - 1) * self.rotate_every + min(records, self.rotate_every)
+
+    @property
+    def next_fh(self) -> str:
+        """
+        Path to file the next record will be written to
+        """
+        if not self.rotate_every:
+            return self.dst_fh
+        root, ext = os.path.splitext(self.dst_fh)
+        part = (self._existing + self.written) // self.rotate_every + 1
+        return f"{root}-{part:03d}{ext}"
+
+    @property
+    def fh(self) -> Optional[str]:
+        """
+        Path to file records are currently written to
+        """
+        return self._handle_fh
+
+    def tell(self) -> int:
+        """
+        Returns size of current file including buffered data
+        """
+        if self._handle is None:
+            return 0
+        return self._handle.tell()
+
+    def write(self, record: Record) -> None:
+        fh = self.next_fh
+        if fh != self._handle_fh:
+            # rotated out file must be as durable as the current one
+            self.checkpoint()
+            self.close()
+            self._handle = open(fh, "ab", buffering=self.buffer_size)
+            self._handle_fh = fh
+        self._handle.write(record.as_marc())
+        self.written += 1
+        self._unflushed += 1
+        if self.flush_every and self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._handle is not None:
+            self._handle.flush()
+        self._unflushed = 0
+
+    def checkpoint(self) -> None:
+        """
+        Flushes buffer and forces written data to disk
+        """
+        self.flush()
+        if self._handle is not None:
+            os.fsync(self._handle.fileno())
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            self._handle_fh = None
+        self._unflushed = 0
+
+
+def fields2str(fields: list[Field]) -> Optional[str]:
+    """
+    Serializes variable data fields into a compact string using MARC
+    transmission format of field's data (indicators, subfields, and field
+    terminator), for example: '  \x1fa9781234567890\x1fqpbk\x1e'
+
+    Args:
+        fields:             list of `pymarc.Field` instances
+
+    Returns:
+        serialized fields or None if list is empty
+    """
+    if not fields:
+        return None
+    return "".join(field.as_marc("utf-8").decode("utf-8") for field in fields)
+
+
+def str2fields(value: Optional[str], tag: str = "020") -> list[Field]:
+    """
+    Deserializes fields serialized with `fields2str`
+
+    Args:
+        value:              serialized fields
+        tag:                MARC tag of the fields
+
+    Returns:
+        list of `pymarc.Field` instances
+    """
+    fields = []
+    if not value:
+        return fields
+    for data in value.split("\x1e"):
+        if not data:
+            continue
+        subfields = []
+        for subfield in data[2:].split("\x1f")[1:]:
+            subfields.extend([subfield[:1], subfield[1:]])
+        fields.append(Field(tag=tag, indicators=list(data[:2]), subfields=subfields))
+    return fields
 
 
 def start_from_scratch(fh):
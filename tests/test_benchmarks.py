@@ -0,0 +1,66 @@
+import json
+
+from pymarc import MARCReader
+import pytest
+
+from benchmarks import bench, generators
+from src.nyp_ingest import get_file_date, is_ocn_process, read_report
+
+
+def test_generators_are_deterministic():
+    assert list(generators.report_rows(50, seed=3)) == list(
+        generators.report_rows(50, seed=3)
+    )
+    assert list(generators.sierra_export_rows(50, seed=3)) != list(
+        generators.sierra_export_rows(50, seed=4)
+    )
+
+
+@pytest.mark.parametrize("bibNo,expectation", [(11444078, "5"), (10000006, "x")])
+def test_sierra_check_digit(bibNo, expectation):
+    assert generators.sierra_check_digit(bibNo) == expectation
+
+
+def test_report_name():
+    from datetime import date
+
+    name = generators.report_name(date(2022, 8, 3), ocn_process=True)
+    assert get_file_date(name) == date(2022, 8, 3)
+    assert is_ocn_process(name)
+
+
+def test_write_report_is_readable(tmp_path):
+    from src.nyp_datastore import Base, get_engine
+
+    db = str(tmp_path / "nyp_db.db")
+    Base.metadata.create_all(get_engine(db))
+    fh = generators.write_report(str(tmp_path), 100)
+    assert read_report(fh, db=db) == 100
+
+
+def test_write_marc(tmp_path):
+    fh = generators.write_marc(str(tmp_path), 5, seed=1)
+    with open(fh, "rb") as f:
+        records = list(MARCReader(f))
+    assert len(records) == 5
+    assert records[0]["907"]["a"].startswith(".b")
+
+
+def test_run_benchmark(tmp_path):
+    result = bench.run_benchmark("norm_ocns", str(tmp_path), rows=100, repeat=2)
+    assert result["benchmark"] == "norm_ocns"
+    assert result["rows"] == 100
+    assert result["rate"] > 0
+
+
+def test_main_reports_regression(tmp_path, capfd):
+    results_fh = tmp_path / "results.jsonl"
+    results_fh.write_text(
+        json.dumps(dict(benchmark="norm_title", rows=100, rate=1e12, commit="abc"))
+        + "\n"
+    )
+    args = ["--rows", "100", "--repeat", "1", "--only", "norm_title"]
+    assert bench.main(args + ["--results", str(results_fh)]) == 1
+    assert "REGRESSION" in capfd.readouterr().out
+    assert len(results_fh.read_text().splitlines()) == 2
+    assert bench.previous_results(str(results_fh))[("norm_title", 100)]["rate"] < 1e12
@@ -0,0 +1,226 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+pytest.importorskip("bookops_bpl_solr")
+
+from src.bpl_get_ocn import (
+    find_ocnNo,
+    has_duplicate,
+    norm_bibNo,
+    query_solr_concurrently,
+)
+from src.response_cache import ResponseCache
+
+SOLR_DOCS = [
+    {"id": "12031211", "ss_marc_tag_001": "ocm00000001"},
+    {"id": "12031212", "ss_marc_tag_001": "ocn000000002"},
+    {"id": "12031213", "ss_marc_tag_001": "ocn000000002"},
+    {"id": "12031214", "ss_marc_tag_001": "NYPG1234"},
+]
+
+
+class FakeSolrHandler(BaseHTTPRequestHandler):
+    requests_made = 0
+
+    def do_GET(self):
+        type(self).requests_made += 1
+        params = parse_qs(urlparse(self.path).query)
+        field, terms = re.match(r"(\w+):\((.*)\)", params["q"][0]).groups()
+        values = [t.strip('"') for t in terms.split(" OR ")]
+        docs = [d for d in SOLR_DOCS if d.get(field) in values]
+        data = {"response": {"numFound": len(docs), "docs": docs}}
+        if params.get("facet") == ["true"]:
+            counts = {}
+            for doc in docs:
+                counts[doc[field]] = counts.get(doc[field], 0) + 1
+            data["facet_counts"] = {
+                "facet_fields": {field: [x for kv in counts.items() for x in kv]}
+            }
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_solr():
+    FakeSolrHandler.requests_made = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSolrHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/select"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize(
+    "arg,expectation",
+    [("b120312116", "12031211"), (".b12031211a", "12031211"), ("12031211", "12031211")],
+)
+def test_norm_bibNo(arg, expectation):
+    assert norm_bibNo(arg) == expectation
+
+
+def test_query_solr_concurrently(tmp_path, fake_solr):
+    src_fh = tmp_path / "err.csv"
+    src_fh.write_text("b120312116\nb120312128\nb12031213x\nb12031214x\nb99999999x\n")
+    out_fh = tmp_path / "out.csv"
+
+    n = query_solr_concurrently(
+        str(src_fh),
+        str(out_fh),
+        workers=2,
+        batch_size=2,
+        session_factory=requests.Session,
+        endpoint=fake_solr,
+        cache_db=None,
+    )
+
+    assert n == 1
+    assert out_fh.read_text() == "b120312116,ocm00000001\n"
+    # 3 batches, each with one bib lookup and at most one duplicate check
+    assert FakeSolrHandler.requests_made == 5
+
+
+def test_query_solr_concurrently_reuses_cached_responses(tmp_path, fake_solr):
+    src_fh = tmp_path / "err.csv"
+    src_fh.write_text("b120312116\nb120312128\nb12031213x\nb12031214x\nb99999999x\n")
+    cache_db = str(tmp_path / "cache.db")
+
+    for run in ("first", "second"):
+        FakeSolrHandler.requests_made = 0
+        out_fh = tmp_path / f"{run}.csv"
+        n = query_solr_concurrently(
+            str(src_fh),
+            str(out_fh),
+            workers=2,
+            batch_size=2,
+            session_factory=requests.Session,
+            endpoint=fake_solr,
+            cache_db=cache_db,
+        )
+        assert n == 1
+        assert out_fh.read_text() == "b120312116,ocm00000001\n"
+
+    assert FakeSolrHandler.requests_made == 0
+
+
+def test_query_solr_concurrently_session_per_thread(tmp_path, fake_solr):
+    src_fh = tmp_path / "err.csv"
+    src_fh.write_text("\n".join(f"b1203121{i}x" for i in range(1, 9)) + "\n")
+    sessions = []
+
+    class TrackedSession(requests.Session):
+        def __init__(self):
+            super().__init__()
+            self.threads = set()
+            self.closed = False
+            sessions.append(self)
+
+        def get(self, *args, **kwargs):
+            self.threads.add(threading.get_ident())
+            return super().get(*args, **kwargs)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    query_solr_concurrently(
+        str(src_fh),
+        str(tmp_path / "out.csv"),
+        workers=2,
+        batch_size=1,
+        session_factory=TrackedSession,
+        endpoint=fake_solr,
+        cache_db=None,
+    )
+
+    assert 1 <= len(sessions) <= 2
+    assert all(len(session.threads) == 1 for session in sessions)
+    assert all(session.closed for session in sessions)
+
+
+class StubSolrSession:
+    """
+    Sequential lookups served from `SOLR_DOCS`, counting requests
+    """
+
+    def __init__(self):
+        self.requests_made = 0
+
+    def _search(self, field, value):
+        self.requests_made += 1
+        docs = [d for d in SOLR_DOCS if d.get(field) == value]
+        data = {"response": {"numFound": len(docs), "docs": docs}}
+        return type("Response", (), {"json": lambda self: data})()
+
+    def search_bibNo(self, bibNo, **kwargs):
+        return self._search("id", norm_bibNo(bibNo))
+
+    def search_controlNo(self, ocnNo, **kwargs):
+        return self._search("ss_marc_tag_001", ocnNo)
+
+
+def lookup_sequentially(session, bibNos, cache):
+    found = []
+    for bibNo in bibNos:
+        ocn = find_ocnNo(session, bibNo, cache)
+        if ocn is not None and not has_duplicate(session, ocn, cache):
+            found.append([bibNo, ocn])
+    return found
+
+
+BIBNOS = ["b120312116", "b120312128", "b12031213x", "b12031214x", "b99999999x"]
+
+
+def test_sequential_lookup_reuses_batched_lookup_cache(tmp_path, fake_solr):
+    src_fh = tmp_path / "err.csv"
+    src_fh.write_text("\n".join(BIBNOS) + "\n")
+    cache_db = str(tmp_path / "cache.db")
+    query_solr_concurrently(
+        str(src_fh),
+        str(tmp_path / "out.csv"),
+        batch_size=2,
+        session_factory=requests.Session,
+        endpoint=fake_solr,
+        cache_db=cache_db,
+    )
+
+    session = StubSolrSession()
+    found = lookup_sequentially(session, BIBNOS, ResponseCache(cache_db))
+    assert found == [["b120312116", "ocm00000001"]]
+    assert session.requests_made == 0
+
+
+def test_batched_lookup_reuses_sequential_lookup_cache(tmp_path, fake_solr):
+    cache_db = str(tmp_path / "cache.db")
+    session = StubSolrSession()
+    assert lookup_sequentially(session, BIBNOS, ResponseCache(cache_db)) == [
+        ["b120312116", "ocm00000001"]
+    ]
+    assert session.requests_made > 0
+
+    src_fh = tmp_path / "err.csv"
+    src_fh.write_text("\n".join(BIBNOS) + "\n")
+    out_fh = tmp_path / "out.csv"
+    query_solr_concurrently(
+        str(src_fh),
+        str(out_fh),
+        batch_size=2,
+        session_factory=requests.Session,
+        endpoint=fake_solr,
+        cache_db=cache_db,
+    )
+    assert out_fh.read_text() == "b120312116,ocm00000001\n"
+    assert FakeSolrHandler.requests_made == 0
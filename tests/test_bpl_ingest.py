@@ -0,0 +1,101 @@
+import pytest
+from pymarc import Field
+
+pytest.importorskip("bookops_marc")
+
+from src import bpl_ingest
+from src.bpl_datastore import Base, EnhancedBib
+from src.db_access import dispose_engines, get_cached_engine, session_scope
+from src.utils import str2fields
+
+
+class StubBib:
+    def __init__(self, bibNo, bibFormat, opacDisplay, isbns):
+        self.bibNo = bibNo
+        self.bibFormat = bibFormat
+        self.opacDisplay = opacDisplay
+        self.isbns = isbns
+
+    def sierra_bib_id_normalized(self):
+        return str(self.bibNo)
+
+    def sierra_bib_format(self):
+        return self.bibFormat
+
+    def __getitem__(self, tag):
+        assert tag == "998"
+        return {"e": self.opacDisplay}
+
+    def get_fields(self, *tags):
+        return [
+            Field(tag="020", indicators=[" ", " "], subfields=["a", isbn])
+            for isbn in self.isbns
+        ]
+
+
+STUB_BIBS = [
+    StubBib(1, "a", "-", ["9781234567890"]),
+    StubBib(2, "g", "b", []),
+    StubBib(3, "a", "-", []),
+    StubBib(4, "j", "-", ["9780000000001", "9780000000002"]),
+    StubBib(5, "a", "g", []),
+]
+
+
+@pytest.fixture
+def bpl_memory_db(monkeypatch):
+    db = ":memory:"
+    Base.metadata.create_all(get_cached_engine(db))
+    with session_scope(db) as session:
+        session.add_all(
+            [EnhancedBib(bibNo=bibNo, oclcNo=bibNo * 10) for bibNo in (1, 2, 4)]
+        )
+    monkeypatch.setattr(bpl_ingest, "SierraBibReader", lambda marcfile: iter(STUB_BIBS))
+    yield db
+    dispose_engines()
+
+
+def test_parse_sierra_bib(tmp_path, bpl_memory_db):
+    src_fh = tmp_path / "bpl-batch2enrich.out"
+    src_fh.write_bytes(b"")
+    not_found_fh = tmp_path / "not-found.csv"
+
+    # chunks of 2 records mix found and missing bibs
+    updated = bpl_ingest.parse_sierra_bib(
+        str(src_fh), str(not_found_fh), chunk_size=2, db=bpl_memory_db
+    )
+
+    assert updated == 3
+    assert not_found_fh.read_text().splitlines() == ["3", "5"]
+    with session_scope(bpl_memory_db) as session:
+        bibs = session.query(EnhancedBib).order_by(EnhancedBib.bibNo).all()
+        assert [(b.bibNo, b.bibFormat, b.opacDisplay) for b in bibs] == [
+            (1, "a", "-"),
+            (2, "g", "b"),
+            (4, "j", "-"),
+        ]
+        assert [f["a"] for f in str2fields(bibs[2].isbns)] == [
+            "9780000000001",
+            "9780000000002",
+        ]
+        assert bibs[1].isbns is None
+        assert session.query(EnhancedBib).count() == 3
+
+
+def test_parse_sierra_bib_all_found(tmp_path, bpl_memory_db, monkeypatch):
+    monkeypatch.setattr(
+        bpl_ingest,
+        "SierraBibReader",
+        lambda marcfile: iter([b for b in STUB_BIBS if b.bibNo in (1, 2, 4)]),
+    )
+    src_fh = tmp_path / "bpl-batch2enrich.out"
+    src_fh.write_bytes(b"")
+    not_found_fh = tmp_path / "not-found.csv"
+
+    assert (
+        bpl_ingest.parse_sierra_bib(
+            str(src_fh), str(not_found_fh), chunk_size=2, db=bpl_memory_db
+        )
+        == 3
+    )
+    assert not not_found_fh.exists()
@@ -0,0 +1,74 @@
+from src.checkpoint import CheckpointJournal
+
+
+def test_recover_without_journal(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / "journal.csv"))
+    assert journal.recover() == []
+
+
+def test_recover_trims_unjournaled_records(tmp_path):
+    marc_fh = str(tmp_path / "out.mrc")
+    journal = CheckpointJournal(str(tmp_path / "journal.csv"))
+    with open(marc_fh, "wb") as f:
+        f.write(b"committed")
+    journal.reset(marc_fh)
+    with open(marc_fh, "ab") as f:
+        f.write(b"-rec1")
+    journal.record(1, marc_fh, 14)
+    with open(marc_fh, "ab") as f:
+        f.write(b"-rec2")
+    journal.record(2, marc_fh, 19)
+    with open(marc_fh, "ab") as f:
+        f.write(b"-partial")
+
+    assert journal.recover() == [1, 2]
+    with open(marc_fh, "rb") as f:
+        assert f.read() == b"committed-rec1-rec2"
+
+
+def test_recover_trims_to_baseline(tmp_path):
+    marc_fh = str(tmp_path / "out.mrc")
+    journal = CheckpointJournal(str(tmp_path / "journal.csv"))
+    with open(marc_fh, "wb") as f:
+        f.write(b"committed")
+    journal.reset(marc_fh)
+    with open(marc_fh, "ab") as f:
+        f.write(b"-unjournaled")
+
+    assert journal.recover() == []
+    with open(marc_fh, "rb") as f:
+        assert f.read() == b"committed"
+
+
+def test_recover_ignores_interrupted_entry(tmp_path):
+    marc_fh = str(tmp_path / "out.mrc")
+    journal_fh = tmp_path / "journal.csv"
+    with open(marc_fh, "wb") as f:
+        f.write(b"rec1")
+    journal_fh.write_text(f"1,{marc_fh},4\n2,{marc_fh}")
+
+    assert CheckpointJournal(str(journal_fh)).recover() == [1]
+
+
+def test_clear(tmp_path):
+    journal_fh = tmp_path / "journal.csv"
+    journal = CheckpointJournal(str(journal_fh))
+    journal.reset(str(tmp_path / "out.mrc"))
+    assert journal_fh.exists()
+    journal.clear()
+    assert not journal_fh.exists()
+
+
+def test_record_keeps_journal_open(tmp_path):
+    marc_fh = str(tmp_path / "out.mrc")
+    journal_fh = tmp_path / "journal.csv"
+    journal = CheckpointJournal(str(journal_fh))
+    journal.reset(marc_fh)
+    handle = journal._handle
+    journal.record(1, marc_fh, 4)
+    journal.record(2, marc_fh, 8)
+    assert journal._handle is handle
+    journal.checkpoint()
+    assert journal_fh.read_text() == f",{marc_fh},0\n1,{marc_fh},4\n2,{marc_fh},8\n"
+    journal.clear()
+    assert handle.closed
@@ -1,7 +1,50 @@
-from src.db_access import session_scope
-from src.nyp_datastore import OclcMatch
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import os
+import pickle
+import threading
+import time
 
+from pymarc import Field
+import pytest
+from sqlalchemy import insert, select, text
 
+from src.bpl_datastore import (
+    Base as BplBase,
+    EnhancedBib,
+    add_indexes,
+    migrate_isbns,
+)
+from src import db_access
+from src.db_access import (
+    bulk_delete,
+    bulk_upsert,
+    chunked,
+    create_sqlite_engine,
+    delete_instances,
+    dispose_engines,
+    get_cached_engine,
+    get_pragmas,
+    get_session_factory,
+    session_scope,
+)
+from src.nyp_datastore import (
+    Base as NypBase,
+    LatestOutcome,
+    OclcMatch,
+    SierraBib,
+    SierraBibOcns,
+    _latest_outcomes_query,
+    build_latest_outcomes,
+    find_latest_by_status,
+    get_engine as get_nyp_engine,
+    update_latest_outcomes,
+)
+
+
+@pytest.mark.skipif(
+    not os.path.isfile("src/nyp_db.db"), reason="requires production NYP database"
+)
 def test_nyp_datastore():
     with session_scope(db="src/nyp_db.db") as session:
         result = session.query(OclcMatch).filter_by(mid=5048117).one_or_none()
@@ -9,8 +52,273 @@ def test_nyp_datastore():
         assert result.bibNo == 10003403
 
 
+@pytest.mark.skipif(
+    not os.path.isfile("src/bpl_db.db"), reason="requires production BPL database"
+)
 def test_bpl_datastore():
-    with session_scope(db="scr/bpl_db.db") as session:
+    with session_scope(db="src/bpl_db.db") as session:
         result = session.query(EnhancedBib).filter_by(bibNo=10000037).one_or_none()
         assert result is not None
-        asserrt result.oclcNo = 1049552268
+        assert result.oclcNo == 1049552268
+
+
+@pytest.mark.parametrize(
+    "arg1,arg2,expectation",
+    [
+        ([], 2, []),
+        ([1, 2, 3], 2, [[1, 2], [3]]),
+        ((i for i in range(4)), 2, [[0, 1], [2, 3]]),
+    ],
+)
+def test_chunked(arg1, arg2, expectation):
+    assert list(chunked(arg1, arg2)) == expectation
+
+
+def test_chunked_invalid_size():
+    with pytest.raises(ValueError):
+        list(chunked([1], 0))
+
+
+def test_get_pragmas_overrides():
+    pragmas = get_pragmas("bulk-load", synchronous="NORMAL")
+    assert pragmas["synchronous"] == "NORMAL"
+    assert pragmas["journal_mode"] == "WAL"
+
+
+def test_get_pragmas_unknown_profile():
+    with pytest.raises(ValueError):
+        get_pragmas("foo")
+
+
+def test_create_sqlite_engine_applies_pragmas(tmp_path):
+    engine = create_sqlite_engine(str(tmp_path / "foo.db"), "bulk-load")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 0
+        assert conn.execute(text("PRAGMA temp_store")).scalar() == 2
+
+
+def test_get_cached_engine_reuses_engine(tmp_path):
+    db = str(tmp_path / "foo.db")
+    engine = get_cached_engine(db)
+    assert get_cached_engine(str(tmp_path / "." / "foo.db")) is engine
+    assert get_cached_engine(db, "bulk-load") is not engine
+    assert get_session_factory(db) is get_session_factory(db)
+    dispose_engines()
+    assert get_cached_engine(db) is not engine
+    dispose_engines()
+
+
+def test_get_session_factory_concurrent_first_use(tmp_path, monkeypatch):
+    def slow_create(*args, **kwargs):
+        time.sleep(0.01)
+        return create_sqlite_engine(*args, **kwargs)
+
+    monkeypatch.setattr(db_access, "create_sqlite_engine", slow_create)
+    db = str(tmp_path / "foo.db")
+    barrier = threading.Barrier(8)
+
+    def first_use(_):
+        barrier.wait()
+        return get_session_factory(db)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        factories = list(executor.map(first_use, range(8)))
+    assert all(factory is factories[0] for factory in factories)
+    assert factories[0].kw["bind"] is get_cached_engine(db)
+    dispose_engines()
+
+
+@pytest.fixture
+def bpl_db(tmp_path):
+    db = str(tmp_path / "bpl_db.db")
+    BplBase.metadata.create_all(create_sqlite_engine(db))
+    yield db
+    dispose_engines()
+
+
+def test_bulk_upsert_ignores_conflicts(bpl_db):
+    rows = [dict(bibNo=i, oclcNo=100 + i) for i in range(5)]
+    with session_scope(bpl_db) as session:
+        assert bulk_upsert(session, EnhancedBib, rows[:3], chunk_size=2) == (3, 0)
+    with session_scope(bpl_db) as session:
+        rows[0]["oclcNo"] = 1
+        assert bulk_upsert(session, EnhancedBib, rows, chunk_size=2) == (2, 3)
+        assert session.get(EnhancedBib, 0).oclcNo == 100
+
+
+def test_bulk_upsert_updates_conflicts(bpl_db):
+    with session_scope(bpl_db) as session:
+        bulk_upsert(session, EnhancedBib, [dict(bibNo=1, oclcNo=1)])
+    with session_scope(bpl_db) as session:
+        result = bulk_upsert(
+            session,
+            EnhancedBib,
+            [dict(bibNo=1, oclcNo=2), dict(bibNo=2, oclcNo=3)],
+            update_columns=["oclcNo"],
+        )
+        assert result == (2, 0)
+        assert session.get(EnhancedBib, 1).oclcNo == 2
+
+
+def test_bulk_delete(bpl_db):
+    with session_scope(bpl_db) as session:
+        rows = [dict(bibNo=i, oclcNo=100 + i) for i in range(10)]
+        bulk_upsert(session, EnhancedBib, rows)
+    with session_scope(bpl_db) as session:
+        assert bulk_delete(session, EnhancedBib, "oclcNo", [100, 101, 102, 999], 2) == 3
+        assert delete_instances(session, EnhancedBib, bibNo=9) == 1
+        assert session.query(EnhancedBib).count() == 6
+
+
+def test_delete_instances_expires_loaded_instances(bpl_db):
+    with session_scope(bpl_db) as session:
+        bulk_upsert(session, EnhancedBib, [dict(bibNo=1, oclcNo=2)])
+    with session_scope(bpl_db) as session:
+        bib = session.get(EnhancedBib, 1)
+        bib.isbns = "foo"
+        assert delete_instances(session, EnhancedBib, bibNo=1) == 1
+        assert session.get(EnhancedBib, 1) is None
+        assert session.query(EnhancedBib).count() == 0
+
+
+def test_delete_instances_cascades(tmp_path):
+    db = str(tmp_path / "nyp_db.db")
+    NypBase.metadata.create_all(get_nyp_engine(db))
+    with session_scope(db) as session:
+        session.add_all(
+            [
+                SierraBib(bibNo=1, title="foo", sierraOcns=[SierraBibOcns(ocn=1)]),
+                SierraBib(bibNo=2, title="bar", sierraOcns=[SierraBibOcns(ocn=2)]),
+            ]
+        )
+    with session_scope(db) as session:
+        assert delete_instances(session, SierraBib, bibNo=1) == 1
+        assert bulk_delete(session, SierraBib, "bibNo", [2, 3]) == 1
+        assert session.query(SierraBibOcns).count() == 0
+    dispose_engines()
+
+
+def test_migrate_isbns(bpl_db):
+    fields = [Field(tag="020", indicators=[" ", " "], subfields=["a", "978123"])]
+    engine = create_sqlite_engine(bpl_db)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO enhanced_bib (bibNo, oclcNo, isbns, enhanced) "
+                "VALUES (:bibNo, 1, :isbns, 0)"
+            ),
+            [
+                dict(bibNo=1, isbns=pickle.dumps(fields)),
+                dict(bibNo=2, isbns=pickle.dumps([])),
+                dict(bibNo=3, isbns="  \x1fa978456\x1e"),
+            ],
+        )
+    engine.dispose()
+
+    assert migrate_isbns(bpl_db, chunk_size=2) == 2
+    with session_scope(bpl_db) as session:
+        assert session.get(EnhancedBib, 1).isbns == "  \x1fa978123\x1e"
+        assert session.get(EnhancedBib, 2).isbns is None
+        assert session.get(EnhancedBib, 3).isbns == "  \x1fa978456\x1e"
+
+
+def test_add_indexes_to_existing_db(tmp_path):
+    db = str(tmp_path / "bpl_db.db")
+    engine = create_sqlite_engine(db)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                'CREATE TABLE enhanced_bib ("bibNo" INTEGER PRIMARY KEY, '
+                '"oclcNo" INTEGER NOT NULL, "bibFormat" VARCHAR(1), '
+                '"opacDisplay" VARCHAR(1), isbns VARCHAR, '
+                "enhanced BOOLEAN NOT NULL, enhanced_timestamp DATETIME)"
+            )
+        )
+    assert add_indexes(db) == ["ix_enhanced_bib_oclcNo", "ix_enhanced_bib_unenhanced"]
+    assert add_indexes(db) == []
+    with engine.connect() as conn:
+        plan = conn.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT * FROM enhanced_bib "
+                'WHERE enhanced = 0 AND "bibFormat" IS NOT NULL ORDER BY "bibNo"'
+            )
+        ).fetchall()
+    assert "ix_enhanced_bib_unenhanced" in plan[0][-1]
+
+
+def _match(mid, bibNo, reportId, statusId, procDate):
+    return dict(
+        mid=mid,
+        bibNo=bibNo,
+        reportId=reportId,
+        isOcnProcess=True,
+        statusId=statusId,
+        procDate=procDate,
+    )
+
+
+@pytest.fixture
+def nyp_engine(tmp_path):
+    engine = get_nyp_engine(str(tmp_path / "nyp_db.db"))
+    NypBase.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(OclcMatch),
+            [
+                _match(1, 1, 1, 3, date(2022, 8, 3)),
+                _match(2, 2, 1, 3, date(2022, 8, 3)),
+                _match(3, 1, 2, 1, date(2022, 8, 5)),
+                _match(4, "", 2, 4, date(2022, 8, 5)),
+            ],
+        )
+    yield engine
+    engine.dispose()
+
+
+def _latest(conn):
+    stmt = select(LatestOutcome.bibNo, LatestOutcome.mid).order_by(LatestOutcome.bibNo)
+    return [tuple(row) for row in conn.execute(stmt)]
+
+
+def test_build_latest_outcomes(nyp_engine):
+    with nyp_engine.begin() as conn:
+        assert build_latest_outcomes(conn) == 2
+        assert _latest(conn) == [(1, 3), (2, 2)]
+        assert find_latest_by_status(conn, "unresolved") == [2]
+
+
+def test_update_latest_outcomes_keeps_newer_outcomes(nyp_engine):
+    with nyp_engine.begin() as conn:
+        update_latest_outcomes(conn, [1])
+        update_latest_outcomes(conn, [2])
+        assert _latest(conn) == [(1, 3), (2, 2)]
+        # report ingested out of order does not replace newer outcome
+        conn.execute(insert(OclcMatch), [_match(5, 1, 3, 2, date(2022, 8, 4))])
+        update_latest_outcomes(conn, [3])
+        assert _latest(conn) == [(1, 3), (2, 2)]
+        # later submission replaces it
+        conn.execute(insert(OclcMatch), [_match(6, 2, 4, 2, date(2022, 8, 6))])
+        update_latest_outcomes(conn, [4])
+        assert _latest(conn) == [(1, 3), (2, 6)]
+        assert find_latest_by_status(conn, "create") == [2]
+
+
+def test_update_latest_outcomes_searches_reports_bibs(nyp_engine):
+    _, query = _latest_outcomes_query([2])
+    with nyp_engine.connect() as conn:
+        sql = query.compile(conn, compile_kwargs={"literal_binds": True})
+        plan = [
+            row[-1]
+            for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        ]
+    assert not any(step.startswith("SCAN oclc_match") for step in plan)
+    assert any("ix_oclc_match_reportId_bibNo (reportId=?)" in step for step in plan)
+    assert any("ix_oclc_match_bibNo_procDate (bibNo=?)" in step for step in plan)
+
+
+def test_update_latest_outcomes_builds_missing_table(nyp_engine):
+    with nyp_engine.begin() as conn:
+        LatestOutcome.__table__.drop(conn)
+        assert update_latest_outcomes(conn, [2]) == 2
+        assert _latest(conn) == [(1, 3), (2, 2)]
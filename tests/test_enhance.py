@@ -0,0 +1,162 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+from pymarc import Field, MARCReader, Record, record_to_xml
+import pytest
+import requests
+
+pytest.importorskip("bookops_marc")
+pytest.importorskip("bookops_worldcat")
+
+from bookops_worldcat.errors import WorldcatSessionError
+
+from src.bpl_datastore import Base, EnhancedBib
+from src.db_access import create_sqlite_engine, dispose_engines, session_scope
+from src.enhance import launch_bpl_enhancement
+
+
+class StubWorldcatHandler(BaseHTTPRequestHandler):
+    failing = set()
+
+    def do_GET(self):
+        ocn = self.path.rsplit("/", 1)[-1]
+        if ocn in self.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        record = Record()
+        record.add_field(
+            Field(tag="001", data=f"ocm{ocn}"),
+            Field(tag="245", indicators=["0", "0"], subfields=["a", f"Title {ocn}."]),
+        )
+        body = record_to_xml(record, namespace=True)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def worldcat_stub():
+    StubWorldcatHandler.failing = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWorldcatHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/worldcat/manage/bibs"
+
+    class StubMetadataSession(requests.Session):
+        def get_full_bib(self, oclcNo):
+            return self.get(f"{url}/{oclcNo}")
+
+    yield StubMetadataSession
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bpl_db(tmp_path):
+    db = str(tmp_path / "bpl_db.db")
+    engine = create_sqlite_engine(db)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    with session_scope(db) as session:
+        session.add_all(
+            [
+                EnhancedBib(
+                    bibNo=bibNo,
+                    oclcNo=100 + bibNo,
+                    bibFormat="a",
+                    opacDisplay="-",
+                    enhanced=False,
+                )
+                for bibNo in range(1, 7)
+            ]
+        )
+    yield db
+    dispose_engines()
+
+
+def enrich(tmp_path, db, session_factory):
+    launch_bpl_enhancement(
+        out_fh=str(tmp_path / "out" / "enriched.mrc"),
+        workers=3,
+        commit_every=3,
+        journal_fh=str(tmp_path / "out" / "checkpoint.csv"),
+        rotate_every=2,
+        cache_db=None,
+        db=db,
+        session_factory=session_factory,
+        failed_fh=str(tmp_path / "failed.csv"),
+    )
+
+
+def written_bibNos(tmp_path) -> list[list[str]]:
+    parts = []
+    for fh in sorted(os.listdir(tmp_path / "out")):
+        if fh.endswith(".mrc"):
+            with open(tmp_path / "out" / fh, "rb") as f:
+                parts.append([bib["907"]["a"] for bib in MARCReader(f)])
+    return parts
+
+
+def enhanced_bibNos(db) -> list[int]:
+    with session_scope(db) as session:
+        return [
+            bib.bibNo
+            for bib in session.query(EnhancedBib)
+            .filter(EnhancedBib.enhanced == True)
+            .order_by(EnhancedBib.bibNo)
+        ]
+
+
+def test_launch_bpl_enhancement(tmp_path, bpl_db, worldcat_stub):
+    (tmp_path / "out").mkdir()
+    enrich(tmp_path, bpl_db, worldcat_stub)
+
+    assert written_bibNos(tmp_path) == [
+        [".b1a", ".b2a"],
+        [".b3a", ".b4a"],
+        [".b5a", ".b6a"],
+    ]
+    with open(tmp_path / "out" / "enriched-001.mrc", "rb") as f:
+        bib = next(MARCReader(f))
+    assert bib["001"].data == "ocm101"
+    assert bib["949"]["a"] == "*b2=a;"
+    assert enhanced_bibNos(bpl_db) == [1, 2, 3, 4, 5, 6]
+    assert not (tmp_path / "out" / "checkpoint.csv").exists()
+
+
+def test_launch_bpl_enhancement_resumes_failed_runs(tmp_path, bpl_db, worldcat_stub):
+    (tmp_path / "out").mkdir()
+
+    # bib 4 is written but not committed when request for bib 5 fails
+    StubWorldcatHandler.failing = {"105"}
+    with pytest.raises(WorldcatSessionError):
+        enrich(tmp_path, bpl_db, worldcat_stub)
+    assert enhanced_bibNos(bpl_db) == [1, 2, 3]
+    assert written_bibNos(tmp_path) == [[".b1a", ".b2a"], [".b3a", ".b4a"]]
+
+    # bib 4 is recovered from journal, bib 5 is left uncommitted
+    StubWorldcatHandler.failing = {"106"}
+    with pytest.raises(WorldcatSessionError):
+        enrich(tmp_path, bpl_db, worldcat_stub)
+    assert enhanced_bibNos(bpl_db) == [1, 2, 3, 4]
+
+    StubWorldcatHandler.failing = set()
+    enrich(tmp_path, bpl_db, worldcat_stub)
+
+    assert written_bibNos(tmp_path) == [
+        [".b1a", ".b2a"],
+        [".b3a", ".b4a"],
+        [".b5a", ".b6a"],
+    ]
+    assert enhanced_bibNos(bpl_db) == [1, 2, 3, 4, 5, 6]
+    assert (tmp_path / "failed.csv").read_text().splitlines() == [
+        "5,105",
+        "6,106",
+    ]
@@ -0,0 +1,130 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+import requests
+
+from src.fetcher import TokenBucket, fetch_concurrently, thread_sessions
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+        if self.path.endswith("/404"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.path.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubHandler.in_flight = 0
+    StubHandler.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_token_bucket_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.2
+
+
+def test_fetch_concurrently_against_stub_server(stub_server):
+    with requests.Session() as session:
+
+        def fetch(ocn):
+            return session.get(f"{stub_server}/bib/data/{ocn}")
+
+        results = list(fetch_concurrently(fetch, range(12), workers=4))
+
+    assert [ocn for ocn, _ in results] == list(range(12))
+    assert [r.text for _, r in results] == [f"/bib/data/{i}" for i in range(12)]
+    assert 1 < StubHandler.max_in_flight <= 4
+
+
+def test_fetch_concurrently_respects_rate(stub_server):
+    with requests.Session() as session:
+
+        def fetch(ocn):
+            return session.get(f"{stub_server}/bib/data/{ocn}").status_code
+
+        start = time.monotonic()
+        results = list(fetch_concurrently(fetch, range(5), workers=5, rate=10))
+
+    assert [code for _, code in results] == [200] * 5
+    assert time.monotonic() - start >= 0.4
+
+
+def test_fetch_concurrently_reraises_and_stops(stub_server):
+    fetched = []
+
+    def fetch(ocn):
+        fetched.append(ocn)
+        response = requests.get(f"{stub_server}/bib/data/{ocn}")
+        response.raise_for_status()
+        return response
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        for _ in fetch_concurrently(fetch, [1, 404, 3, 4, 5, 6, 7, 8], workers=2):
+            pass
+    assert len(fetched) < 8
+
+
+def test_thread_sessions_one_per_thread(stub_server):
+    sessions = []
+
+    class TrackedSession(requests.Session):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    def factory():
+        session = TrackedSession()
+        sessions.append(session)
+        return session
+
+    with thread_sessions(factory) as get_session:
+
+        def fetch(ocn):
+            return id(get_session()), threading.get_ident()
+
+        results = list(fetch_concurrently(fetch, range(12), workers=3))
+        assert get_session() is get_session()
+
+    pairs = {pair for _, pair in results}
+    assert len({session for session, _ in pairs}) == len(pairs)
+    assert len(sessions) == len(pairs) + 1
+    assert all(session.closed for session in sessions)
@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from src.metrics import Histogram, Metrics, NullMetrics
+
+
+def test_histogram_percentiles():
+    h = Histogram()
+    for ms in range(1, 101):
+        h.add(ms / 1000)
+    assert h.count == 100
+    assert h.total == pytest.approx(5.05)
+    assert h.min == 0.001
+    assert h.max == 0.1
+    # bucket bounds overestimate by less than factor
+    assert 0.05 <= h.percentile(50) < 0.05 * h.factor
+    assert 0.09 <= h.percentile(90) < 0.09 * h.factor
+    assert h.percentile(100) == 0.1
+
+
+def test_histogram_empty():
+    assert Histogram().to_dict() == dict(
+        count=0, total=0.0, mean=0.0, min=0.0, p50=0.0, p90=0.0, p99=0.0, max=0.0
+    )
+
+
+def test_histogram_tiny_values():
+    h = Histogram()
+    h.add(0.0)
+    assert h.percentile(50) == 0.0
+
+
+def test_metrics_stage_and_counters():
+    metrics = Metrics("test")
+    with metrics.stage("parse"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.stage("parse"):
+            raise ValueError
+    metrics.count("rows", 10)
+    metrics.count("rows")
+    data = metrics.to_dict()
+    assert data["stages"]["parse"]["count"] == 1
+    assert data["counters"] == {"parse.errors": 1, "rows": 11}
+
+
+def test_metrics_iterate():
+    metrics = Metrics()
+    assert list(metrics.iterate("read", [1, 2, 3])) == [1, 2, 3]
+    assert metrics.histograms["read"].count == 3
+
+
+def test_null_metrics():
+    metrics = NullMetrics()
+    with metrics.stage("parse"):
+        pass
+    metrics.count("rows")
+    assert list(metrics.iterate("read", [1])) == [1]
+    assert metrics.to_dict()["stages"] == {}
+    assert metrics.to_dict()["counters"] == {}
+
+
+def test_metrics_summary_and_save(tmp_path):
+    metrics = Metrics("enrich")
+    metrics.observe("worldcat_request", 0.2)
+    metrics.observe("manipulate_bib", 0.001)
+    metrics.count("enriched")
+    summary = metrics.summary()
+    lines = summary.splitlines()
+    assert lines[0].startswith("enrich metrics")
+    assert lines[1].split() == [
+        "stage",
+        "count",
+        "total",
+        "s",
+        "mean",
+        "ms",
+        "p50",
+        "ms",
+        "p90",
+        "ms",
+        "p99",
+        "ms",
+        "max",
+        "ms",
+    ]
+    assert lines[2].split()[:2] == ["worldcat_request", "1"]
+    assert lines[-1] == "enriched: 1"
+
+    fh = tmp_path / "metrics.json"
+    metrics.save(str(fh))
+    data = json.loads(fh.read_text())
+    assert data["stages"]["worldcat_request"]["max"] == 0.2
+    assert data["counters"] == {"enriched": 1}
+
+
+def test_read_report_metrics(tmp_path):
+    from benchmarks.generators import write_report
+    from src.nyp_datastore import Base, get_engine
+    from src.nyp_ingest import read_report
+
+    db = str(tmp_path / "nyp_db.db")
+    Base.metadata.create_all(get_engine(db))
+    fh = write_report(str(tmp_path), 25)
+    metrics = Metrics("read_report")
+    read_report(fh, chunk_size=10, db=db, metrics=metrics)
+    assert metrics.histograms["read"].count == 3
+    assert metrics.histograms["parse"].count == 3
+    assert metrics.histograms["write"].count == 3
+    assert metrics.histograms["update_latest"].count == 1
+    assert metrics.counters["rows"] == 25
+
+
+def test_read_deletions_metrics(tmp_path):
+    from benchmarks.generators import write_deletions
+    from src.nyp_datastore import Base, HoldDelete, get_engine
+    from src.nyp_ingest import read_deletions
+    from sqlalchemy import func, select
+
+    db = str(tmp_path / "nyp_db.db")
+    engine = get_engine(db)
+    Base.metadata.create_all(engine)
+    fh = write_deletions(str(tmp_path), 25)
+    metrics = Metrics("read_deletions")
+    read_deletions(fh, chunk_size=10, db=db, metrics=metrics)
+    assert metrics.histograms["write"].count == 3
+    assert metrics.counters["rows"] == 25
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(HoldDelete)).scalar() == 25
@@ -0,0 +1,97 @@
+from datetime import date
+import os
+
+import pytest
+from sqlalchemy import insert
+
+from src.nyp_analytics import export_parquet, latest_outcomes, load_table, outcome_stats
+from src.nyp_datastore import (
+    Base,
+    HoldDelete,
+    OclcMatch,
+    Report,
+    SierraBib,
+    SierraBibOcns,
+    get_engine,
+)
+
+
+@pytest.fixture
+def nyp_db(tmp_path):
+    db = str(tmp_path / "nyp_db.db")
+    engine = get_engine(db)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Report), [dict(rid=1, handle="a"), dict(rid=2, handle="b")])
+        conn.execute(
+            insert(SierraBib),
+            [
+                dict(bibNo=1, title="foo", isResearch=True),
+                dict(bibNo=2, title="bar", isResearch=False),
+            ],
+        )
+        conn.execute(insert(SierraBibOcns), [dict(ocn=11, bibNo=1)])
+        conn.execute(insert(HoldDelete), [dict(ocn=11, title="foo", keep=False)])
+        d1, d2 = date(2022, 8, 3), date(2022, 8, 5)
+        conn.execute(
+            insert(OclcMatch),
+            [
+                # bib 1 unresolved first, matched on resubmission
+                dict(bibNo=1, reportId=1, isOcnProcess=True, statusId=3, procDate=d1),
+                dict(bibNo=1, reportId=2, isOcnProcess=False, statusId=1, procDate=d2),
+                dict(bibNo=2, reportId=1, isOcnProcess=True, statusId=2, procDate=d1),
+                # data errors are stored without bib number
+                dict(bibNo="", reportId=1, isOcnProcess=True, statusId=4, procDate=d1),
+                dict(bibNo="", reportId=2, isOcnProcess=False, statusId=4, procDate=d2),
+            ],
+        )
+    engine.dispose()
+    return db
+
+
+def test_export_parquet(nyp_db, tmp_path):
+    out_dir = str(tmp_path / "parquet")
+    counts = export_parquet(nyp_db, out_dir)
+    assert counts == dict(oclc_match=5, sierra_bib=2, sierra_bib_ocns=1, hold_delete=1)
+    assert sorted(os.listdir(os.path.join(out_dir, "oclc_match"))) == [
+        "procDate=2022-08-03",
+        "procDate=2022-08-05",
+    ]
+    match = load_table(out_dir, "oclc_match")
+    assert match["bibNo"].isna().sum() == 2
+    assert set(match["procDate"]) == {date(2022, 8, 3), date(2022, 8, 5)}
+
+
+def test_export_parquet_replaces_previous_export(nyp_db, tmp_path):
+    out_dir = str(tmp_path / "parquet")
+    export_parquet(nyp_db, out_dir)
+    export_parquet(nyp_db, out_dir)
+    assert len(load_table(out_dir, "oclc_match")) == 5
+
+
+def test_latest_outcomes(nyp_db, tmp_path):
+    out_dir = str(tmp_path / "parquet")
+    export_parquet(nyp_db, out_dir)
+    latest = latest_outcomes(load_table(out_dir, "oclc_match"))
+    assert sorted(latest["statusId"]) == [1, 2, 4, 4]
+
+
+@pytest.mark.parametrize(
+    "latest_only,expectation",
+    [
+        (True, dict(match=1, create=1, unresolved=0, data_error=2, processing_error=0)),
+        (
+            False,
+            dict(match=1, create=1, unresolved=1, data_error=2, processing_error=0),
+        ),
+    ],
+)
+def test_outcome_stats(nyp_db, tmp_path, latest_only, expectation):
+    out_dir = str(tmp_path / "parquet")
+    export_parquet(nyp_db, out_dir)
+    stats = outcome_stats(out_dir, latest_only)
+    assert stats["status"]["count"].to_dict() == expectation
+    assert stats["process"].loc["full", "match"] == 1
+    assert stats["process"].loc["ocn", "data_error"] == 1
+    assert stats["date"].loc[date(2022, 8, 3), "create"] == 1
+    assert stats["date"].sum().sum() == sum(expectation.values())
@@ -1,18 +1,84 @@
 from datetime import datetime, date
+import random
+
+import pandas as pd
 import pytest
+from sqlalchemy import func, select, text
 
+from benchmarks.generators import write_report
+from src.nyp_datastore import Base, OclcMatch, get_engine
 
 from src.nyp_ingest import (
     find_oclc_ids,
+    find_oclc_ids_frame,
     get_file_date,
     get_status_id,
+    ingest_reports,
     is_ocn_changed,
     is_research,
     norm_ocn,
+    norm_ocns,
     norm_title,
+    norm_titles,
     ocn_str2int,
+    ocn_strs2int,
+    parse_report_chunk,
+    parse_report_rows,
+    parse_sierra_export_chunk,
+    parse_sierra_export_rows,
 )
 
+# vectorized normalizers must return exactly what scalar ones do
+OCN_SAMPLES = [
+    "ocm00000001",
+    "ocn000000001",
+    "on0000000001",
+    "(OCoLC)1234",
+    "(WaOLN)nyp0067978",
+    "NN724068095",
+    "NYPG724068095-B",
+    "12345",
+    "",
+    "ocm",
+    "OCM 5",
+    " 12 ",
+    "\t3\n",
+    "+5",
+    "-7",
+    "1_000",
+    "3.0",
+    "0x1f",
+    "\u0661\u0662",
+    "99999999999999999999",
+    "ocnocm1",
+    "\u0130ocm1",
+]
+TITLE_SAMPLES = [
+    "Foo.",
+    "Foo /",
+    "Foo \\",
+    "Foo, Spam",
+    "Foo: spam",
+    "Foo; spam",
+    " Foo ",
+    "'Foo'",
+    '"Foo"',
+    "Foo@Foo",
+    "@Foo",
+    "",
+    "\u00c9cole, la\u00a0",
+    "Stra\u00dfe@Foo",
+    "\u0130stanbul",
+]
+
+
+def _fuzz(alphabet: str, n: int = 2000) -> list[str]:
+    rnd = random.Random(5)
+    return [
+        "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 10)))
+        for _ in range(n)
+    ]
+
 
 @pytest.mark.parametrize(
     "arg,expectation", [("1", 1), ("", None), ("NYPG724068095-B", None)]
@@ -113,3 +179,161 @@ def is_research(arg, expectation):
 )
 def test_is_ocn_changed(arg1, arg2, expectation):
     assert is_ocn_changed(arg1, arg2) == expectation
+
+
+def test_parse_report_rows():
+    reader = [
+        ["", ".b100000178", "ocm00000001", "1", "match"],
+        ["", ".b100000290", "ocm00000002", "3", "data error "],
+    ]
+    proc_date = date(2022, 8, 3)
+    rows = list(parse_report_rows(iter(reader), 5, True, proc_date))
+    assert rows == [
+        dict(
+            bibNo="10000017",
+            reportId=5,
+            isOcnProcess=True,
+            statusId=1,
+            procDate=proc_date,
+            ocn=1,
+            changedOcn=False,
+        ),
+        dict(
+            bibNo="10000029",
+            reportId=5,
+            isOcnProcess=True,
+            statusId=4,
+            procDate=proc_date,
+            ocn=3,
+            changedOcn=True,
+        ),
+    ]
+
+
+def test_parse_sierra_export_rows():
+    reader = [
+        ["b100000178", "Foo : spam /", "ocm00000001", "(OCoLC)2", "RL", ""],
+        ["b100000290", "Bar.", "", "", "BL", ""],
+    ]
+    rows = list(parse_sierra_export_rows(iter(reader)))
+    bib, ocns = rows[0]
+    assert bib == dict(bibNo="10000017", title="foo  spam", isResearch=True)
+    assert sorted(ocns, key=lambda x: x["ocn"]) == [
+        dict(ocn=1, bibNo="10000017"),
+        dict(ocn=2, bibNo="10000017"),
+    ]
+    assert rows[1] == (dict(bibNo="10000029", title="bar", isResearch=False), [])
+
+
+@pytest.mark.parametrize(
+    "values",
+    [OCN_SAMPLES, _fuzz("oOcCnNm(l)0123456789 _+-.\t\x0b\x1c\u00e9\u0661")],
+)
+def test_norm_ocns_matches_scalar(values):
+    result = norm_ocns(pd.Series(values)).tolist()
+    expectation = [norm_ocn(v) for v in values]
+    assert result == expectation
+    assert [type(v) for v in result] == [type(v) for v in expectation]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [OCN_SAMPLES, _fuzz("0123456789 _+-.\t\x0b\x1c\u00e9\u0661")],
+)
+def test_ocn_strs2int_matches_scalar(values):
+    result = ocn_strs2int(pd.Series(values)).tolist()
+    expectation = [ocn_str2int(v) for v in values]
+    assert result == expectation
+    assert [type(v) for v in result] == [type(v) for v in expectation]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [TITLE_SAMPLES, _fuzz("aB @.,:;/\\'\"\t\u00c9\u0130\u00df\u00a0")],
+)
+def test_norm_titles_matches_scalar(values):
+    result = norm_titles(pd.Series(values)).tolist()
+    assert result == [norm_title(v) for v in values]
+
+
+def test_vectorized_normalizers_keep_index():
+    values = pd.Series(["ocm1", "\u0661", "x"], index=[7, 8, 9])
+    assert norm_ocns(values).to_dict() == {7: 1, 8: 1, 9: None}
+    assert norm_titles(values).index.tolist() == [7, 8, 9]
+
+
+def test_find_oclc_ids_frame():
+    rows = [
+        [None, None, "12345", "(OCoLC)12345", None, "12345"],
+        [None, None, "ocm00000001", "(WaOLN)0067978", None, "2"],
+        [None, None, "", "", "", ""],
+        [None, None, "NYPG1342-S", "(WaOLN)0067978@(OCoLC)12345", None, "22345@n"],
+    ]
+    found = find_oclc_ids_frame(pd.DataFrame(rows))
+    result = found.groupby("row")["ocn"].apply(set).to_dict()
+    expectation = {i: find_oclc_ids(row) for i, row in enumerate(rows)}
+    assert result == {i: ocns for i, ocns in expectation.items() if ocns}
+
+
+def test_parse_report_chunk_matches_rows():
+    rows = [
+        ["", ".b100000178", "ocm00000001", "1", "match"],
+        ["", ".b100000290", "ocm00000002", "3", "data error "],
+        ["", ".b100000307", "", "", "unresolved"],
+    ]
+    proc_date = date(2022, 8, 3)
+    assert parse_report_chunk(rows, 5, False, proc_date) == list(
+        parse_report_rows(iter(rows), 5, False, proc_date)
+    )
+
+
+def test_parse_report_chunk_unknown_status():
+    with pytest.raises(KeyError):
+        parse_report_chunk([["", ".b100000178", "", "", "foo"]], 5, False, None)
+
+
+def test_parse_sierra_export_chunk_matches_rows():
+    rows = [
+        ["b100000178", "Foo : spam /", "ocm00000001", "(OCoLC)2@3", "RL", "2"],
+        ["b100000290", "Bar.", "", "", "BL", ""],
+        ["b100000307", "Baz@Spam", "(OCoLC)4", "", "RL@BL", "ocm5"],
+    ]
+    bibs, ocns = parse_sierra_export_chunk(rows)
+    expectation = list(parse_sierra_export_rows(iter(rows)))
+    assert bibs == [bib for bib, _ in expectation]
+
+    def key(ocn):
+        return ocn["bibNo"], ocn["ocn"]
+
+    assert sorted(ocns, key=key) == sorted(
+        [ocn for _, bib_ocns in expectation for ocn in bib_ocns], key=key
+    )
+
+
+@pytest.fixture
+def reports_dir(tmp_path):
+    fdir = tmp_path / "reports"
+    fdir.mkdir()
+    write_report(str(fdir), 2000, seed=1, procDate=date(2022, 8, 3))
+    write_report(str(fdir), 2000, seed=2, procDate=date(2022, 8, 4))
+    db = str(tmp_path / "nyp_db.db")
+    Base.metadata.create_all(get_engine(db))
+    return str(fdir), db
+
+
+def test_ingest_reports(reports_dir):
+    fdir, db = reports_dir
+    assert ingest_reports(fdir, workers=2, chunk_size=100, db=db) == 4000
+    with get_engine(db).connect() as conn:
+        assert (
+            conn.execute(select(func.count()).select_from(OclcMatch)).scalar() == 4000
+        )
+
+
+def test_ingest_reports_writer_failure(reports_dir):
+    fdir, db = reports_dir
+    with get_engine(db).begin() as conn:
+        conn.execute(text("DROP TABLE oclc_match"))
+    # bounded queue fills up once writer is gone, run must abort not hang
+    with pytest.raises(RuntimeError):
+        ingest_reports(fdir, workers=1, chunk_size=100, db=db)
@@ -0,0 +1,86 @@
+import csv
+
+import pytest
+from sqlalchemy import insert, select
+
+from src.nyp_datastore import Base, HoldDelete, SierraBib, SierraBibOcns, get_engine
+from src.nyp_reconcile import reconcile_deletions
+from src.title_index import build_title_index
+
+
+@pytest.fixture
+def nyp_db(tmp_path):
+    db = str(tmp_path / "nyp_db.db")
+    engine = get_engine(db)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(SierraBib),
+            [
+                dict(bibNo=1, title="foo", isResearch=True),
+                dict(bibNo=2, title="bar", isResearch=False),
+                dict(bibNo=3, title="baz", isResearch=True),
+                dict(bibNo=4, title="", isResearch=True),
+            ],
+        )
+        conn.execute(
+            insert(SierraBibOcns),
+            [dict(ocn=11, bibNo=1), dict(ocn=12, bibNo=2), dict(ocn=13, bibNo=3)],
+        )
+        conn.execute(
+            insert(HoldDelete),
+            [
+                # OCN of a research bib
+                dict(ocn=11, title="foo", keep=False),
+                # OCN of a branch bib
+                dict(ocn=12, title="bar", keep=False),
+                # no shared OCN, title of a research bib
+                dict(ocn=14, title="baz", keep=False),
+                # no shared OCN, title of a branch bib
+                dict(ocn=15, title="bar", keep=False),
+                # empty titles never match
+                dict(ocn=16, title="", keep=False),
+            ],
+        )
+    engine.dispose()
+    return db
+
+
+def test_reconcile_deletions(nyp_db, tmp_path):
+    review_fh = str(tmp_path / "review.csv")
+    result = reconcile_deletions(nyp_db, review_fh)
+
+    assert result == dict(ocn_matches=1, title_matches=1, kept=1)
+    with open(review_fh) as f:
+        assert list(csv.reader(f)) == [
+            ["ocn", "title", "bibNo", "score"],
+            ["14", "baz", "3", "1.0"],
+        ]
+    engine = get_engine(nyp_db)
+    with engine.connect() as conn:
+        kept = conn.execute(select(HoldDelete.ocn).where(HoldDelete.keep)).scalars()
+        assert kept.all() == [11]
+    engine.dispose()
+
+
+def test_reconcile_deletions_is_repeatable(nyp_db, tmp_path):
+    review_fh = str(tmp_path / "review.csv")
+    reconcile_deletions(nyp_db, review_fh)
+    result = reconcile_deletions(nyp_db, review_fh)
+
+    assert result == dict(ocn_matches=0, title_matches=1, kept=1)
+    with open(review_fh) as f:
+        assert len(f.readlines()) == 2
+
+
+def test_reconcile_deletions_with_title_index(nyp_db, tmp_path):
+    build_title_index(nyp_db)
+    review_fh = str(tmp_path / "review.csv")
+    result = reconcile_deletions(nyp_db, review_fh, min_score=0.5)
+
+    # branch bib with title "bar" is never a candidate
+    assert result == dict(ocn_matches=1, title_matches=1, kept=1)
+    with open(review_fh) as f:
+        rows = list(csv.reader(f))
+    assert [row[:3] for row in rows[1:]] == [["14", "baz", "3"]]
+    assert float(rows[1][3]) == pytest.approx(1.0)
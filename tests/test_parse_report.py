@@ -0,0 +1,113 @@
+import csv
+
+import pytest
+
+from src.parse_report import (
+    Rule,
+    detect_report_type,
+    find_509_error,
+    scan_reports,
+    triage_report,
+)
+
+
+def read_csv(fh) -> list[list[str]]:
+    with open(fh, "r") as f:
+        return list(csv.reader(f))
+
+
+def test_triage_report_single_pass(tmp_path):
+    report = tmp_path / "report.txt"
+    report.write_text(
+        "1|.b100000178|ocm1|ocm1|match\n"
+        "2|.b100000290|ocm2|ocm3|Invalid tag 509.\n"
+        "3|.b100000307|ocm4|ocm4|Invalid code in Modified Record (008/38).\n"
+        "4|.b100000319|ocm5|ocm5|create\n"
+    )
+    counts = triage_report(
+        str(report),
+        str(tmp_path),
+        categories=[
+            "created",
+            "invalid_oclc_no",
+            "509_error",
+            "008_38_error",
+            "changed_oclc_no",
+        ],
+        extra_rules=[
+            Rule("matched", lambda row: row[-1] == "match", str(tmp_path / "m.csv"))
+        ],
+    )
+
+    assert counts == {
+        "created": 1,
+        "invalid_oclc_no": 0,
+        "509_error": 1,
+        "008_38_error": 1,
+        "changed_oclc_no": 1,
+        "matched": 1,
+    }
+    assert read_csv(tmp_path / "509_error.csv") == [[".b100000290"]]
+    assert read_csv(tmp_path / "008_38_error.csv") == [[".b100000307"]]
+    assert read_csv(tmp_path / "changed_oclc_no.csv") == [
+        ["b100000290", "ocm2", "ocm3"]
+    ]
+    assert read_csv(tmp_path / "created.csv") == [
+        ["4", ".b100000319", "ocm5", "ocm5", "create"]
+    ]
+    assert read_csv(tmp_path / "m.csv") == [
+        ["1", ".b100000178", "ocm1", "ocm1", "match"]
+    ]
+
+
+@pytest.mark.parametrize(
+    "name,content,report_type,expectation",
+    [
+        (
+            "NYP.BibProcessingReport.txt",
+            "1|.b100000178|ocm1|ocm1|match\n2|.b100000290|ocm2|ocm3|create\n",
+            "processing",
+            {"created": 1, "changed_oclc_no": 1},
+        ),
+        (
+            "FullMatch.WL.mrc.BibExceptionReport.txt",
+            "1|.b100000290|Invalid tag 509.\n"
+            "2|.b100000307|Invalid code in Modified Record (008/38).\n",
+            "exception",
+            {"509_error": 1, "008_38_error": 1},
+        ),
+        (
+            "FullMatch.efc.enhance.csv",
+            "0,,create\n1,ocm1,match\n2,ocm2,create\n",
+            "enhance",
+            {"created": 2, "invalid_oclc_no": 1},
+        ),
+    ],
+)
+def test_triage_report_default_categories(
+    tmp_path, name, content, report_type, expectation
+):
+    report = tmp_path / name
+    report.write_text(content)
+    assert detect_report_type(str(report)) == report_type
+    assert triage_report(str(report), str(tmp_path)) == expectation
+
+
+def test_scan_reports_multiple_files(tmp_path):
+    for n in range(2):
+        (tmp_path / f"r{n}.csv").write_text(f"{n},,create\n{n},ocm1,match\n")
+    out = tmp_path / "out.csv"
+    counts = scan_reports(
+        [str(tmp_path / "r0.csv"), str(tmp_path / "r1.csv")],
+        [Rule("invalid", lambda row: row[1] == "", str(out))],
+    )
+    assert counts == {"invalid": 2}
+    assert read_csv(out) == [["0", "", "create"], ["1", "", "create"]]
+
+
+def test_find_509_error(tmp_path):
+    report = tmp_path / "report.txt"
+    report.write_text("1|.b100000290|Invalid tag 509.\n2|.b100000307|foo\n")
+    out = tmp_path / "out.csv"
+    find_509_error(str(report), str(out))
+    assert read_csv(out) == [[".b100000290"]]
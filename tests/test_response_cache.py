@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from src.db_access import dispose_engines
+from src.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    yield ResponseCache(str(tmp_path / "cache.db"), ttl=60, max_entries=3)
+    dispose_engines()
+
+
+def test_get_miss_and_hit(cache):
+    assert cache.get("worldcat", "1") is None
+    cache.set("worldcat", "1", b"<record/>")
+    assert cache.get("worldcat", "1") == b"<record/>"
+    assert cache.get("solr", "1") is None
+    assert cache.stats() == dict(hits=1, misses=2, expired=0, evicted=0, hit_rate=1 / 3)
+
+
+def test_get_expired(cache):
+    cache.set("worldcat", "1", b"<record/>")
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get("worldcat", "1") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_cached_fetches_only_on_miss(cache):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return b"payload"
+
+    assert cache.cached("worldcat", "1", fetch) == b"payload"
+    assert cache.cached("worldcat", "1", fetch) == b"payload"
+    assert len(calls) == 1
+
+
+def test_cached_does_not_store_failures(cache):
+    assert cache.cached("worldcat", "1", lambda: None) is None
+    assert cache.cached("worldcat", "1", lambda: b"ok") == b"ok"
+
+
+def test_evict_least_recently_used(cache):
+    for key in ["1", "2", "3", "4"]:
+        cache.set("worldcat", key, key.encode())
+        time.sleep(0.01)
+    cache.get("worldcat", "1")
+
+    assert cache.evict() == 1
+    assert cache.get("worldcat", "2") is None
+    assert cache.get("worldcat", "1") == b"1"
+    assert cache.get("worldcat", "4") == b"4"
+
+
+def test_summary(cache):
+    cache.get("worldcat", "1")
+    assert cache.summary() == (
+        "Cache: 0 hits, 1 misses (0.0% hit rate), 0 expired, 0 evicted."
+    )
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import insert
+
+from src.nyp_datastore import Base, SierraBib, get_engine
+from src.title_index import TitleIndex, build_title_index, tokenize
+
+
+@pytest.fixture
+def nyp_db(tmp_path):
+    db = str(tmp_path / "nyp_db.db")
+    engine = get_engine(db)
+    Base.metadata.create_all(engine)
+    titles = [
+        "the great gatsby",
+        "the great war",
+        "gatsby",
+        "history of the war",
+        "the history of new york",
+        "the sea",
+    ]
+    with engine.begin() as conn:
+        conn.execute(
+            insert(SierraBib),
+            [dict(bibNo=i, title=t) for i, t in enumerate(titles, start=1)],
+        )
+    engine.dispose()
+    return db
+
+
+@pytest.mark.parametrize(
+    "arg,expectation",
+    [("", set()), ("foo", {"foo"}), (" the  war the ", {"the", "war"})],
+)
+def test_tokenize(arg, expectation):
+    assert tokenize(arg) == expectation
+
+
+def test_build_title_index(nyp_db):
+    assert build_title_index(nyp_db, chunk_size=4) == 6
+    # rebuilding replaces previous index
+    assert build_title_index(nyp_db) == 6
+
+
+def test_candidates_ranked(nyp_db):
+    build_title_index(nyp_db, chunk_size=4)
+    index = TitleIndex(nyp_db, max_df=0.5)
+
+    candidates = index.candidates("the great gatsby")
+    assert [bibNo for bibNo, _ in candidates] == [1, 3, 2]
+    assert candidates[0][1] == pytest.approx(1.0, abs=0.05)
+    assert candidates[0][1] > candidates[1][1] > candidates[2][1]
+
+
+def test_candidates_min_score_and_limit(nyp_db):
+    build_title_index(nyp_db)
+    index = TitleIndex(nyp_db, max_df=0.5)
+
+    assert [b for b, _ in index.candidates("the great gatsby", limit=1)] == [1]
+    assert [b for b, _ in index.candidates("the great gatsby", min_score=0.9)] == [1]
+
+
+@pytest.mark.parametrize("arg", ["", "the", "unknown words"])
+def test_candidates_none_found(nyp_db, arg):
+    build_title_index(nyp_db)
+    index = TitleIndex(nyp_db, max_df=0.5)
+    assert index.candidates(arg) == []
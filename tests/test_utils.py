@@ -0,0 +1,147 @@
+import gzip
+import os
+
+from pymarc import Field, MARCReader, Record
+
+from src.utils import CsvWriter, MarcWriter, fields2str, save2csv, str2fields
+
+
+def make_record(n: int) -> Record:
+    record = Record()
+    record.add_field(Field(tag="001", data=f"ocm{n:08d}"))
+    return record
+
+
+def read_control_nos(fh: str) -> list[str]:
+    with open(fh, "rb") as f:
+        return [r["001"].data for r in MARCReader(f)]
+
+
+def test_marc_writer_single_file(tmp_path):
+    fh = str(tmp_path / "out.mrc")
+    with MarcWriter(fh) as writer:
+        for n in range(3):
+            writer.write(make_record(n))
+        assert writer.fh == fh
+        assert writer.tell() > 0
+    assert read_control_nos(fh) == ["ocm00000000", "ocm00000001", "ocm00000002"]
+
+
+def test_marc_writer_appends(tmp_path):
+    fh = str(tmp_path / "out.mrc")
+    with MarcWriter(fh) as writer:
+        writer.write(make_record(1))
+    with MarcWriter(fh) as writer:
+        writer.write(make_record(2))
+    assert read_control_nos(fh) == ["ocm00000001", "ocm00000002"]
+
+
+def test_marc_writer_flush_every(tmp_path):
+    fh = str(tmp_path / "out.mrc")
+    with MarcWriter(fh, flush_every=2) as writer:
+        writer.write(make_record(1))
+        assert os.path.getsize(fh) == 0
+        writer.write(make_record(2))
+        assert os.path.getsize(fh) == writer.tell()
+
+
+def test_marc_writer_checkpoint(tmp_path):
+    fh = str(tmp_path / "out.mrc")
+    with MarcWriter(fh) as writer:
+        writer.write(make_record(1))
+        writer.checkpoint()
+        assert os.path.getsize(fh) == writer.tell()
+
+
+def test_marc_writer_rotation(tmp_path):
+    fh = str(tmp_path / "out.mrc")
+    with MarcWriter(fh, rotate_every=2) as writer:
+        assert writer.next_fh == str(tmp_path / "out-001.mrc")
+        for n in range(5):
+            writer.write(make_record(n))
+        assert writer.fh == str(tmp_path / "out-003.mrc")
+    assert read_control_nos(str(tmp_path / "out-001.mrc")) == [
+        "ocm00000000",
+        "ocm00000001",
+    ]
+    assert read_control_nos(str(tmp_path / "out-002.mrc")) == [
+        "ocm00000002",
+        "ocm00000003",
+    ]
+    assert read_control_nos(str(tmp_path / "out-003.mrc")) == ["ocm00000004"]
+    assert not os.path.exists(fh)
+
+
+def test_marc_writer_rotation_continues_existing_parts(tmp_path):
+    fh = str(tmp_path / "out.mrc")
+    with MarcWriter(fh, rotate_every=2) as writer:
+        for n in range(3):
+            writer.write(make_record(n))
+    # resumed run fills the last part and starts a new one
+    with MarcWriter(fh, rotate_every=2) as writer:
+        assert writer.next_fh == str(tmp_path / "out-002.mrc")
+        for n in range(3, 6):
+            writer.write(make_record(n))
+    assert read_control_nos(str(tmp_path / "out-002.mrc")) == [
+        "ocm00000002",
+        "ocm00000003",
+    ]
+    assert read_control_nos(str(tmp_path / "out-003.mrc")) == [
+        "ocm00000004",
+        "ocm00000005",
+    ]
+    with MarcWriter(fh, rotate_every=2) as writer:
+        assert writer.next_fh == str(tmp_path / "out-004.mrc")
+
+
+def test_csv_writer_matches_save2csv(tmp_path):
+    rows = [["1", "foo, bar"], [None, '"spam"'], [3]]
+    expected_fh = str(tmp_path / "expected.csv")
+    for row in rows:
+        save2csv(expected_fh, row)
+
+    fh = str(tmp_path / "out.csv")
+    with CsvWriter(fh) as out:
+        for row in rows:
+            out.writerow(row)
+
+    with open(fh, "r") as a, open(expected_fh, "r") as b:
+        assert a.read() == b.read()
+    assert out.written == 3
+
+
+def test_csv_writer_flush_every(tmp_path):
+    fh = str(tmp_path / "out.csv")
+    with CsvWriter(fh, flush_every=2) as out:
+        out.writerow(["1"])
+        assert os.path.getsize(fh) == 0
+        out.writerow(["2"])
+        assert os.path.getsize(fh) > 0
+
+
+def test_csv_writer_gzip(tmp_path):
+    fh = str(tmp_path / "out.csv.gz")
+    with CsvWriter(fh) as out:
+        out.writerow(["1", "foo"])
+    with CsvWriter(fh) as out:
+        out.writerow(["2", "bar"])
+    with gzip.open(fh, "rt", encoding="utf-8") as f:
+        assert f.read() == "1,foo\n2,bar\n"
+
+
+def test_fields2str_roundtrip():
+    fields = [
+        Field(tag="020", indicators=[" ", " "], subfields=["a", "9781234567890"]),
+        Field(tag="020", indicators=["1", " "], subfields=["z", "123", "q", "pbk"]),
+    ]
+    value = fields2str(fields)
+    assert value == "  \x1fa9781234567890\x1e1 \x1fz123\x1fqpbk\x1e"
+    result = str2fields(value)
+    assert [f.as_marc("utf-8") for f in result] == [f.as_marc("utf-8") for f in fields]
+    assert [f.tag for f in result] == ["020", "020"]
+
+
+def test_fields2str_empty():
+    assert fields2str([]) is None
+    assert str2fields(None) == []
+    assert str2fields("") == []